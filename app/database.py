@@ -5,6 +5,10 @@ from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 
+from app.metrics import InstrumentedAsyncQueuePool, install_pool_metrics
+from app.request_context import install_db_stats
+from app.slow_queries import install_slow_query_log
+
 load_dotenv()
 
 DATABASE_URL: Any = os.getenv("DATABASE")
@@ -16,9 +20,16 @@ engine = create_async_engine(
     echo=DEBUG,
     future=True,
     pool_pre_ping=True,
+    poolclass=InstrumentedAsyncQueuePool,
     pool_size=10,  # ✅ Настроен connection pool
     max_overflow=20,
 )
+# число запросов и время в БД для журнала запросов
+install_db_stats(engine)
+# гейджи пула и время ожидания соединения для /metrics
+install_pool_metrics(engine)
+# медленные запросы — в db.log и /logs/slow-queries, с планом
+install_slow_query_log(engine)
 async_session = async_sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -0,0 +1,333 @@
+"""
+Локальный стенд Яндекс Доставки (B2B platform) для нагрузочных тестов и офлайн-бенчмарков.
+
+Умеет отвечать на те же эндпоинты, что дергает YandexDeliveryClient:
+offers/create, offers/confirm, request/info, request/history, pricing-calculator.
+
+Два режима запуска:
+  - в процессе:   YandexDeliveryClient(transport=FakeYandexDelivery().transport())
+                  или YANDEX_DELIVERY_FAKE=1 (см. app.delivery.yandex.use_transport)
+  - отдельно:     uvicorn --factory app.delivery.fake_yandex:create_app --port 8081
+                  и YANDEX_DELIVERY_BASE_URL=http://localhost:8081
+
+Настройки через env (FakeYandexDelivery.from_env):
+  FAKE_YANDEX_LATENCY       — распределение задержки, мс: "fixed:50", "uniform:20,80",
+                              "normal:60,15", "lognormal:4,0.5" (по умолчанию "fixed:0")
+  FAKE_YANDEX_ERROR_RATE    — доля ответов 500 (0..1)
+  FAKE_YANDEX_CAPTCHA_RATE  — доля ответов 403 со страницей SmartCaptcha (0..1)
+  FAKE_YANDEX_NO_OFFERS_RATE — доля offers/create с пустым списком офферов (0..1)
+  FAKE_YANDEX_REPLAY        — путь к .jsonl с записанными ответами (см. RecordingTransport)
+  FAKE_YANDEX_SEED          — seed генератора, чтобы прогоны были воспроизводимы
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+PLATFORM_PREFIX = "/api/b2b/platform"
+ENDPOINTS = (
+    "/offers/create",
+    "/offers/confirm",
+    "/request/info",
+    "/request/history",
+    "/pricing-calculator",
+)
+
+CAPTCHA_HTML = (
+    "<!DOCTYPE html><html><head><title>Ой!</title></head>"
+    "<body><div class=\"CheckboxCaptcha\">SmartCaptcha: подтвердите, что запросы отправляли вы, а не робот</div>"
+    "</body></html>"
+)
+
+
+def parse_latency(spec: Optional[str]) -> Callable[[random.Random], float]:
+    """
+    Разбирает описание распределения задержки (в мс) и возвращает семплер в секундах.
+    Формат: "<kind>:<a>[,<b>]", kind ∈ fixed | uniform | normal | lognormal.
+    """
+    if not spec:
+        return lambda rnd: 0.0
+
+    kind, _, raw = spec.partition(":")
+    kind = kind.strip().lower()
+    try:
+        args = [float(x) for x in raw.split(",") if x.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid latency spec '{spec}'")
+
+    if kind == "fixed" and len(args) == 1:
+        ms = args[0]
+        return lambda rnd: max(ms, 0.0) / 1000
+    if kind == "uniform" and len(args) == 2:
+        lo, hi = args
+        return lambda rnd: max(rnd.uniform(lo, hi), 0.0) / 1000
+    if kind == "normal" and len(args) == 2:
+        mu, sigma = args
+        return lambda rnd: max(rnd.gauss(mu, sigma), 0.0) / 1000
+    if kind == "lognormal" and len(args) == 2:
+        mu, sigma = args
+        return lambda rnd: rnd.lognormvariate(mu, sigma) / 1000
+
+    raise ValueError(f"Invalid latency spec '{spec}'")
+
+
+def _rate(name: str) -> float:
+    return float(os.getenv(name, "0") or 0)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class FakeYandexDelivery:
+    """
+    Фейк B2B-платформы Яндекс Доставки.
+
+    Хранит созданные заявки в памяти, чтобы request/info и request/history
+    отвечали консистентно с offers/confirm. Записанные ответы (replay) имеют
+    приоритет над синтетическими: для эндпоинта они отдаются по кругу.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: Optional[str] = None,
+        error_rate: float = 0.0,
+        captcha_rate: float = 0.0,
+        no_offers_rate: float = 0.0,
+        replay_path: Optional[str] = None,
+        seed: Optional[int] = None,
+        price_kop: int = 35000,
+    ):
+        self._sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.captcha_rate = captcha_rate
+        self.no_offers_rate = no_offers_rate
+        self.price_kop = price_kop
+        self._rnd = random.Random(seed)
+
+        self.offers: Dict[str, dict] = {}
+        self.requests: Dict[str, dict] = {}
+        self.calls: Dict[str, int] = {ep: 0 for ep in ENDPOINTS}
+
+        self._replay: Dict[str, List[Tuple[int, Any]]] = {}
+        self._replay_pos: Dict[str, int] = {}
+        if replay_path:
+            self.load_replay(replay_path)
+
+    @classmethod
+    def from_env(cls) -> "FakeYandexDelivery":
+        seed = os.getenv("FAKE_YANDEX_SEED")
+        return cls(
+            latency=os.getenv("FAKE_YANDEX_LATENCY"),
+            error_rate=_rate("FAKE_YANDEX_ERROR_RATE"),
+            captcha_rate=_rate("FAKE_YANDEX_CAPTCHA_RATE"),
+            no_offers_rate=_rate("FAKE_YANDEX_NO_OFFERS_RATE"),
+            replay_path=os.getenv("FAKE_YANDEX_REPLAY"),
+            seed=int(seed) if seed else None,
+        )
+
+    # ---------- replay ----------
+
+    def load_replay(self, path: str) -> None:
+        """Загрузить ответы, записанные RecordingTransport (по одному JSON на строку)."""
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                endpoint = rec["endpoint"]
+                if endpoint.startswith(PLATFORM_PREFIX):
+                    endpoint = endpoint[len(PLATFORM_PREFIX):]
+                self._replay.setdefault(endpoint, []).append((int(rec["status"]), rec["body"]))
+
+    def _next_replay(self, endpoint: str) -> Optional[Tuple[int, Any]]:
+        recorded = self._replay.get(endpoint)
+        if not recorded:
+            return None
+        pos = self._replay_pos.get(endpoint, 0)
+        self._replay_pos[endpoint] = pos + 1
+        return recorded[pos % len(recorded)]
+
+    # ---------- синтетические ответы ----------
+
+    def _offers_create(self, payload: dict) -> Tuple[int, Any]:
+        if self._rnd.random() < self.no_offers_rate:
+            return 200, {"offers": []}
+
+        items = payload.get("items") or []
+        weight_g = sum((it.get("physical_dims") or {}).get("weight_gross", 0) for it in items)
+        # немного «реалистичности»: тяжелее — дороже
+        total = self.price_kop + int(math.ceil(weight_g / 1000)) * 5000
+        offer_id = uuid.uuid4().hex
+        self.offers[offer_id] = {"total": total, "payload": payload}
+        return 200, {
+            "offers": [{
+                "offer_id": offer_id,
+                "expires_at": _now_iso(),
+                "offer_details": {
+                    "pricing": f"{total / 100:.2f} RUB",
+                    "pricing_total": f"{total / 100:.2f} RUB",
+                },
+                "price": {"total": str(total)},
+            }]
+        }
+
+    def _offers_confirm(self, payload: dict) -> Tuple[int, Any]:
+        offer_id = payload.get("offer_id")
+        # офферы из replay мы не выдавали сами — их подтверждаем без проверки
+        if offer_id not in self.offers and not self._replay.get("/offers/create"):
+            return 404, {"code": "offer_not_found", "message": f"Offer {offer_id} not found"}
+        self.offers.pop(offer_id, None)
+        request_id = uuid.uuid4().hex
+        self.requests[request_id] = {
+            "offer_id": offer_id,
+            "history": [{"status": "CREATED", "timestamp": _now_iso()}],
+        }
+        return 200, {"request_id": request_id}
+
+    def _request_info(self, params: dict) -> Tuple[int, Any]:
+        request_id = params.get("request_id")
+        req = self.requests.get(request_id)
+        if not req:
+            return 404, {"code": "not_found", "message": f"Request {request_id} not found"}
+        state = req["history"][-1]
+        return 200, {"request_id": request_id, "status": state["status"], "state": state}
+
+    def _request_history(self, params: dict) -> Tuple[int, Any]:
+        request_id = params.get("request_id")
+        req = self.requests.get(request_id)
+        if not req:
+            return 404, {"code": "not_found", "message": f"Request {request_id} not found"}
+        return 200, {"state_history": list(req["history"])}
+
+    def _pricing_calculator(self, payload: dict) -> Tuple[int, Any]:
+        return 200, {"pricing_total": f"{self.price_kop / 100:.2f} RUB", "delivery_days": 2}
+
+    # ---------- ядро ----------
+
+    async def respond(self, method: str, path: str, params: dict, payload: dict) -> Tuple[int, Any]:
+        """
+        Общая точка для MockTransport и ASGI-приложения.
+        Возвращает (status, body), где body — dict (JSON) либо str (HTML-капча).
+        """
+        endpoint = path[len(PLATFORM_PREFIX):] if path.startswith(PLATFORM_PREFIX) else path
+        if endpoint not in self.calls:
+            return 404, {"code": "not_found", "message": f"Unknown endpoint {path}"}
+        self.calls[endpoint] += 1
+
+        delay = self._sample_latency(self._rnd)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        roll = self._rnd.random()
+        if roll < self.captcha_rate:
+            return 403, CAPTCHA_HTML
+        if roll < self.captcha_rate + self.error_rate:
+            return 500, {"code": "internal_error", "message": "Injected failure"}
+
+        recorded = self._next_replay(endpoint)
+        if recorded is not None:
+            return recorded
+
+        handlers = {
+            "/offers/create": self._offers_create,
+            "/offers/confirm": self._offers_confirm,
+            "/request/info": self._request_info,
+            "/request/history": self._request_history,
+            "/pricing-calculator": self._pricing_calculator,
+        }
+        return handlers[endpoint](params if method == "GET" else payload)
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        payload: dict = {}
+        if request.content:
+            try:
+                payload = json.loads(request.content)
+            except ValueError:
+                return httpx.Response(400, json={"code": "bad_request", "message": "Invalid JSON"})
+        status, body = await self.respond(
+            request.method, request.url.path, dict(request.url.params), payload
+        )
+        if isinstance(body, str):
+            return httpx.Response(status, text=body, headers={"Content-Type": "text/html"})
+        return httpx.Response(status, json=body)
+
+    def transport(self) -> httpx.MockTransport:
+        """Транспорт для httpx.AsyncClient / YandexDeliveryClient(transport=...)."""
+        return httpx.MockTransport(self._handle)
+
+    def asgi_app(self):
+        """Маленькое ASGI-приложение с тем же поведением (для запуска через uvicorn)."""
+        from starlette.applications import Starlette
+        from starlette.requests import Request
+        from starlette.responses import HTMLResponse, JSONResponse
+        from starlette.routing import Route
+
+        async def endpoint(request: Request):
+            raw = await request.body()
+            try:
+                payload = json.loads(raw) if raw else {}
+            except ValueError:
+                return JSONResponse({"code": "bad_request", "message": "Invalid JSON"}, status_code=400)
+            status, body = await self.respond(
+                request.method, request.url.path, dict(request.query_params), payload
+            )
+            if isinstance(body, str):
+                return HTMLResponse(body, status_code=status)
+            return JSONResponse(body, status_code=status)
+
+        return Starlette(routes=[
+            Route(f"{PLATFORM_PREFIX}{ep}", endpoint=endpoint, methods=["GET", "POST"])
+            for ep in ENDPOINTS
+        ])
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    Обёртка над реальным транспортом: пишет ответы Яндекса в .jsonl,
+    который потом можно отдать FakeYandexDelivery(replay_path=...).
+    """
+
+    def __init__(self, path: str, inner: Optional[httpx.AsyncBaseTransport] = None):
+        self.path = path
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self.inner.handle_async_request(request)
+        raw = await response.aread()
+        try:
+            body: Any = json.loads(raw)
+        except ValueError:
+            body = raw.decode("utf-8", errors="replace")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(
+                {"endpoint": request.url.path, "status": response.status_code, "body": body},
+                ensure_ascii=False,
+            ) + "\n")
+        # тело уже раскодировано — заголовки о сжатии/длине больше не верны
+        headers = [
+            (k, v) for k, v in response.headers.items()
+            if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        ]
+        return httpx.Response(response.status_code, headers=headers, content=raw)
+
+    async def aclose(self) -> None:
+        # YandexDeliveryClient закрывает AsyncClient после каждого запроса —
+        # внутренний пул живёт, пока жив сам RecordingTransport.
+        pass
+
+
+def create_app():
+    """
+    Фабрика для uvicorn --factory: env и файл реплея читаются при запуске сервера,
+    а не при импорте модуля (его импортируют тесты и use_transport).
+    """
+    return FakeYandexDelivery.from_env().asgi_app()
@@ -2,6 +2,7 @@ import os
 import httpx
 from typing import Optional, List, Any, Dict
 from app.logging_config import app_logger
+from app.metrics import track_outbound
 
 class YandexDeliveryError(Exception):
     def __init__(self, message: str, code: Optional[str] = None, response_text: Optional[str] = None):
@@ -9,13 +10,36 @@ class YandexDeliveryError(Exception):
         self.code = code
         self.response_text = response_text
 
+_default_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+def use_transport(transport: Optional[httpx.AsyncBaseTransport]) -> None:
+    """
+    Подменить транспорт для всех новых YandexDeliveryClient (например, на
+    FakeYandexDelivery.transport() для офлайн-бенчмарков). None — вернуть сеть.
+    """
+    global _default_transport
+    _default_transport = transport
+
+
+def _env_transport() -> Optional[httpx.AsyncBaseTransport]:
+    """YANDEX_DELIVERY_FAKE=1 — ходим в встроенный стенд вместо Яндекса."""
+    global _default_transport
+    if _default_transport is None and os.getenv("YANDEX_DELIVERY_FAKE", "").lower() in ("1", "true", "yes"):
+        from app.delivery.fake_yandex import FakeYandexDelivery
+        _default_transport = FakeYandexDelivery.from_env().transport()
+    return _default_transport
+
+
 class YandexDeliveryClient:
     def __init__(
         self, 
         token: Optional[str] = None, 
         cabinet_id: Optional[str] = None, 
-        base_url: Optional[str] = None
+        base_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
     ):
+        self.transport = transport or _env_transport()
         self.token = token or os.getenv("YANDEX_DELIVERY_TOKEN")
         self.cabinet_id = cabinet_id or os.getenv("YANDEX_DELIVERY_CABINET_ID")
         self.base_url = (base_url or os.getenv("YANDEX_DELIVERY_BASE_URL", "https://b2b-authproxy.taxi.yandex.net")).rstrip('/')
@@ -56,28 +80,32 @@ class YandexDeliveryClient:
         return data
 
     async def _post(self, endpoint: str, data: dict) -> dict:
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(transport=self.transport) as client:
             try:
-                response = await client.post(
-                    f"{self.base_url.rstrip('/')}{endpoint}",
-                    json=data,
-                    headers=self.headers,
-                    timeout=30.0
-                )
+                with track_outbound("yandex_delivery", endpoint) as call:
+                    response = await client.post(
+                        f"{self.base_url.rstrip('/')}{endpoint}",
+                        json=data,
+                        headers=self.headers,
+                        timeout=30.0
+                    )
+                    call.status(response.status_code)
                 return await self._handle_response(response)
             except httpx.RequestError as exc:
                 app_logger.error(f"Network error while requesting Yandex: {str(exc)}")
                 raise
 
     async def _get(self, endpoint: str, params: Optional[dict] = None) -> dict:
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(transport=self.transport) as client:
             try:
-                response = await client.get(
-                    f"{self.base_url.rstrip('/')}{endpoint}",
-                    params=params,
-                    headers=self.headers,
-                    timeout=30.0
-                )
+                with track_outbound("yandex_delivery", endpoint) as call:
+                    response = await client.get(
+                        f"{self.base_url.rstrip('/')}{endpoint}",
+                        params=params,
+                        headers=self.headers,
+                        timeout=30.0
+                    )
+                    call.status(response.status_code)
                 return await self._handle_response(response)
             except httpx.RequestError as exc:
                 app_logger.error(f"Network error while requesting Yandex: {str(exc)}")
@@ -0,0 +1,273 @@
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Date, cast, delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_session
+from app.logging_config import app_logger
+from app.models.models import Order, OrderItem, Product, SalesDaily, SalesDayTotal
+
+# Заказы в этих статусах не считаются выручкой
+NON_REVENUE_STATUSES = {"cancelled", "refunded"}
+
+# ключ pg advisory lock, чтобы ночной пересчёт не шёл в нескольких воркерах сразу
+ROLLUP_REPAIR_LOCK_KEY = 72_029_001
+# запись в роллапы: инкременты берут его в shared-режиме, пересчёт — эксклюзивно,
+# чтобы дельта заказа не потерялась между DELETE и INSERT пересчёта
+ROLLUP_WRITE_LOCK_KEY = 72_029_002
+
+
+class SalesSnapshot(NamedTuple):
+    """Вклад одного заказа в роллапы: products = {product_id: (revenue, quantity, size, color)}."""
+    day: Optional[date]
+    counted: bool
+    delivery: int
+    products: Dict[int, Tuple[int, int, Optional[str], Optional[str]]]
+
+
+EMPTY_SNAPSHOT = SalesSnapshot(None, False, 0, {})
+
+
+def sales_snapshot(
+    created_at: datetime,
+    status: str,
+    delivery_cost: Optional[int],
+    lines: Iterable[Tuple[Product, int, Optional[int]]],
+) -> SalesSnapshot:
+    """lines: (product, quantity, amount) по каждой позиции."""
+    products: Dict[int, Tuple[int, int, Optional[str], Optional[str]]] = {}
+    for product, qty, amount in lines:
+        rev, q, _, _ = products.get(product.id, (0, 0, None, None))
+        products[product.id] = (rev + (amount or 0), q + qty, product.size, product.color)
+    return SalesSnapshot(
+        day=created_at.date(),
+        counted=status not in NON_REVENUE_STATUSES,
+        delivery=delivery_cost or 0,
+        products=products,
+    )
+
+
+def order_sales_snapshot(order: Order) -> SalesSnapshot:
+    """Снимок по уже загруженному заказу (order.items с product должны быть в памяти)."""
+    return sales_snapshot(
+        order.created_at,
+        order.status,
+        order.delivery_cost,
+        ((it.product, it.quantity, it.amount) for it in order.items),
+    )
+
+
+async def apply_sales_delta(db: AsyncSession, before: SalesSnapshot, after: SalesSnapshot) -> None:
+    """
+    Применить разницу «после − до» к роллапам одним upsert'ом на таблицу.
+    Не коммитит: вызывается внутри транзакции изменения заказа — последним, после
+    остатков (порядок блокировок везде один: товары, затем роллапы).
+    """
+    day = after.day or before.day
+    if day is None:
+        return
+    b_products = before.products if before.counted else {}
+    a_products = after.products if after.counted else {}
+
+    product_rows = []
+    # стабильный порядок ключей — параллельные upsert'ы не дедлочатся
+    for pid in sorted(set(b_products) | set(a_products)):
+        b_rev, b_qty, b_size, b_color = b_products.get(pid, (0, 0, None, None))
+        a_rev, a_qty, a_size, a_color = a_products.get(pid, (0, 0, None, None))
+        row = {
+            "day": day,
+            "product_id": pid,
+            "size": a_size or b_size,
+            "color": a_color or b_color,
+            "revenue": a_rev - b_rev,
+            "quantity": a_qty - b_qty,
+            "orders_count": int(pid in a_products) - int(pid in b_products),
+        }
+        if row["revenue"] or row["quantity"] or row["orders_count"]:
+            product_rows.append(row)
+
+    total = {
+        "day": day,
+        "revenue": sum(r for r, _, _, _ in a_products.values()) - sum(r for r, _, _, _ in b_products.values()),
+        "delivery_revenue": (after.delivery if after.counted else 0) - (before.delivery if before.counted else 0),
+        "orders_count": int(after.counted and after.day is not None) - int(before.counted and before.day is not None),
+    }
+
+    changes_total = total["revenue"] or total["delivery_revenue"] or total["orders_count"]
+    if not product_rows and not changes_total:
+        return
+    await db.execute(select(func.pg_advisory_xact_lock_shared(ROLLUP_WRITE_LOCK_KEY)))
+
+    if product_rows:
+        stmt = insert(SalesDaily).values(product_rows)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[SalesDaily.day, SalesDaily.product_id],
+            set_={
+                "size": stmt.excluded.size,
+                "color": stmt.excluded.color,
+                "revenue": SalesDaily.revenue + stmt.excluded.revenue,
+                "quantity": SalesDaily.quantity + stmt.excluded.quantity,
+                "orders_count": SalesDaily.orders_count + stmt.excluded.orders_count,
+            },
+        ))
+
+    if changes_total:
+        stmt = insert(SalesDayTotal).values(total)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[SalesDayTotal.day],
+            set_={
+                "revenue": SalesDayTotal.revenue + stmt.excluded.revenue,
+                "delivery_revenue": SalesDayTotal.delivery_revenue + stmt.excluded.delivery_revenue,
+                "orders_count": SalesDayTotal.orders_count + stmt.excluded.orders_count,
+            },
+        ))
+
+
+async def rebuild_sales_rollups(db: AsyncSession, date_from: date, date_to: date) -> None:
+    """
+    Пересчитать роллапы за [date_from, date_to] из orders/order_items (ремонт дрейфа).
+    Делает DELETE + INSERT ... SELECT в текущей транзакции, без коммита. Сначала ждёт
+    эксклюзивный ROLLUP_WRITE_LOCK_KEY: заказы, меняющие роллапы прямо сейчас, успевают
+    закоммитить, а новые ждут конца пересчёта.
+    """
+    await db.execute(select(func.pg_advisory_xact_lock(ROLLUP_WRITE_LOCK_KEY)))
+    ts_from = datetime.combine(date_from, datetime.min.time())
+    ts_to = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+    order_day = cast(Order.created_at, Date)
+    in_range = (
+        Order.created_at >= ts_from,
+        Order.created_at < ts_to,
+        Order.status.notin_(NON_REVENUE_STATUSES),
+    )
+
+    await db.execute(delete(SalesDaily).where(SalesDaily.day.between(date_from, date_to)))
+    await db.execute(delete(SalesDayTotal).where(SalesDayTotal.day.between(date_from, date_to)))
+
+    per_product = (
+        select(
+            order_day,
+            OrderItem.product_id,
+            func.max(Product.size),
+            func.max(Product.color),
+            func.coalesce(func.sum(OrderItem.amount), 0),
+            func.sum(OrderItem.quantity),
+            func.count(func.distinct(Order.id)),
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .join(Product, Product.id == OrderItem.product_id)
+        .where(*in_range)
+        .group_by(order_day, OrderItem.product_id)
+    )
+    stmt = insert(SalesDaily).from_select(
+        ["day", "product_id", "size", "color", "revenue", "quantity", "orders_count"], per_product
+    )
+    # под блокировкой конфликтов быть не должно, но пересчёт всё равно не падает на дубле ключа
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[SalesDaily.day, SalesDaily.product_id],
+        set_={
+            "size": stmt.excluded.size,
+            "color": stmt.excluded.color,
+            "revenue": stmt.excluded.revenue,
+            "quantity": stmt.excluded.quantity,
+            "orders_count": stmt.excluded.orders_count,
+        },
+    ))
+
+    items_sq = (
+        select(OrderItem.order_id, func.sum(OrderItem.amount).label("revenue"))
+        .group_by(OrderItem.order_id)
+        .subquery()
+    )
+    per_day = (
+        select(
+            order_day,
+            func.coalesce(func.sum(items_sq.c.revenue), 0),
+            func.coalesce(func.sum(Order.delivery_cost), 0),
+            func.count(Order.id),
+        )
+        .outerjoin(items_sq, items_sq.c.order_id == Order.id)
+        .where(*in_range)
+        .group_by(order_day)
+    )
+    stmt = insert(SalesDayTotal).from_select(["day", "revenue", "delivery_revenue", "orders_count"], per_day)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[SalesDayTotal.day],
+        set_={
+            "revenue": stmt.excluded.revenue,
+            "delivery_revenue": stmt.excluded.delivery_revenue,
+            "orders_count": stmt.excluded.orders_count,
+        },
+    ))
+
+
+async def try_lock_sales_rollups(db: AsyncSession) -> bool:
+    """
+    Advisory lock пересчёта роллапов до конца транзакции: ночной и ручной пересчёт
+    не должны идти одновременно. False — пересчёт уже идёт.
+    """
+    return bool(await db.scalar(select(func.pg_try_advisory_xact_lock(ROLLUP_REPAIR_LOCK_KEY))))
+
+
+async def repair_recent_sales_rollups(days: int) -> bool:
+    """Пересчитать последние N дней; False, если пересчёт уже идёт в другом воркере."""
+    today = datetime.utcnow().date()
+    async with async_session() as session:
+        if not await try_lock_sales_rollups(session):
+            return False
+        await rebuild_sales_rollups(session, today - timedelta(days=days), today)
+        await session.commit()
+    return True
+
+
+async def sales_rollup_nightly_loop() -> None:
+    """
+    Фоновая задача (стартует в lifespan): раз в сутки в SALES_ROLLUP_REPAIR_HOUR (UTC)
+    пересчитывает последние SALES_ROLLUP_REPAIR_DAYS дней.
+    """
+    hour = int(os.getenv("SALES_ROLLUP_REPAIR_HOUR", "3"))
+    days = int(os.getenv("SALES_ROLLUP_REPAIR_DAYS", "7"))
+    while True:
+        now = datetime.utcnow()
+        next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        try:
+            if await repair_recent_sales_rollups(days):
+                app_logger.info(f"Sales rollups repaired for the last {days} days")
+        except Exception as e:
+            app_logger.error(f"Sales rollup repair failed: {e}")
+
+
+async def get_daily_sales(db: AsyncSession, date_from: date, date_to: date) -> Sequence[SalesDayTotal]:
+    q = (
+        select(SalesDayTotal)
+        .where(SalesDayTotal.day.between(date_from, date_to))
+        .order_by(SalesDayTotal.day)
+    )
+    return (await db.execute(q)).scalars().all()
+
+
+async def get_product_sales(
+    db: AsyncSession, date_from: date, date_to: date, *, limit: int = 50
+) -> List[dict]:
+    """Топ товаров за период (только по роллапам, без orders/order_items)."""
+    q = (
+        select(
+            SalesDaily.product_id,
+            SalesDaily.size,
+            SalesDaily.color,
+            func.sum(SalesDaily.revenue).label("revenue"),
+            func.sum(SalesDaily.quantity).label("quantity"),
+            func.sum(SalesDaily.orders_count).label("orders_count"),
+        )
+        .where(SalesDaily.day.between(date_from, date_to))
+        .group_by(SalesDaily.product_id, SalesDaily.size, SalesDaily.color)
+        .order_by(func.sum(SalesDaily.revenue).desc())
+        .limit(limit)
+    )
+    return [dict(row) for row in (await db.execute(q)).mappings()]
@@ -0,0 +1,131 @@
+import csv
+import io
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_session
+from app.helpers.moderation import normalize_bad_word, rebuild_bad_word_matcher
+from app.helpers.remoderation_helpers import enqueue_remoderation
+from app.models.models import BadWord
+
+BAD_WORDS_IMPORT_CHUNK = 1000
+BAD_WORDS_IMPORT_MAX_BYTES = 5 * 1024 * 1024
+BAD_WORD_MAX_LENGTH = 100
+EXPORT_BATCH_SIZE = 1000
+
+
+def parse_bad_words(raw: bytes, *, is_csv: bool) -> Tuple[List[str], int, int]:
+    """
+    Разобрать загруженный список: одно слово на строку либо CSV (берётся первая колонка,
+    заголовок word пропускается). Возвращает (уникальные нормализованные слова,
+    всего строк, отброшенных как пустые/слишком длинные).
+    """
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+
+    if is_csv:
+        values = [row[0] if row else "" for row in csv.reader(io.StringIO(text))]
+        if values and normalize_bad_word(values[0]) == "word":
+            values = values[1:]
+    else:
+        values = text.splitlines()
+
+    seen: Dict[str, None] = {}
+    invalid = 0
+    for value in values:
+        word = normalize_bad_word(value)
+        if not word or len(word) > BAD_WORD_MAX_LENGTH:
+            invalid += 1
+            continue
+        seen.setdefault(word, None)
+    return list(seen), len(values), invalid
+
+
+async def insert_bad_words(db: AsyncSession, words: List[str]) -> List[str]:
+    """
+    INSERT ... ON CONFLICT (word) DO NOTHING пачками по BAD_WORDS_IMPORT_CHUNK.
+    Возвращает реально добавленные слова. Коммитит.
+    """
+    inserted: List[str] = []
+    for i in range(0, len(words), BAD_WORDS_IMPORT_CHUNK):
+        chunk = words[i:i + BAD_WORDS_IMPORT_CHUNK]
+        result = await db.execute(
+            insert(BadWord)
+            .values([{"word": w} for w in chunk])
+            .on_conflict_do_nothing(index_elements=[BadWord.word])
+            .returning(BadWord.word)
+        )
+        inserted.extend(result.scalars().all())
+    await db.commit()
+    return inserted
+
+
+async def read_bad_words_upload(file: UploadFile) -> bytes:
+    """
+    Прочитать загруженный список не больше BAD_WORDS_IMPORT_MAX_BYTES: размер
+    проверяется до чтения (file.size), а читается не больше лимита + 1 байт,
+    так что большой файл целиком в память не попадает. Больше лимита — 413.
+    """
+    if file.size is not None and file.size > BAD_WORDS_IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File is too large")
+    raw = await file.read(BAD_WORDS_IMPORT_MAX_BYTES + 1)
+    if len(raw) > BAD_WORDS_IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File is too large")
+    return raw
+
+
+async def import_bad_words(db: AsyncSession, raw: bytes, *, is_csv: bool) -> dict:
+    """
+    Массовая загрузка списка: разбор и дедупликация в памяти, вставка пачками,
+    одна пересборка матчера и один фоновый прогон по добавленным словам.
+    """
+    if len(raw) > BAD_WORDS_IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File is too large")
+    words, received, invalid = parse_bad_words(raw, is_csv=is_csv)
+    inserted = await insert_bad_words(db, words) if words else []
+
+    scan_id: Optional[int] = None
+    if inserted:
+        await rebuild_bad_word_matcher(db)
+        scan_id = (await enqueue_remoderation(db, "flag", inserted)).id
+    return {
+        "received": received,
+        "unique": len(words),
+        "inserted": len(inserted),
+        "skipped": len(words) - len(inserted),
+        "invalid": invalid,
+        "scan_id": scan_id,
+    }
+
+
+async def iter_bad_words_export(fmt: str = "txt") -> AsyncIterator[bytes]:
+    """
+    Потоковая выгрузка списка (txt — слово на строку, csv — с заголовком word).
+    Сессию открываем сами: get_db закрывается раньше, чем StreamingResponse дочитает генератор.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if fmt == "csv":
+        writer.writerow(["word"])
+
+    stmt = select(BadWord.word).order_by(BadWord.word).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    async with async_session() as session:
+        result = await session.stream(stmt)
+        async for partition in result.scalars().partitions(EXPORT_BATCH_SIZE):
+            for word in partition:
+                if fmt == "csv":
+                    writer.writerow([word])
+                else:
+                    buf.write(word)
+                    buf.write("\n")
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
@@ -9,6 +9,7 @@ from fastapi import HTTPException
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.metrics import qr_render_duration
 from app.models.models import User, QRCode, Editor, Template
 from app.s3.s3 import S3Client
 
@@ -17,6 +18,7 @@ def _make_slug(prefix: str) -> str:
     return f"{prefix}-{uuid.uuid4().hex[:10]}"
 
 
+@qr_render_duration.time()
 def _generate_qr_image(data: str, tmp_dir: Path) -> Path:
     qr = qrcode.QRCode(
         version=1,
@@ -1,41 +1,166 @@
+import asyncio
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_session
 from app.logging_config import app_logger
+from app.mail.smtp import MailError, SmtpMailer, get_mailer
+from app.models.models import EmailOutbox
+
+MAIL_OUTBOX_BATCH_SIZE = int(os.getenv("MAIL_OUTBOX_BATCH_SIZE", "50"))
+MAIL_OUTBOX_INTERVAL_SECONDS = float(os.getenv("MAIL_OUTBOX_INTERVAL_SECONDS", "30"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "8"))
+# на сколько письмо "забирается" воркером на время отправки (потом его возьмёт другой)
+MAIL_CLAIM_SECONDS = float(os.getenv("MAIL_CLAIM_SECONDS", "600"))
+# задержка перед повтором: base * 2^(attempts-1), не больше max
+MAIL_RETRY_BASE_SECONDS = float(os.getenv("MAIL_RETRY_BASE_SECONDS", "30"))
+MAIL_RETRY_MAX_SECONDS = float(os.getenv("MAIL_RETRY_MAX_SECONDS", "3600"))
+
+_outbox_wakeup = asyncio.Event()
+
+
+def enqueue_email(db: AsyncSession, to_email: str, subject: str, body: str) -> EmailOutbox:
+    """
+    Положить письмо в outbox. Не коммитит: письмо сохраняется вместе с транзакцией
+    вызывающего и уходит только если она закоммичена. После коммита — wake_mail_outbox().
+    """
+    mail = EmailOutbox(
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(mail)
+    return mail
+
+
+def wake_mail_outbox() -> None:
+    _outbox_wakeup.set()
+
+
+def enqueue_faq_answer_email(db: AsyncSession, to_email: str, question: str, answer: str) -> EmailOutbox:
+    """Письмо с ответом на FAQ."""
+    body = f"Здравствуйте!\n\nВы задавали вопрос: {question}\n\nНаш ответ:\n{answer}\n\nС уважением,\nКоманда поддержки"
+    return enqueue_email(db, to_email, "Ответ на ваш вопрос (FAQ)", body)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    delay = min(MAIL_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), MAIL_RETRY_MAX_SECONDS)
+    # разброс, чтобы письма, упавшие вместе, не повторялись одной пачкой
+    return timedelta(seconds=delay * random.uniform(0.9, 1.1))
+
+
+async def _claim_mail_batch(batch_size: int) -> List[EmailOutbox]:
+    """
+    Забрать созревшие письма короткой транзакцией: FOR UPDATE SKIP LOCKED и сдвиг
+    next_attempt_at на MAIL_CLAIM_SECONDS. Пока идёт отправка, строки не заблокированы,
+    но другие воркеры их не возьмут; если воркер упал — письма созреют снова.
+    """
+    async with async_session() as session:
+        now = datetime.utcnow()
+        batch = (
+            await session.execute(
+                select(EmailOutbox)
+                .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+        ).scalars().all()
+        for mail in batch:
+            mail.next_attempt_at = now + timedelta(seconds=MAIL_CLAIM_SECONDS)
+        await session.commit()
+    return list(batch)
+
+
+async def drain_mail_outbox(
+    batch_size: int = MAIL_OUTBOX_BATCH_SIZE,
+    mailer: Optional[SmtpMailer] = None,
+) -> int:
+    """
+    Отправить созревшие письма пачками по batch_size через одно SMTP-соединение.
+    Пачка забирается (_claim_mail_batch), отправляется вне транзакции, результаты
+    пишутся второй короткой транзакцией. Ошибка настроек SMTP (логин, конфиг) или
+    недоступный сервер останавливают отправку: оставшиеся письма возвращаются
+    в очередь без учёта попытки. Пачка не отправляется дольше, чем её держит захват:
+    иначе другой воркер заберёт её повторно и письма уйдут дважды.
+    Возвращает число отправленных.
+    """
+    mailer = mailer or get_mailer()
+    if not mailer.configured:
+        return 0
+    # одно письмо — до двух попыток (подключение, вход, отправка), каждый шаг до timeout
+    send_worst_case = 6 * mailer.timeout
+
+    sent = 0
+    while True:
+        batch = await _claim_mail_batch(batch_size)
+        send_until = time.monotonic() + MAIL_CLAIM_SECONDS - send_worst_case
+        stopped = False
+        timed_out = False
+        for i, mail in enumerate(batch):
+            if i and time.monotonic() > send_until:
+                # остаток пачки — обратно в очередь, его заберёт следующий захват
+                for rest in batch[i:]:
+                    rest.next_attempt_at = datetime.utcnow()
+                timed_out = True
+                break
+            try:
+                await mailer.send(mail.to_email, mail.subject, mail.body)
+            except MailError as e:
+                if e.config or e.connection:
+                    app_logger.error(f"Mail outbox stopped, emails stay in the queue: {e}")
+                    for rest in batch[i:]:
+                        rest.next_attempt_at = datetime.utcnow()
+                    stopped = True
+                    break
+                mail.attempts += 1
+                mail.last_error = str(e)[:2000]
+                if e.permanent or mail.attempts >= MAIL_MAX_ATTEMPTS:
+                    mail.status = "failed"
+                    app_logger.error(f"Email {mail.id} to {mail.to_email} failed: {e}")
+                else:
+                    mail.next_attempt_at = datetime.utcnow() + retry_delay(mail.attempts)
+                    app_logger.warning(f"Email {mail.id} to {mail.to_email} will be retried: {e}")
+                continue
+            mail.status = "sent"
+            mail.sent_at = datetime.utcnow()
+            mail.attempts += 1
+            sent += 1
+
+        if batch:
+            async with async_session() as session:
+                # объекты из транзакции захвата: UPDATE только изменённых полей
+                session.add_all(batch)
+                await session.commit()
+
+        if stopped or (len(batch) < batch_size and not timed_out):
+            return sent
+
 
-def send_faq_answer_email(to_email: str, question: str, answer: str):
-    """Отправка ответа на FAQ по email."""
-    smtp_server = os.getenv("SMTP_SERVER")
-    smtp_port = os.getenv("SMTP_PORT", "465")
-    smtp_user = os.getenv("SMTP_USERNAME")
-    smtp_pass = os.getenv("SMTP_PASSWORD")
-    smtp_from = os.getenv("SMTP_FROM_EMAIL", smtp_user)
-    
-    if not all([smtp_server, smtp_port, smtp_user, smtp_pass]):
-        app_logger.warning("SMTP settings are not fully configured. Skipping email sending.")
-        return
-        
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = str(smtp_from)
-        msg['To'] = to_email
-        msg['Subject'] = "Ответ на ваш вопрос (FAQ)"
-        
-        body = f"Здравствуйте!\n\nВы задавали вопрос: {question}\n\nНаш ответ:\n{answer}\n\nС уважением,\nКоманда поддержки"
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        port = int(smtp_port)
-        if port == 465:
-            server = smtplib.SMTP_SSL(str(smtp_server), port)
-        else:
-            server = smtplib.SMTP(str(smtp_server), port)
-            server.starttls()
-            
-        server.login(str(smtp_user), str(smtp_pass))
-        server.sendmail(str(smtp_from), to_email, msg.as_string())
-        server.quit()
-        app_logger.info(f"Answer email sent to {to_email}")
-    except Exception as e:
-        app_logger.error(f"Failed to send email to {to_email}: {e}")
+async def mail_outbox_loop(interval_seconds: float = MAIL_OUTBOX_INTERVAL_SECONDS) -> None:
+    """
+    Фоновая задача (стартует в lifespan): отправляет письма из outbox.
+    Просыпается после enqueue в этом воркере или раз в interval_seconds (повторы, другие воркеры).
+    """
+    mailer = get_mailer()
+    if not mailer.configured:
+        app_logger.warning("SMTP settings are not fully configured. Emails stay in the outbox.")
+    while True:
+        try:
+            await drain_mail_outbox(mailer=mailer)
+        except Exception as e:
+            app_logger.error(f"Mail outbox processing failed: {e}")
+        try:
+            await asyncio.wait_for(_outbox_wakeup.wait(), timeout=interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+        _outbox_wakeup.clear()
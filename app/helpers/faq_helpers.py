@@ -1,15 +1,18 @@
-from typing import Sequence
+from typing import Optional, Sequence
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import func, literal_column, select
 from app.models.models import FAQ
+from app.helpers.email_helpers import enqueue_faq_answer_email, wake_mail_outbox
+
+# та же конфигурация, что в FAQ.search_vector; литералом, а не параметром — это regconfig
+FAQ_SEARCH_CONFIG = literal_column("'russian'")
 
 
 async def create_faq_helper(db: AsyncSession, name: str, email: str, question: str) -> FAQ:
     faq = FAQ(name=name, email=email, question=question)
     db.add(faq)
     await db.commit()
-    await db.refresh(faq)
     return faq
 
 
@@ -19,6 +22,39 @@ async def get_all_faqs_helper(db: AsyncSession) -> Sequence[FAQ]:
     return result.scalars().all()
 
 
+async def get_faq_inbox_helper(
+    db: AsyncSession,
+    status: str = "all",
+    q: Optional[str] = None,
+    before_id: Optional[int] = None,
+    limit: int = 50,
+) -> dict:
+    """
+    Входящие вопросы для админки: новые сверху, keyset по id (before_id),
+    фильтр answered/unanswered и полнотекстовый поиск (GIN по search_vector).
+    Счётчик неотвеченных идёт по частичному индексу ix_faqs_unanswered.
+    """
+    stmt = select(FAQ).order_by(FAQ.id.desc()).limit(limit + 1)
+    if status == "answered":
+        stmt = stmt.where(FAQ.answer.is_not(None))
+    elif status == "unanswered":
+        stmt = stmt.where(FAQ.answer.is_(None))
+    if q and q.strip():
+        # websearch_to_tsquery не падает на пользовательском вводе (кавычки, OR, -слово)
+        stmt = stmt.where(FAQ.search_vector.op("@@")(func.websearch_to_tsquery(FAQ_SEARCH_CONFIG, q.strip())))
+    if before_id is not None:
+        stmt = stmt.where(FAQ.id < before_id)
+
+    faqs = (await db.execute(stmt)).scalars().all()
+    unanswered = await db.scalar(select(func.count(FAQ.id)).where(FAQ.answer.is_(None)))
+    page = faqs[:limit]
+    return {
+        "items": page,
+        "next_cursor": page[-1].id if len(faqs) > limit else None,
+        "unanswered": unanswered,
+    }
+
+
 async def answer_faq_helper(db: AsyncSession, faq_id: int, answer: str) -> FAQ | None:
     result = await db.execute(select(FAQ).where(FAQ.id == faq_id))
     faq = result.scalars().first()
@@ -26,6 +62,9 @@ async def answer_faq_helper(db: AsyncSession, faq_id: int, answer: str) -> FAQ |
         return None
 
     faq.answer = answer
+    # письмо попадает в outbox в той же транзакции, что и ответ
+    if faq.email and faq.answer:
+        enqueue_faq_answer_email(db, faq.email, faq.question, faq.answer)
     await db.commit()
-    await db.refresh(faq)
+    wake_mail_outbox()
     return faq
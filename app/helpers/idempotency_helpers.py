@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import and_, delete, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import async_session
+from app.logging_config import app_logger
+from app.models.models import IdempotencyKey
+
+IDEMPOTENCY_TTL = timedelta(hours=int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+# «in_progress» старше этого считаем брошенным (воркер упал посреди запроса)
+IN_FLIGHT_STALE_AFTER = timedelta(minutes=5)
+# сколько дубликат ждёт завершения оригинала, прежде чем вернуть 409
+IN_FLIGHT_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+PURGE_BATCH_SIZE = 1000
+MAX_KEY_LENGTH = 255
+
+# дубликаты внутри одного воркера ждут future, а не опрашивают БД
+_inflight: Dict[Tuple[int, str, str], asyncio.Future] = {}
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Хеш тела запроса: тот же ключ с другим телом — ошибка клиента."""
+    raw = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _replay(row: IdempotencyKey) -> JSONResponse:
+    return JSONResponse(
+        content=json.loads(row.response_body),
+        status_code=row.response_status,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+async def _claim(user_id: int, scope: str, key: str, request_hash: str) -> bool:
+    """
+    Атомарно занять ключ (своя короткая транзакция, видна другим воркерам сразу).
+    Просроченные и брошенные записи перезахватываются тем же upsert'ом.
+    """
+    now = datetime.utcnow()
+    stmt = insert(IdempotencyKey).values(
+        user_id=user_id, scope=scope, key=key, request_hash=request_hash,
+        status="in_progress", created_at=now, expires_at=now + IDEMPOTENCY_TTL,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[IdempotencyKey.user_id, IdempotencyKey.scope, IdempotencyKey.key],
+        set_={
+            "request_hash": stmt.excluded.request_hash,
+            "status": "in_progress",
+            "response_status": None,
+            "response_body": None,
+            "created_at": stmt.excluded.created_at,
+            "expires_at": stmt.excluded.expires_at,
+        },
+        where=or_(
+            IdempotencyKey.expires_at < now,
+            and_(
+                IdempotencyKey.status == "in_progress",
+                IdempotencyKey.created_at < now - IN_FLIGHT_STALE_AFTER,
+            ),
+        ),
+    ).returning(IdempotencyKey.key)
+    async with async_session() as session:
+        claimed = (await session.execute(stmt)).first() is not None
+        await session.commit()
+    return claimed
+
+
+async def _load(user_id: int, scope: str, key: str) -> Optional[IdempotencyKey]:
+    async with async_session() as session:
+        return await session.get(IdempotencyKey, (user_id, scope, key))
+
+
+async def _finish(user_id: int, scope: str, key: str, status_code: int, body: Any) -> None:
+    async with async_session() as session:
+        row = await session.get(IdempotencyKey, (user_id, scope, key))
+        if row is not None:
+            row.status = "done"
+            row.response_status = status_code
+            row.response_body = json.dumps(body, ensure_ascii=False)
+            await session.commit()
+
+
+async def _release(user_id: int, scope: str, key: str) -> None:
+    """Оригинал упал — ключ освобождаем, повтор клиента выполнит работу заново."""
+    async with async_session() as session:
+        await session.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.scope == scope,
+                IdempotencyKey.key == key,
+                IdempotencyKey.status == "in_progress",
+            )
+        )
+        await session.commit()
+
+
+async def _wait_in_flight(ident: Tuple[int, str, str], deadline: float) -> None:
+    """Дождаться оригинала: future в этом воркере, иначе опрос БД с backoff."""
+    loop = asyncio.get_running_loop()
+    future = _inflight.get(ident)
+    if future is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=max(deadline - loop.time(), 0))
+        except Exception:
+            pass
+        return
+
+    delay = 0.05
+    while loop.time() < deadline:
+        await asyncio.sleep(delay)
+        row = await _load(*ident)
+        if row is None or row.status != "in_progress":
+            return
+        delay = min(delay * 2, 1.0)
+
+
+async def run_idempotent(
+    idempotency_key: Optional[str],
+    *,
+    scope: str,
+    user_id: int,
+    payload: Any,
+    handler: Callable[[], Awaitable[Any]],
+    response_model: Type[BaseModel],
+    status_code: int = 200,
+    stored_fields: Optional[Sequence[str]] = None,
+) -> Any:
+    """
+    Выполнить handler не более одного раза на (user_id, scope, Idempotency-Key).
+
+    Без ключа — просто вызывает handler. С ключом: первый запрос выполняет работу
+    и сохраняет сериализованный ответ; повторы получают его же (Idempotent-Replayed: true),
+    параллельные дубликаты ждут завершения оригинала. Если оригинал упал,
+    ключ освобождается и следующий повтор выполнит работу сам.
+
+    stored_fields — для ответов с секретами (пароль сгенерированного пользователя):
+    в БД пишутся только эти поля, а повтор получает 409 с ними вместо ответа.
+    """
+    if not idempotency_key:
+        return await handler()
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+    ident = (user_id, scope, idempotency_key)
+    request_hash = request_fingerprint(payload)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IN_FLIGHT_WAIT_SECONDS
+
+    while True:
+        if await _claim(user_id, scope, idempotency_key, request_hash):
+            break
+
+        row = await _load(*ident)
+        if row is None:
+            continue  # оригинал упал и освободил ключ — пробуем занять сами
+        if row.request_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail={"error": "idempotency_mismatch", "msg": "Idempotency-Key was used with a different request"},
+            )
+        if row.status == "done":
+            if stored_fields is None:
+                return _replay(row)
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "error": "already_processed",
+                    "msg": "Request with this Idempotency-Key was already processed",
+                    **json.loads(row.response_body),
+                },
+            )
+        if loop.time() >= deadline:
+            raise HTTPException(
+                status_code=409,
+                detail={"error": "in_progress", "msg": "Request with this Idempotency-Key is still in progress"},
+            )
+        await _wait_in_flight(ident, deadline)
+
+    future = loop.create_future()
+    _inflight[ident] = future
+    try:
+        result = await handler()
+        body = jsonable_encoder(response_model.model_validate(result))
+        stored = body if stored_fields is None else {field: body[field] for field in stored_fields}
+        await _finish(user_id, scope, idempotency_key, status_code, stored)
+        future.set_result(None)
+        return JSONResponse(content=body, status_code=status_code)
+    except BaseException:
+        await _release(user_id, scope, idempotency_key)
+        future.set_result(None)
+        raise
+    finally:
+        _inflight.pop(ident, None)
+
+
+async def purge_expired_idempotency_keys(batch_size: int = PURGE_BATCH_SIZE) -> int:
+    """Удалить просроченные ключи пачками (короткие транзакции, без долгих блокировок)."""
+    total = 0
+    while True:
+        async with async_session() as session:
+            batch = (
+                select(IdempotencyKey.user_id, IdempotencyKey.scope, IdempotencyKey.key)
+                .where(IdempotencyKey.expires_at < datetime.utcnow())
+                .limit(batch_size)
+            )
+            res = await session.execute(
+                delete(IdempotencyKey).where(
+                    tuple_(IdempotencyKey.user_id, IdempotencyKey.scope, IdempotencyKey.key).in_(batch)
+                )
+            )
+            await session.commit()
+        total += res.rowcount or 0
+        if (res.rowcount or 0) < batch_size:
+            return total
+
+
+async def idempotency_cleanup_loop(interval_seconds: int = 3600) -> None:
+    """Фоновая задача (стартует в lifespan): раз в interval_seconds чистит просроченные ключи."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            purged = await purge_expired_idempotency_keys()
+            if purged:
+                app_logger.info(f"Purged {purged} expired idempotency keys")
+        except Exception as e:
+            app_logger.error(f"Idempotency keys cleanup failed: {e}")
@@ -0,0 +1,231 @@
+"""
+Отчёт о задержках эндпоинтов по журналу запросов (строки REQUEST в app.log и
+его ротированных сегментах, см. app/request_logging.py).
+
+Каждый сегмент разбирается в колонки NumPy (время, код роута, статус,
+длительность) и кэшируется по журналу и (устройство, inode) вместе со смещением, до
+которого прочитан: повторный отчёт дочитывает только новые байты текущего
+файла, а неизменные бэкапы не перечитывает вовсе. Перцентили по роуту и
+статусу считаются векторно — одна сортировка на весь период.
+"""
+import asyncio
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from app.helpers.logs_helpers import log_segments, open_log
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+# текстовый формат: "2026-10-19 12:00:00,123 - app - INFO - REQUEST GET /x?y | status=200 | 12.3ms
+# | db=2/1.0ms | route=/x" (route= — шаблон роута; в старых строках его нет)
+_TEXT_REQUEST = re.compile(
+    rb"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) - app - \w+ - REQUEST (\S+) ([^ ?]+)\S* \| status=(\d+) \| ([\d.]+)ms"
+    rb"(?: \| db=\S+)?(?: \| route=(\S+))?",
+    re.MULTILINE,
+)
+# JSON-формат: запись целиком, поля route/status/duration_ms
+_JSON_REQUEST = re.compile(rb'^\{"ts":"[^"]+","level":"\w+","logger":"app","msg":"REQUEST .*$', re.MULTILINE)
+# для старых строк без шаблона роута: /orders/123 -> /orders/{id}
+_ID_SEGMENT = re.compile(r"/(?:\d+|[0-9a-fA-F-]{16,})(?=/|$)")
+
+
+class _Routes:
+    """Общий для всех сегментов словарь "METHOD шаблон" -> код (коды — int32 в колонках)."""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def code(self, name: str) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+class _Segment:
+    """Разобранная часть файла: колонки и смещение конца последней полной строки."""
+
+    __slots__ = ("offset", "ts", "route", "status", "duration")
+
+    def __init__(self):
+        self.offset = 0
+        self.ts = np.empty(0, dtype=np.float64)
+        self.route = np.empty(0, dtype=np.int32)
+        self.status = np.empty(0, dtype=np.int16)
+        self.duration = np.empty(0, dtype=np.float32)
+
+    def extend(self, ts, route, status, duration) -> None:
+        self.ts = np.concatenate((self.ts, np.asarray(ts, dtype=np.float64)))
+        self.route = np.concatenate((self.route, np.asarray(route, dtype=np.int32)))
+        self.status = np.concatenate((self.status, np.asarray(status, dtype=np.int16)))
+        self.duration = np.concatenate((self.duration, np.asarray(duration, dtype=np.float32)))
+
+
+_routes = _Routes()
+# журнал (app.log, error.log, ...) -> его сегменты по (устройство, inode)
+_segments: Dict[str, Dict[Tuple[int, int], _Segment]] = {}
+# разбор идёт в потоке; два одновременных отчёта не должны разбирать одно и то же
+_parse_lock = threading.Lock()
+_local_seconds: Dict[bytes, float] = {}
+
+
+def _local_epoch(second: bytes) -> float:
+    # "YYYY-MM-DD HH:MM:SS" в локальном времени; секунды повторяются — кэшируем
+    value = _local_seconds.get(second)
+    if value is None:
+        if len(_local_seconds) > 100_000:
+            _local_seconds.clear()
+        value = _local_seconds[second] = datetime.fromisoformat(second.decode()).astimezone().timestamp()
+    return value
+
+
+def _parse(data: bytes):
+    ts, route, status, duration = [], [], [], []
+    for m in _TEXT_REQUEST.finditer(data):
+        second, millis, method, path, code, elapsed, template = m.groups()
+        ts.append(_local_epoch(second) + int(millis) / 1000)
+        name = template.decode() if template else _ID_SEGMENT.sub("/{id}", path.decode())
+        route.append(_routes.code(f"{method.decode()} {name}"))
+        status.append(int(code))
+        duration.append(float(elapsed))
+    for m in _JSON_REQUEST.finditer(data):
+        try:
+            record = orjson.loads(m.group())
+            moment = datetime.fromisoformat(record["ts"]).astimezone(timezone.utc).timestamp()
+            name = record.get("route") or _ID_SEGMENT.sub("/{id}", record["path"])
+            entry = (moment, _routes.code(f"{record['method']} {name}"), int(record["status"]), float(record["duration_ms"]))
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+            continue
+        for column, value in zip((ts, route, status, duration), entry):
+            column.append(value)
+    return ts, route, status, duration
+
+
+def _load_segment(cache: Dict[Tuple[int, int], _Segment], path: str) -> Optional[_Segment]:
+    """Дочитать сегмент с закэшированного смещения (для бэкапов — обычно ничего)."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (st.st_dev, st.st_ino)
+    segment = cache.get(key)
+    if segment is None:
+        segment = cache[key] = _Segment()
+    if path.endswith(".gz") and segment.offset:
+        return segment  # сжатые бэкапы не меняются
+    with open_log(path) as f:
+        f.seek(segment.offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    if end:
+        segment.extend(*_parse(data[:end]))
+        segment.offset += end
+    return segment
+
+
+def _collect(path: str, since: float, until: float):
+    with _parse_lock:
+        cache = _segments.setdefault(path, {})
+        segments = log_segments(path)
+        live = []
+        for segment_path in segments:
+            try:
+                # всё в сегменте записано не позже его mtime
+                if os.stat(segment_path).st_mtime < since:
+                    continue
+            except FileNotFoundError:
+                continue
+            segment = _load_segment(cache, segment_path)
+            if segment is not None:
+                live.append(segment)
+        # сегменты этого журнала, которых больше нет на диске (ушли за backupCount), выкидываем
+        present = set()
+        for segment_path in segments:
+            try:
+                st = os.stat(segment_path)
+                present.add((st.st_dev, st.st_ino))
+            except FileNotFoundError:
+                pass
+        for key in list(cache):
+            if key not in present:
+                del cache[key]
+        names = list(_routes.names)
+
+    if not live:
+        return names, None
+    ts = np.concatenate([s.ts for s in live])
+    mask = (ts >= since) & (ts <= until)
+    return names, (
+        np.concatenate([s.route for s in live])[mask],
+        np.concatenate([s.status for s in live])[mask],
+        np.concatenate([s.duration for s in live])[mask],
+    )
+
+
+def _percentiles(durations: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """Перцентиль с линейной интерполяцией сразу для всех групп отсортированного массива."""
+    position = q * (counts - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    low = durations[starts + lower]
+    high = durations[starts + upper]
+    return low + (high - low) * (position - lower)
+
+
+def build_latency_report(
+    path: str,
+    since: datetime,
+    until: datetime,
+    route: Optional[str] = None,
+    limit: int = 200,
+) -> Dict:
+    since_ts = since.astimezone().timestamp()
+    until_ts = until.astimezone().timestamp()
+    names, columns = _collect(path, since_ts, until_ts)
+    report = {"since": since.isoformat(), "until": until.isoformat(), "requests": 0, "rows": []}
+    if columns is None:
+        return report
+    route_codes, statuses, durations = columns
+    if route:
+        wanted = np.array([code for code, name in enumerate(names) if route in name], dtype=np.int32)
+        keep = np.isin(route_codes, wanted)
+        route_codes, statuses, durations = route_codes[keep], statuses[keep], durations[keep]
+    if not len(durations):
+        return report
+
+    # группа = (роут, статус); сортировка по группе, внутри — по длительности
+    group = route_codes.astype(np.int64) * 1000 + statuses
+    order = np.lexsort((durations, group))
+    group, durations = group[order], durations[order].astype(np.float64)
+    keys, starts, counts = np.unique(group, return_index=True, return_counts=True)
+    sums = np.add.reduceat(durations, starts)
+    ends = starts + counts - 1
+    stats = {f"p{round(q * 100)}_ms": _percentiles(durations, starts, counts, q) for q in PERCENTILES}
+
+    rows = []
+    # сверху — роуты, на которые уходит больше всего суммарного времени
+    for i in np.argsort(-sums)[:limit]:
+        rows.append({
+            "route": names[keys[i] // 1000],
+            "status": int(keys[i] % 1000),
+            "count": int(counts[i]),
+            "mean_ms": round(float(sums[i] / counts[i]), 2),
+            **{name: round(float(values[i]), 2) for name, values in stats.items()},
+            "max_ms": round(float(durations[ends[i]]), 2),
+            "total_ms": round(float(sums[i]), 1),
+        })
+    report["requests"] = int(len(durations))
+    report["rows"] = rows
+    return report
+
+
+async def get_latency_report(path: str, since: datetime, until: datetime, route: Optional[str] = None, limit: int = 200) -> Dict:
+    return await asyncio.to_thread(build_latency_report, path, since, until, route, limit)
@@ -0,0 +1,588 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.logging_config import GZIP_INODE_SEPARATOR
+
+LOGS_FOLLOW_POLL_SECONDS = float(os.getenv("LOGS_FOLLOW_POLL_SECONDS", "0.5"))
+LOGS_FOLLOW_HEARTBEAT_SECONDS = 15.0
+# сколько байт отдаём за один ответ/событие; остальное — следующим
+LOGS_READ_MAX_BYTES = 1024 * 1024
+
+
+def open_log(path: str):
+    """
+    Файл лога на чтение. Сжатые сегменты (.gz) распаковываются на лету, все
+    смещения для них — в распакованных байтах.
+    """
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def log_size(path: str) -> int:
+    """Размер содержимого лога; для .gz — из трейлера gzip (ISIZE), без распаковки."""
+    if not path.endswith(".gz"):
+        return os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(-4, os.SEEK_END)
+        return int.from_bytes(f.read(4), "little")
+
+
+def gzip_source_inode(path: str) -> Optional[int]:
+    """
+    Inode несжатого файла, из которого сделан .gz (записан компрессором в FNAME
+    заголовка gzip, см. _Compressor). None — если заголовок без этой метки.
+    """
+    with open(path, "rb") as f:
+        header = f.read(10)
+        if len(header) < 10 or header[:2] != b"\x1f\x8b" or not header[3] & 0x08:  # FNAME
+            return None
+        if header[3] & 0x04:  # FEXTRA идёт перед FNAME
+            f.seek(int.from_bytes(f.read(2), "little"), os.SEEK_CUR)
+        name = bytearray()
+        while (byte := f.read(1)) not in (b"", b"\0") and len(name) < 1024:
+            name += byte
+    _, sep, inode = name.decode("latin-1").rpartition(GZIP_INODE_SEPARATOR)
+    return int(inode) if sep and inode.isdigit() else None
+
+
+def _tail_gzip(path: str, limit: int) -> Tuple[List[str], int, int]:
+    # в gzip нет чтения с конца: распаковываем потоком, держа последние limit строк
+    with gzip.open(path, "rb") as f:
+        lines = deque(f, maxlen=limit)
+        end = f.tell()
+    if lines and not lines[-1].endswith(b"\n"):
+        end -= len(lines.pop())
+    return [l.decode(errors="replace").rstrip("\n") for l in lines], end, os.stat(path).st_ino
+
+
+def tail_with_offset(path: str, limit: int, block: int = 8192) -> Tuple[List[str], int, int]:
+    """
+    Последние limit полных строк файла и курсор для дочитывания: (строки, offset, inode).
+    offset указывает на конец последней полной строки — недописанная строка
+    придёт со следующим дочитыванием целиком.
+    """
+    if path.endswith(".gz"):
+        return _tail_gzip(path, limit)
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        end = pos = st.st_size
+        data = bytearray()
+        while pos > 0 and data.count(b"\n") <= limit:
+            read = min(block, pos)
+            pos -= read
+            f.seek(pos)
+            data[:0] = f.read(read)
+    cut = data.rfind(b"\n")
+    if cut + 1 < len(data):
+        end -= len(data) - cut - 1
+        del data[cut + 1:]
+    lines = [l.decode(errors="replace") for l in data.splitlines()[-limit:]]
+    return lines, end, st.st_ino
+
+
+def _read_complete_lines(path: str, offset: int, max_bytes: int) -> Tuple[List[str], int]:
+    with open_log(path) as f:
+        f.seek(offset)
+        data = f.read(max_bytes)
+    cut = data.rfind(b"\n")
+    if cut == -1:
+        # очень длинная строка без перевода — отдаём как есть, иначе курсор застрянет
+        if len(data) < max_bytes:
+            return [], offset
+        cut = len(data) - 1
+    return data[:cut + 1].decode(errors="replace").splitlines(), offset + cut + 1
+
+
+def _rotated_file(path: str, inode: int) -> Optional[str]:
+    """Первый бэкап, если это тот же файл, что был path с inode (до или после сжатия)."""
+    try:
+        if os.stat(f"{path}.1").st_ino == inode:
+            return f"{path}.1"
+    except FileNotFoundError:
+        pass
+    try:
+        if gzip_source_inode(f"{path}.1.gz") == inode:
+            return f"{path}.1.gz"
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def read_lines_after(
+    path: str,
+    offset: int,
+    inode: Optional[int] = None,
+    max_bytes: int = LOGS_READ_MAX_BYTES,
+) -> Dict:
+    """
+    Полные строки после байта offset. Если файл ротирован (сменился inode или
+    файл стал короче offset), сначала дочитывается хвост старого файла — path.1
+    с тем же inode или, если его уже сжали, path.1.gz с этим inode в заголовке
+    (смещения в .gz те же, в распакованных байтах), — затем новый файл с начала.
+    Возвращает {"lines", "offset", "inode", "rotated", "more"}.
+    """
+    st = os.stat(path)
+    lines: List[str] = []
+    rotated = (inode is not None and st.st_ino != inode) or log_size(path) < offset
+    if rotated:
+        previous = _rotated_file(path, inode) if inode is not None else None
+        if previous is not None:
+            try:
+                lines, _ = _read_complete_lines(previous, offset, max_bytes)
+            except FileNotFoundError:
+                # path.1 сжали между stat и open — те же байты уже в path.1.gz
+                lines, _ = _read_complete_lines(previous + ".gz", offset, max_bytes)
+        offset = 0
+
+    chunk, offset = _read_complete_lines(path, offset, max(max_bytes - sum(len(l) for l in lines), 1))
+    lines.extend(chunk)
+    return {
+        "lines": lines,
+        "offset": offset,
+        "inode": st.st_ino,
+        "rotated": rotated,
+        "more": offset < log_size(path),
+    }
+
+
+class _LogWatcher:
+    """
+    Один опрос os.stat на файл на процесс, сколько бы админов ни следило за ним;
+    подписчики спят на Condition до изменения размера/inode/mtime.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = 0
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+    def _identity(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    async def _poll(self) -> None:
+        last = self._identity()
+        while True:
+            await asyncio.sleep(LOGS_FOLLOW_POLL_SECONDS)
+            current = self._identity()
+            if current != last:
+                last = current
+                async with self._changed:
+                    self.version += 1
+                    self._changed.notify_all()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def wait_change(self, seen: int, timeout: float) -> int:
+        """Дождаться версии новее seen (или таймаута); вернуть текущую версию."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.version != seen), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return self.version
+
+
+_watchers: Dict[str, _LogWatcher] = {}
+
+
+@asynccontextmanager
+async def watch_log_file(path: str) -> AsyncIterator[_LogWatcher]:
+    watcher = _watchers.get(path)
+    if watcher is None:
+        watcher = _watchers[path] = _LogWatcher(path)
+    watcher.subscribers += 1
+    watcher.start()
+    try:
+        yield watcher
+    finally:
+        watcher.subscribers -= 1
+        if watcher.subscribers == 0:
+            watcher.stop()
+            _watchers.pop(path, None)
+
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def follow_log_file(path: str, offset: int, inode: Optional[int]) -> AsyncIterator[str]:
+    """
+    SSE-поток новых строк начиная с offset: событие lines с курсором после каждой
+    порции, комментарий-пинг при простое (чтобы прокси не рвали соединение).
+    """
+    async with watch_log_file(path) as watcher:
+        version = watcher.version
+        while True:
+            try:
+                chunk = await asyncio.to_thread(read_lines_after, path, offset, inode)
+            except FileNotFoundError:
+                # окно ротации: старый файл уже переименован, новый ещё не создан
+                chunk = None
+            if chunk is not None:
+                offset, inode = chunk["offset"], chunk["inode"]
+                if chunk["lines"] or chunk["rotated"]:
+                    yield _sse("lines", chunk)
+                if chunk["more"]:
+                    continue
+            seen = version
+            version = await watcher.wait_change(seen, LOGS_FOLLOW_HEARTBEAT_SECONDS)
+            if version == seen:
+                yield ": ping\n\n"
+
+
+# ---------------------------------------------------------------------------
+# Поиск по текущему и ротированным файлам
+# ---------------------------------------------------------------------------
+
+LOGS_SEARCH_CPU_SECONDS = float(os.getenv("LOGS_SEARCH_CPU_SECONDS", "5"))
+LOGS_SEARCH_CONCURRENCY = int(os.getenv("LOGS_SEARCH_CONCURRENCY", "2"))
+# сколько байт разбирается за один заход в поток (между ними уходят найденные записи)
+_SEARCH_CHUNK_BYTES = 4 * 1024 * 1024
+_BISECT_MIN_SPAN = 64 * 1024
+
+# заголовки записей обоих форматов (см. app/logging_config.py):
+#   2026-10-19 12:00:00,123 - app - INFO - ...
+#   {"ts":"2026-10-19T09:00:00.123+00:00","level":"INFO","logger":"app",...
+_TEXT_HEADER = re.compile(rb"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - (\S+) - ([A-Z]+) - ")
+_JSON_HEADER = re.compile(rb'^\{"ts":"([^"]+)","level":"([A-Z]+)","logger":"([^"]*)"')
+
+_search_slots = asyncio.Semaphore(LOGS_SEARCH_CONCURRENCY)
+
+
+def _parse_header(line: bytes) -> Optional[Tuple[bytes, str, str]]:
+    """
+    (сырое время, уровень, логгер) из первой строки записи или None для
+    строки-продолжения. Время разбирается отдельно (_timestamp) и только когда нужно.
+    """
+    m = _TEXT_HEADER.match(line)
+    if m:
+        ts, logger, level = m.groups()
+        return ts, level.decode(), logger.decode()
+    m = _JSON_HEADER.match(line)
+    if m:
+        ts, level, logger = m.groups()
+        return ts, level.decode(), logger.decode()
+    return None
+
+
+def _timestamp(raw: bytes) -> float:
+    # asctime текстового формата — локальное время сервера, без зоны
+    try:
+        return datetime.fromisoformat(raw.decode().replace(",", ".")).astimezone().timestamp()
+    except ValueError:
+        return 0.0
+
+
+def log_segments(path: str) -> List[str]:
+    """
+    Файл лога и его бэкапы (path.N[.gz] … path.1[.gz], path) — от старых к новым.
+    Пока сегмент сжимается, на диске бывают оба варианта — берётся .gz.
+    """
+    directory, name = os.path.split(path)
+    backups: Dict[int, str] = {}
+    for entry in os.listdir(directory):
+        suffix = entry[len(name) + 1:]
+        compressed = suffix.endswith(".gz")
+        number = suffix[:-len(".gz")] if compressed else suffix
+        if entry.startswith(name + ".") and number.isdigit():
+            if compressed or int(number) not in backups:
+                backups[int(number)] = os.path.join(directory, entry)
+    segments = [backups[n] for n in sorted(backups, reverse=True)]
+    if os.path.exists(path):
+        segments.append(path)
+    return segments
+
+
+def _raw_bounds(moment: Optional[float]) -> Optional[Tuple[bytes, bytes]]:
+    """
+    Граница времени в виде обоих форматов заголовка (текстового и JSON): такие
+    строки сравниваются лексикографически, и на каждую запись не нужен разбор даты.
+    """
+    if moment is None:
+        return None
+    local = datetime.fromtimestamp(moment).strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
+    utc = datetime.fromtimestamp(moment, timezone.utc).isoformat(timespec="milliseconds")
+    return local.encode(), utc.encode()
+
+
+class LogQuery:
+    """Условия поиска; matches() вызывается для каждой записи, поэтому всё подготовлено заранее."""
+
+    def __init__(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        level: Optional[str] = None,
+        logger: Optional[str] = None,
+        text: Optional[str] = None,
+        regex: bool = False,
+        ignore_case: bool = True,
+    ):
+        # naive datetime из запроса — локальное время, как в текстовых логах
+        self.since = since.astimezone().timestamp() if since else None
+        self.until = until.astimezone().timestamp() if until else None
+        self._since_raw = _raw_bounds(self.since)
+        self._until_raw = _raw_bounds(self.until)
+        self.min_level = logging.getLevelName(level.upper()) if level else None
+        if self.min_level is not None and not isinstance(self.min_level, int):
+            raise ValueError(f"unknown level: {level}")
+        self.logger = logger
+        self.pattern = None
+        self.needle = None
+        if text and regex:
+            self.pattern = re.compile(text, re.IGNORECASE if ignore_case else 0)
+        elif text:
+            self.needle = text.lower() if ignore_case else text
+        self.ignore_case = ignore_case
+
+    def before_since(self, ts: bytes) -> bool:
+        return self._since_raw is not None and ts < self._since_raw[ts[10:11] == b"T"]
+
+    def after_until(self, ts: bytes) -> bool:
+        return self._until_raw is not None and ts > self._until_raw[ts[10:11] == b"T"]
+
+    def accepts_header(self, ts: bytes, level: str, logger: str) -> bool:
+        if self.before_since(ts):
+            return False
+        if self.min_level is not None and logging.getLevelName(level) < self.min_level:
+            return False
+        if self.logger and not (logger == self.logger or logger.startswith(self.logger + ".")):
+            return False
+        return True
+
+    def accepts_text(self, text: str) -> bool:
+        if self.pattern is not None:
+            return self.pattern.search(text) is not None
+        if self.needle is not None:
+            return self.needle in (text.lower() if self.ignore_case else text)
+        return True
+
+
+def _first_ts_after(f, pos: int, end: int) -> Optional[float]:
+    """Время первой записи, начинающейся в [pos, end)."""
+    f.seek(pos)
+    if pos:
+        f.readline()  # хвост строки, в середину которой попали
+    while f.tell() < end:
+        line = f.readline()
+        if not line:
+            break
+        header = _parse_header(line)
+        if header:
+            return _timestamp(header[0])
+    return None
+
+
+def _seek_since(path: str, since: Optional[float]) -> int:
+    """
+    Бинарный поиск позиции, не позже которой начинаются записи с временем >= since.
+    Строки в файле упорядочены по времени (пишет один поток QueueListener).
+    В .gz произвольного доступа нет (каждый seek назад — распаковка с начала),
+    поэтому сжатые сегменты просматриваются с начала.
+    """
+    if since is None or path.endswith(".gz"):
+        return 0
+    with open(path, "rb") as f:
+        lo, hi = 0, os.fstat(f.fileno()).st_size
+        while hi - lo > _BISECT_MIN_SPAN:
+            mid = (lo + hi) // 2
+            ts = _first_ts_after(f, mid, hi)
+            if ts is None or ts >= since:
+                hi = mid
+            else:
+                lo = mid
+    return lo
+
+
+def _scan_chunk(path: str, offset: int, query: LogQuery, limit: int) -> Dict:
+    """
+    Разобрать до _SEARCH_CHUNK_BYTES с offset: найденные записи, позиция, на которой
+    остановились (всегда начало записи), и признак, что дальше по времени искать нечего.
+    """
+    started_cpu = time.thread_time()
+    matches = []
+    past_until = False
+    with open_log(path) as f:
+        f.seek(offset)
+        if offset:
+            # курсор мог указывать в середину строки (после бинарного поиска)
+            f.seek(offset - 1)
+            if f.read(1) != b"\n":
+                f.readline()
+        pos = f.tell()
+        record: Optional[Tuple[int, Tuple[bytes, str, str], List[bytes]]] = None
+        stop_at = pos + _SEARCH_CHUNK_BYTES
+        resume = pos
+
+        def flush():
+            start, (ts, level, logger), lines = record
+            if not query.accepts_header(ts, level, logger):
+                return
+            text = b"".join(lines).decode(errors="replace").rstrip("\n")
+            if query.accepts_text(text):
+                matches.append({"offset": start, "ts": _timestamp(ts), "level": level, "logger": logger, "text": text})
+
+        while True:
+            line = f.readline()
+            header = _parse_header(line) if line else None
+            if not line or header:
+                if record is not None:
+                    flush()
+                    record = None
+                resume = pos
+                if not line or len(matches) >= limit or pos >= stop_at:
+                    break
+                if query.after_until(header[0]):
+                    past_until = True
+                    break
+                record = (pos, header, [line])
+            elif record is not None:
+                record[2].append(line)
+            # строки до первого заголовка — продолжение записи из прошлого сегмента
+            pos += len(line)
+        eof = not line
+    return {
+        "matches": matches,
+        "offset": resume,
+        "eof": eof and not past_until,
+        "past_until": past_until,
+        "cpu": time.thread_time() - started_cpu,
+        "scanned": pos - offset,
+    }
+
+
+def segment_inode(path: str) -> int:
+    """
+    inode файла, которым сегмент был до ротации: у .gz — из заголовка (см. _Compressor),
+    иначе свой. По нему сегмент находится и после сдвига номеров при ротации.
+    """
+    if path.endswith(".gz"):
+        inode = gzip_source_inode(path)
+        if inode is not None:
+            return inode
+    return os.stat(path).st_ino
+
+
+def _find_segment(segments: List[str], inode: int) -> Optional[str]:
+    for segment in segments:
+        try:
+            if segment_inode(segment) == inode:
+                return segment
+        except FileNotFoundError:
+            continue
+    return None
+
+
+async def _in_search_slot(func, *args):
+    # слот держится только на время работы в потоке, не между yield: медленный
+    # клиент потока не должен занимать его у остальных поисков
+    async with _search_slots:
+        return await asyncio.to_thread(func, *args)
+
+
+async def search_logs(
+    path: str,
+    query: LogQuery,
+    limit: int = 500,
+    cursor: Optional[Tuple[int, int]] = None,
+    include_rotated: bool = True,
+    cpu_budget: float = LOGS_SEARCH_CPU_SECONDS,
+) -> AsyncIterator[str]:
+    """
+    NDJSON-поток: {"type": "match", ...} по мере нахождения и итоговая
+    {"type": "done", ...}. Сегменты просматриваются от старых к новым; в каждом
+    начало ищется бинарным поиском по времени. Когда исчерпан limit или бюджет
+    CPU (секунды процессорного времени на запрос), в done приходит cursor
+    (inode сегмента и смещение) — передайте его обратно, чтобы продолжить
+    с того же места, даже если сегмент с тех пор ротирован или сжат.
+    """
+    def current_segments() -> List[str]:
+        return log_segments(path) if include_rotated else [path]
+
+    segments = current_segments()
+    start_offset = 0
+    if cursor is not None:
+        start_inode, start_offset = cursor
+        resume_at = _find_segment(segments, start_inode)
+        if resume_at is None:
+            raise ValueError(f"segment not found: inode {start_inode}")
+        segments = segments[segments.index(resume_at):]
+
+    found = scanned = 0
+    cpu = 0.0
+    next_cursor = None
+    past_until = False
+
+    for i, segment in enumerate(segments):
+        name = os.path.basename(segment)
+        try:
+            if cursor is not None and i == 0:
+                inode, offset = start_inode, start_offset
+            else:
+                inode = segment_inode(segment)
+                # всё в сегменте записано не позже его mtime
+                if query.since is not None and os.stat(segment).st_mtime < query.since:
+                    continue
+                offset = await _in_search_slot(_seek_since, segment, query.since)
+        except FileNotFoundError:
+            continue  # сегмент ушёл при ротации прямо во время поиска
+        while True:
+            if cpu >= cpu_budget or found >= limit:
+                next_cursor = {"segment": name, "inode": inode, "offset": offset}
+                break
+            try:
+                chunk = await _in_search_slot(_scan_chunk, segment, offset, query, limit - found)
+            except FileNotFoundError:
+                # сегмент переименовали при ротации или сжали посреди поиска —
+                # ищем его по inode, смещения в .gz те же
+                moved = _find_segment(current_segments(), inode)
+                if moved is None:
+                    break
+                segment, name = moved, os.path.basename(moved)
+                continue
+            cpu += chunk["cpu"]
+            scanned += chunk["scanned"]
+            offset = chunk["offset"]
+            for match in chunk["matches"]:
+                found += 1
+                yield json.dumps({
+                    "type": "match",
+                    "segment": name,
+                    **match,
+                    "ts": datetime.fromtimestamp(match["ts"]).astimezone().isoformat(timespec="milliseconds"),
+                }, ensure_ascii=False) + "\n"
+            past_until = chunk["past_until"]
+            if chunk["eof"] or past_until:
+                break
+        if next_cursor is not None or past_until:
+            break
+
+    yield json.dumps({
+        "type": "done",
+        "matches": found,
+        "scanned_bytes": scanned,
+        "cpu_ms": round(cpu * 1000, 1),
+        "truncated": next_cursor is not None,
+        "cursor": next_cursor,
+    }) + "\n"
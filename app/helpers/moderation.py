@@ -1,8 +1,125 @@
+import asyncio
+import os
 import re
+import time
+from typing import Dict, Iterable, List, Optional
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.models.models import BadWord
 
+# другие воркеры узнают об изменении списка не позже чем через TTL
+BAD_WORDS_CACHE_TTL_SECONDS = float(os.getenv("BAD_WORDS_CACHE_TTL_SECONDS", "60"))
+
+
+def normalize_bad_word(word: str) -> str:
+    return (word or "").strip().lower()
+
+
+def _trie_pattern(node: dict) -> Optional[str]:
+    """Regex для поддерева префиксного дерева: общие префиксы слов вынесены за скобки."""
+    terminal = "" in node
+    children = sorted(ch for ch in node if ch)
+    if not children:
+        return None
+
+    alternatives, single_chars = [], []
+    for ch in children:
+        sub = _trie_pattern(node[ch])
+        if sub is None:
+            single_chars.append(re.escape(ch))
+        else:
+            alternatives.append(re.escape(ch) + sub)
+    if single_chars:
+        alternatives.append(single_chars[0] if len(single_chars) == 1 else "[" + "".join(single_chars) + "]")
+
+    pattern = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+    # слово может закончиться здесь: продолжение необязательно (жадно — сначала длинное)
+    return f"(?:{pattern})?" if terminal else pattern
+
+
+class BadWordMatcher:
+    """
+    Скомпилированный матчер запрещённых слов: одно регулярное выражение по
+    префиксному дереву всех слов вместо цикла «regex на слово».
+    Семантика прежняя — вхождение слова как подстроки, без учёта регистра.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self.words = sorted({normalize_bad_word(w) for w in words if normalize_bad_word(w)})
+        self._regex: Optional[re.Pattern] = None
+        self._scan: Optional[re.Pattern] = None
+        # слово -> слова-префиксы из списка (они тоже совпали, раз совпало это)
+        self._prefixes: Dict[str, List[str]] = {}
+        if not self.words:
+            return
+
+        trie: dict = {}
+        for word in self.words:
+            node = trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[""] = True
+        pattern = _trie_pattern(trie)
+        self._regex = re.compile(pattern)
+        # lookahead: совпадение в каждой позиции, в том числе перекрывающиеся
+        self._scan = re.compile(f"(?=({pattern}))")
+
+        known = set(self.words)
+        for word in self.words:
+            self._prefixes[word] = [word[:i] for i in range(1, len(word)) if word[:i] in known]
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def matches(self, text: str) -> bool:
+        if not text or self._regex is None:
+            return False
+        return self._regex.search(text.lower()) is not None
+
+    def find(self, text: str) -> List[str]:
+        """Все слова из списка, встречающиеся в тексте (отсортированы, без повторов)."""
+        if not text or self._scan is None:
+            return []
+        found = set()
+        for m in self._scan.finditer(text.lower()):
+            word = m.group(1)
+            found.add(word)
+            found.update(self._prefixes[word])
+        return sorted(found)
+
+
+_matcher: Optional[BadWordMatcher] = None
+_loaded_at = 0.0
+_lock = asyncio.Lock()
+
+
+async def rebuild_bad_word_matcher(db: AsyncSession) -> BadWordMatcher:
+    """Перечитать список из БД и пересобрать матчер (вызывают эндпоинты модерации после изменений)."""
+    global _matcher, _loaded_at
+    words = (await db.execute(select(BadWord.word))).scalars().all()
+    # компиляция тысяч слов — заметная CPU-работа, не держим на ней цикл
+    _matcher = await asyncio.to_thread(BadWordMatcher, words)
+    _loaded_at = time.monotonic()
+    return _matcher
+
+
+async def get_bad_word_matcher(db: AsyncSession) -> BadWordMatcher:
+    """Матчер процесса; из БД читается только при первом обращении и по истечении TTL."""
+    if _matcher is None or time.monotonic() - _loaded_at > BAD_WORDS_CACHE_TTL_SECONDS:
+        async with _lock:
+            if _matcher is None or time.monotonic() - _loaded_at > BAD_WORDS_CACHE_TTL_SECONDS:
+                await rebuild_bad_word_matcher(db)
+    return _matcher
+
+
+async def find_bad_words(db: AsyncSession, text: str) -> List[str]:
+    """Запрещённые слова, найденные в тексте."""
+    if not text:
+        return []
+    return (await get_bad_word_matcher(db)).find(text)
+
+
 async def check_bad_words(db: AsyncSession, text: str) -> bool:
     """
     Проверяет текст на наличие плохих слов из базы данных.
@@ -10,18 +127,4 @@ async def check_bad_words(db: AsyncSession, text: str) -> bool:
     """
     if not text:
         return False
-        
-    result = await db.execute(select(BadWord.word))
-    bad_words = result.scalars().all()
-    
-    if not bad_words:
-        return False
-        
-    text_lower = text.lower()
-    for word in bad_words:
-        # Ищем слово как самостоятельное или часть другого слова
-        pattern = r"\b" + re.escape(word) + r"s?\b"
-        if re.search(pattern, text_lower) or word in text_lower:
-            return True
-            
-    return False
+    return (await get_bad_word_matcher(db)).matches(text)
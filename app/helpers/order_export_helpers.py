@@ -0,0 +1,126 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import select, asc, desc
+
+from app.database import async_session
+from app.helpers.order_helpers import ORDER_SORTS, _filter_orders
+from app.models.models import Order, OrderItem, Product, User
+
+EXPORT_BATCH_SIZE = 500
+
+ORDER_EXPORT_FIELDS = [
+    "id", "created_at", "status", "total_amount", "user_id", "user_email",
+    "contact_info", "country", "city", "first_name", "last_name",
+    "delivery_address", "zip_code",
+    "yandex_request_id", "yandex_status", "yandex_offer_id", "yandex_error", "delivery_cost",
+    "payment_id", "payment_status",
+]
+ITEM_EXPORT_FIELDS = [
+    "item_id", "product_id", "product_type", "product_size", "product_color", "quantity", "amount",
+]
+
+
+def _orders_export_query(email: Optional[str], statuses: Optional[str], sort: Optional[str]):
+    """Плоские колонки без ORM-объектов: никаких selectin-каскадов и identity map."""
+    stmt = _filter_orders(
+        select(*Order.__table__.c, User.email.label("user_email"))
+        .join(User, User.id == Order.user_id),
+        email=email,
+        statuses=statuses,
+    )
+    key = ORDER_SORTS.get(sort or "")
+    if key:
+        order = asc if key[1] == "asc" else desc
+        return stmt.order_by(order(getattr(Order, key[0])), order(Order.id))
+    return stmt.order_by(desc(Order.id))
+
+
+async def _items_for(session, order_ids: List[int]) -> Dict[int, List[dict]]:
+    rows = await session.execute(
+        select(
+            OrderItem.order_id,
+            OrderItem.id.label("item_id"),
+            OrderItem.product_id,
+            Product.type.label("product_type"),
+            Product.size.label("product_size"),
+            Product.color.label("product_color"),
+            OrderItem.quantity,
+            OrderItem.amount,
+        )
+        .join(Product, Product.id == OrderItem.product_id)
+        .where(OrderItem.order_id.in_(order_ids))
+        .order_by(OrderItem.order_id, OrderItem.id)
+    )
+    items: Dict[int, List[dict]] = {}
+    for row in rows.mappings():
+        item = dict(row)
+        items.setdefault(item.pop("order_id"), []).append(item)
+    return items
+
+
+def _jsonable(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def iter_orders_export(
+    *,
+    fmt: str = "ndjson",
+    email: Optional[str] = None,
+    statuses: Optional[str] = None,
+    sort: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> AsyncIterator[bytes]:
+    """
+    Потоковая выгрузка заказов (для бухгалтерии) в NDJSON или CSV.
+
+    Заказы читаются серверным курсором (stream + yield_per) пачками по batch_size,
+    позиции каждой пачки — одним запросом. В памяти держится только текущая пачка.
+    CSV — одна строка на позицию (поля заказа повторяются), NDJSON — объект на заказ.
+
+    Сессию открываем сами: зависимость get_db закрывается раньше, чем
+    StreamingResponse дочитает генератор.
+    """
+    if fmt not in ("ndjson", "csv"):
+        raise ValueError(f"Unsupported export format '{fmt}'")
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if fmt == "csv":
+        writer.writerow(ORDER_EXPORT_FIELDS + ITEM_EXPORT_FIELDS)
+        yield buf.getvalue().encode("utf-8")
+
+    stmt = _orders_export_query(email, statuses, sort).execution_options(yield_per=batch_size)
+    async with async_session() as session:
+        result = await session.stream(stmt)
+        async for partition in result.mappings().partitions(batch_size):
+            items = await _items_for(session, [row["id"] for row in partition])
+
+            buf.seek(0)
+            buf.truncate()
+            for row in partition:
+                order = {field: _jsonable(row[field]) for field in ORDER_EXPORT_FIELDS}
+                order_items = items.get(row["id"], [])
+                if fmt == "ndjson":
+                    order["items"] = order_items
+                    buf.write(json.dumps(order, ensure_ascii=False))
+                    buf.write("\n")
+                    continue
+                head = [order[field] for field in ORDER_EXPORT_FIELDS]
+                for item in order_items or [{}]:
+                    writer.writerow(head + [item.get(field) for field in ITEM_EXPORT_FIELDS])
+            yield buf.getvalue().encode("utf-8")
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Сжимает поток на лету (gzip-контейнер, wbits=31), не накапливая его целиком."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
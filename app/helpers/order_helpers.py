@@ -1,20 +1,41 @@
+import base64
+import json
 import os
+from datetime import datetime
 from typing import List, Sequence, Tuple, Optional
 from fastapi import HTTPException
-from sqlalchemy import select, func, asc, desc
+from sqlalchemy import select, func, asc, desc, tuple_, literal
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.orm import selectinload, noload
 
 from app.models.models import Order, OrderItem, Product, User
 from app.delivery.yandex import YandexDeliveryClient
+from app.helpers.analytics_helpers import (
+    EMPTY_SNAPSHOT,
+    apply_sales_delta,
+    order_sales_snapshot,
+)
+from app.helpers.stock_helpers import (
+    adjust_order_stock,
+    apply_order_status_to_stock,
+    release_order_stock,
+    reserve_order_stock,
+)
 from app.logging_config import app_logger
 
 async def _order_with_items_query(order_id: int):
+    """
+    Заказ с позициями и товарами — ровно то, что нужно OrderOut.
+    Пользователь и QR товара не грузим: их selectin-связи тянут весь граф.
+    Хелперы-мутации возвращают этот же объект после commit (expire_on_commit=False),
+    без повторного чтения.
+    """
     return (
         select(Order)
         .where(Order.id == order_id)
         .options(
-            selectinload(Order.items).selectinload(OrderItem.product)
+            noload(Order.user),
+            selectinload(Order.items).selectinload(OrderItem.product).noload(Product.qr),
         )
     )
 
@@ -68,6 +89,50 @@ async def list_orders_for_user(
     )
     return (await db.execute(q)).scalars().all()
 
+ORDER_SORTS = {
+    # sort -> (колонка ключа, направление); второй ключ всегда Order.id
+    "total_asc": ("total_amount", "asc"),
+    "total_desc": ("total_amount", "desc"),
+    "created_asc": ("created_at", "asc"),
+    "created_desc": ("created_at", "desc"),
+}
+
+def encode_order_cursor(order: Order, sort: Optional[str]) -> str:
+    """Курсор = последняя строка страницы: (значение ключа сортировки, id)."""
+    key = ORDER_SORTS.get(sort or "")
+    value = getattr(order, key[0]) if key else None
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, order.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_order_cursor(cursor: str, sort: Optional[str]) -> Tuple[object, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, last_id = json.loads(raw)
+        key = ORDER_SORTS.get(sort or "")
+        if key and key[0] == "created_at":
+            value = datetime.fromisoformat(value)
+        return value, int(last_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _filter_orders(stmt, email: Optional[str] = None, statuses: Optional[str] = None):
+    """Общие фильтры админского списка заказов (email по подстроке, статусы через запятую)."""
+    if email:
+        email_like = f"%{email.strip().lower()}%"
+        # полусоединение вместо join: строки заказов не размножаются,
+        # ilike обслуживает trigram-индекс ix_users_email_trgm
+        stmt = stmt.where(
+            Order.user_id.in_(select(User.id).where(User.email.ilike(email_like)))
+        )
+
+    if statuses:
+        values = [s.strip() for s in statuses.split(",") if s.strip()]
+        if values:
+            stmt = stmt.where(Order.status.in_(values))
+    return stmt
+
 async def list_all_orders(
     db: AsyncSession,
     limit: int = 50,
@@ -75,42 +140,43 @@ async def list_all_orders(
     email: Optional[str] = None,
     statuses: Optional[str] = None,
     sort: Optional[str] = None,
+    cursor: Optional[str] = None,
 ) -> List[Order]:
-    stmt = (
-        select(Order)
-        .options(
-            joinedload(Order.user),
-            joinedload(Order.items),
-        )
+    """
+    Админский список заказов. С cursor — keyset-пагинация по (ключ сортировки, id),
+    которую обслуживают составные индексы ix_orders_*_id; offset оставлен для совместимости.
+    Позиции подгружаются отдельным selectin-батчем, без join'а коллекции.
+    """
+    stmt = _filter_orders(
+        select(Order).options(
+            # OrderOut не содержит пользователя, а его selectin-связи тянут весь граф
+            noload(Order.user),
+            selectinload(Order.items).selectinload(OrderItem.product),
+        ),
+        email=email,
+        statuses=statuses,
     )
 
-    # фильтр по email
-    if email:
-        email_like = f"%{email.strip().lower()}%"
-        # join с User
-        stmt = stmt.join(User, User.id == Order.user_id)
-        stmt = stmt.where(User.email.ilike(email_like))
-
-    if statuses:
-        values = [s.strip() for s in statuses.split(",") if s.strip()]
-        if values:
-            stmt = stmt.where(Order.status.in_(values))
-
-    if sort == "total_asc":
-        stmt = stmt.order_by(asc(Order.total_amount if hasattr(Order, "total_amount") else Order.total_price))
-    elif sort == "total_desc":
-        stmt = stmt.order_by(desc(Order.total_amount if hasattr(Order, "total_amount") else Order.total_price))
-    elif sort == "created_asc":
-        stmt = stmt.order_by(asc(Order.created_at))  # поле подгони, если называется иначе
-    elif sort == "created_desc":
-        stmt = stmt.order_by(desc(Order.created_at))
+    key = ORDER_SORTS.get(sort or "")
+    if key:
+        column = getattr(Order, key[0])
+        order = asc if key[1] == "asc" else desc
+        stmt = stmt.order_by(order(column), order(Order.id))
+        if cursor:
+            value, last_id = decode_order_cursor(cursor, sort)
+            row, bound = tuple_(column, Order.id), tuple_(literal(value), literal(last_id))
+            stmt = stmt.where(row > bound if key[1] == "asc" else row < bound)
     else:
         stmt = stmt.order_by(desc(Order.id))
+        if cursor:
+            _, last_id = decode_order_cursor(cursor, sort)
+            stmt = stmt.where(Order.id < last_id)
 
-    stmt = stmt.limit(limit).offset(offset)
+    stmt = stmt.limit(limit)
+    if not cursor:
+        stmt = stmt.offset(offset)
     result = await db.execute(stmt)
-    rows = result.scalars().unique().all()
-    return rows
+    return result.scalars().all()
 
 async def create_order(
     db: AsyncSession, requester: User, items: List[Tuple[int, int]],
@@ -122,6 +188,10 @@ async def create_order(
 ) -> Order:
     """
     items: список (product_id, quantity). Создаёт заказ пользователя и позиции.
+
+    Две короткие транзакции: (1) заказ + резерв остатка — commit до запроса в Яндекс,
+    чтобы блокировки строк products не держались на время сетевого вызова;
+    (2) результат доставки, при отказе — возврат резерва.
     """
     if not items:
         raise HTTPException(status_code=400, detail="Items required")
@@ -134,7 +204,9 @@ async def create_order(
 
     product_ids = list(merged.keys())
     products = (
-        await db.execute(select(Product).where(Product.id.in_(product_ids)))
+        await db.execute(
+            select(Product).where(Product.id.in_(product_ids)).options(noload(Product.qr))
+        )
     ).scalars().all()
     if len(products) != len(product_ids):
         existing_ids = {p.id for p in products}
@@ -147,7 +219,8 @@ async def create_order(
         user_id=requester.id, status="pending", total_amount=0,
         contact_info=contact_info, country=country, city=city,
         first_name=first_name, last_name=last_name, 
-        delivery_address=delivery_address, zip_code=zip_code
+        delivery_address=delivery_address, zip_code=zip_code,
+        items=[],  # коллекция сразу «загружена» — вернём заказ без перечитывания
     )
     db.add(order)
     await db.flush()
@@ -157,7 +230,7 @@ async def create_order(
     for pid, qty in merged.items():
         prod = product_map[pid]
         item_amount = qty * (prod.price or 0)
-        db.add(OrderItem(order_id=order.id, product_id=pid, quantity=qty, amount=item_amount))
+        order.items.append(OrderItem(product_id=pid, product=prod, quantity=qty, amount=item_amount))
         total += item_amount
         
         # Подготовка данных для Яндекса (футболка по умолчанию)
@@ -168,6 +241,13 @@ async def create_order(
         })
 
     order.total_amount = total
+    # резерв и роллапы последними: их строки заблокированы только до этого commit.
+    # Порядок как у админских правок: сначала товары, потом роллапы
+    await reserve_order_stock(db, order.id, merged)
+    await apply_sales_delta(db, EMPTY_SNAPSHOT, order_sales_snapshot(order))
+    await db.commit()
+
+    before = order_sales_snapshot(order)
 
     # Логика Яндекс Доставки (всегда включена по умолчанию)
     if True: 
@@ -272,9 +352,10 @@ async def create_order(
             order.yandex_error = f"Системная ошибка: {str(e)}"
             order.status = "cancelled"  # Неизвестная ошибка — тоже в отказ
 
+    if order.status == "cancelled":
+        await release_order_stock(db, [order.id])
+    await apply_sales_delta(db, before, order_sales_snapshot(order))
     await db.commit()
-
-    order = (await db.execute(await _order_with_items_query(order.id))).scalars().first()
     return order
 
 async def admin_add_item_to_order(
@@ -294,6 +375,10 @@ async def admin_add_item_to_order(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
+    # остаток — до изменения позиций: при нехватке reserve_stock откатывает сессию (409)
+    await adjust_order_stock(db, order.id, order.status, {product_id: quantity})
+
+    before = order_sales_snapshot(order)
     existing_item = next((it for it in order.items if it.product_id == product_id), None)
 
     if existing_item:
@@ -303,13 +388,12 @@ async def admin_add_item_to_order(
     else:
         # Новая позиция: фиксируем цену "сейчас"
         amount = quantity * (product.price or 0)
-        db.add(OrderItem(order_id=order.id, product_id=product_id, quantity=quantity, amount=amount))
+        order.items.append(OrderItem(product_id=product_id, product=product, quantity=quantity, amount=amount))
 
     await db.flush()
     await recompute_order_total(db, order)
+    await apply_sales_delta(db, before, order_sales_snapshot(order))
     await db.commit()
-
-    order = (await db.execute(await _order_with_items_query(order_id))).scalars().first()
     return order
 
 async def admin_update_order_item_quantity(
@@ -329,12 +413,14 @@ async def admin_update_order_item_quantity(
     if not target:
         raise HTTPException(status_code=404, detail="Order item not found")
 
+    await adjust_order_stock(db, order.id, order.status, {target.product_id: quantity - target.quantity})
+
+    before = order_sales_snapshot(order)
     set_item_quantity_preserving_unit_price(target, quantity)
     await db.flush()
     await recompute_order_total(db, order)
+    await apply_sales_delta(db, before, order_sales_snapshot(order))
     await db.commit()
-
-    order = (await db.execute(await _order_with_items_query(order_id))).scalars().first()
     return order
 
 async def admin_remove_item_from_order(
@@ -352,12 +438,15 @@ async def admin_remove_item_from_order(
     if not target:
         raise HTTPException(status_code=404, detail="Order item not found")
 
-    await db.delete(target)
+    await adjust_order_stock(db, order.id, order.status, {target.product_id: -target.quantity})
+
+    before = order_sales_snapshot(order)
+    # удаляем через коллекцию (delete-orphan), чтобы order.items сразу был актуален
+    order.items.remove(target)
     await db.flush()
     await recompute_order_total(db, order)
+    await apply_sales_delta(db, before, order_sales_snapshot(order))
     await db.commit()
-
-    order = (await db.execute(await _order_with_items_query(order_id))).scalars().first()
     return order
 
 async def admin_delete_order(
@@ -367,10 +456,12 @@ async def admin_delete_order(
     if not requester.is_superuser:
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    order = await db.get(Order, order_id)
+    order = (await db.execute(await _order_with_items_query(order_id))).scalars().first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
+    await release_order_stock(db, [order.id])
+    await apply_sales_delta(db, order_sales_snapshot(order), EMPTY_SNAPSHOT)
     await db.delete(order)
     await db.commit()
 
@@ -394,10 +485,11 @@ async def admin_update_order_status(
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
+    before = order_sales_snapshot(order)
+    await apply_order_status_to_stock(db, order, order.status, status)
     order.status = status
+    await apply_sales_delta(db, before, order_sales_snapshot(order))
     await db.commit()
-
-    order = (await db.execute(await _order_with_items_query(order_id))).scalars().first()
     return order
 
 async def admin_update_order_delivery(
@@ -416,8 +508,6 @@ async def admin_update_order_delivery(
             setattr(order, key, value)
             
     await db.commit()
-
-    order = (await db.execute(await _order_with_items_query(order_id))).scalars().first()
     return order
 
 
@@ -0,0 +1,428 @@
+import asyncio
+import ipaddress
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, String, column, delete, func, or_, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
+
+from app.database import async_session
+from app.logging_config import app_logger
+from app.models.models import Order, PaymentEvent, StockReservation, User
+from app.helpers.stock_helpers import STOCK_CONSUMED_STATUSES
+from app.payments.yookassa import YooKassaClient, YooKassaError, get_yookassa_client
+
+PAYMENT_RETURN_URL = os.getenv("PAYMENT_RETURN_URL", "http://localhost:5173/payment/success")
+PAYMENT_EVENTS_BATCH_SIZE = int(os.getenv("PAYMENT_EVENTS_BATCH_SIZE", "200"))
+PAYMENT_FETCH_CONCURRENCY = int(os.getenv("PAYMENT_FETCH_CONCURRENCY", "10"))
+PAYMENT_EVENTS_INTERVAL_SECONDS = float(os.getenv("PAYMENT_EVENTS_INTERVAL_SECONDS", "5"))
+
+PAYMENT_EVENTS = {"payment.waiting_for_capture", "payment.succeeded", "payment.canceled"}
+
+# адреса, с которых YooKassa шлёт уведомления (https://yookassa.ru/developers/using-api/webhooks)
+YOOKASSA_WEBHOOK_NETWORKS = [
+    ipaddress.ip_network(net.strip())
+    for net in os.getenv(
+        "YOOKASSA_WEBHOOK_NETWORKS",
+        "185.71.76.0/27,185.71.77.0/27,77.75.153.0/25,77.75.156.11/32,"
+        "77.75.156.35/32,77.75.154.128/25,2a02:5180::/32",
+    ).split(",")
+    if net.strip()
+]
+
+# будит payment_events_loop сразу после вебхука, не дожидаясь интервала
+_events_wakeup = asyncio.Event()
+
+
+def webhook_source_allowed(host: Optional[str], forwarded_for: Optional[str] = None) -> bool:
+    """
+    Первый рубеж проверки вебхука — адрес отправителя. Тело события всё равно
+    не считается правдой: статус платежа перечитывается из API при применении.
+    """
+    if os.getenv("YOOKASSA_WEBHOOK_CHECK_IP", "1").lower() in ("0", "false", "no"):
+        return True
+    if forwarded_for and os.getenv("YOOKASSA_WEBHOOK_TRUST_FORWARDED", "").lower() in ("1", "true", "yes"):
+        host = forwarded_for.split(",")[0].strip()
+    try:
+        addr = ipaddress.ip_address(host or "")
+    except ValueError:
+        return False
+    return any(addr in net for net in YOOKASSA_WEBHOOK_NETWORKS)
+
+
+def _amount_rub(payment: dict) -> Optional[int]:
+    try:
+        value = Decimal(str((payment.get("amount") or {}).get("value")))
+    except (InvalidOperation, TypeError):
+        return None
+    return int(value) if value == value.to_integral_value() else None
+
+
+async def create_payment_for_order(
+    db: AsyncSession, requester: User, order_id: int, *, client: Optional[YooKassaClient] = None
+) -> dict:
+    """
+    Платёж за заказ пользователя. Сумма берётся из заказа, не из запроса.
+    Пока прошлый платёж не завершён, возвращается он же; Idempotence-Key привязан
+    к попытке (order-<id>-<прошлый payment_id>), так что параллельные запросы
+    не создают второй платёж.
+    """
+    client = client or get_yookassa_client()
+    order = await db.scalar(
+        select(Order)
+        .where(Order.id == order_id, Order.user_id == requester.id)
+        .options(noload(Order.user), noload(Order.items))
+    )
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if order.status != "pending":
+        raise HTTPException(status_code=409, detail="Order is not awaiting payment")
+    # транзакцию закрываем до сетевых вызовов
+    await db.commit()
+
+    try:
+        if order.payment_id and order.payment_status in (None, "pending"):
+            payment = await client.get_payment(order.payment_id)
+            if payment.get("status") == "pending":
+                return {
+                    "payment_id": payment["id"],
+                    "redirect_url": (payment.get("confirmation") or {}).get("confirmation_url"),
+                }
+            if payment.get("status") in ("waiting_for_capture", "succeeded"):
+                raise HTTPException(status_code=409, detail="Order is already paid")
+
+        payment = await client.create_payment(
+            amount_rub=order.total_amount or 0,
+            order_id=order.id,
+            user_id=requester.id,
+            return_url=PAYMENT_RETURN_URL,
+            idempotence_key=f"order-{order.id}-{order.payment_id or 'new'}",
+        )
+    except YooKassaError as e:
+        raise HTTPException(status_code=502, detail={"error": "payment_gateway", "msg": str(e)})
+
+    order.payment_id = payment["id"]
+    order.payment_status = payment.get("status")
+    await db.commit()
+    return {
+        "payment_id": payment["id"],
+        "redirect_url": (payment.get("confirmation") or {}).get("confirmation_url"),
+    }
+
+
+async def record_payment_event(db: AsyncSession, body: dict) -> bool:
+    """
+    Принять уведомление: одна строка на (payment_id, event), повторы отбрасываются
+    на INSERT ... ON CONFLICT DO NOTHING. Применяет их payment_events_loop пачками.
+    Возвращает False для дубликатов и событий, которые нам не нужны.
+    """
+    if not isinstance(body, dict) or body.get("type") != "notification":
+        raise HTTPException(status_code=400, detail="Malformed notification")
+    obj, event = body.get("object"), body.get("event")
+    if not isinstance(obj, dict) or not obj.get("id") or not event:
+        raise HTTPException(status_code=400, detail="Malformed notification")
+    if event not in PAYMENT_EVENTS:
+        return False
+
+    order_id = (obj.get("metadata") or {}).get("order_id")
+    stmt = (
+        insert(PaymentEvent)
+        .values(
+            payment_id=str(obj["id"]),
+            event=event,
+            order_id=int(order_id) if str(order_id or "").isdigit() else None,
+            received_at=datetime.utcnow(),
+        )
+        .on_conflict_do_nothing(index_elements=[PaymentEvent.payment_id, PaymentEvent.event])
+        .returning(PaymentEvent.payment_id)
+    )
+    inserted = (await db.execute(stmt)).first() is not None
+    await db.commit()
+    if inserted:
+        _events_wakeup.set()
+    return inserted
+
+
+async def fetch_payments(
+    payment_ids: Iterable[str],
+    *,
+    client: Optional[YooKassaClient] = None,
+    concurrency: int = PAYMENT_FETCH_CONCURRENCY,
+) -> Tuple[Dict[str, dict], Set[str]]:
+    """
+    Перечитать платежи из API параллельно, не больше concurrency запросов сразу.
+    Возвращает (найденные, отсутствующие в YooKassa); временные ошибки — ни туда, ни туда.
+    """
+    client = client or get_yookassa_client()
+    sem = asyncio.Semaphore(concurrency)
+    found: Dict[str, dict] = {}
+    missing: Set[str] = set()
+
+    async def _one(payment_id: str) -> None:
+        async with sem:
+            try:
+                found[payment_id] = await client.get_payment(payment_id)
+            except YooKassaError as e:
+                if e.status_code == 404:
+                    missing.add(payment_id)
+                else:
+                    app_logger.warning(f"Payment {payment_id} fetch failed: {e}")
+
+    await asyncio.gather(*(_one(pid) for pid in set(payment_ids)))
+    return found, missing
+
+
+class PaymentTransition(NamedTuple):
+    order_id: int
+    payment_id: str
+    payment_status: Tuple[Optional[str], str]
+    status: Tuple[str, str]
+    note: Optional[str] = None
+
+
+async def apply_payment_states(
+    db: AsyncSession, payments: Iterable[dict], *, dry_run: bool = False
+) -> List[PaymentTransition]:
+    """
+    Применить подтверждённые API статусы платежей к заказам пачкой:
+    один SELECT, UPDATE ... FROM (VALUES) для payment_status и один UPDATE
+    pending → paid (с проверкой суммы), резервы оплаченных заказов снимаются одним DELETE.
+    dry_run — только посчитать переходы. Не коммитит.
+    pending → paid не меняет роллапы продаж: оба статуса уже считаются выручкой.
+    """
+    by_id = {str(p["id"]): p for p in payments if p.get("id") and p.get("status")}
+    if not by_id:
+        return []
+
+    rows = (
+        await db.execute(
+            select(Order.id, Order.payment_id, Order.status, Order.payment_status, Order.total_amount)
+            .where(Order.payment_id.in_(list(by_id)))
+        )
+    ).all()
+
+    transitions: List[PaymentTransition] = []
+    paid_ids: List[int] = []
+    for order_id, payment_id, status, payment_status, total in rows:
+        payment = by_id[payment_id]
+        new_payment_status = payment["status"]
+        new_status, note = status, None
+        meta_order = str((payment.get("metadata") or {}).get("order_id", order_id))
+        if meta_order != str(order_id):
+            note = "metadata order_id mismatch"
+        elif new_payment_status == "succeeded":
+            if _amount_rub(payment) != (total or 0):
+                note = "amount mismatch"
+            elif status == "pending":
+                new_status = "paid"
+                paid_ids.append(order_id)
+            elif status not in STOCK_CONSUMED_STATUSES:
+                # например, резерв истёк и заказ отменён, а деньги всё-таки пришли
+                note = f"payment succeeded for {status} order"
+        if note:
+            app_logger.warning(f"Payment {payment_id} for order {order_id}: {note}")
+        if note or new_payment_status != payment_status or new_status != status:
+            transitions.append(PaymentTransition(
+                order_id, payment_id, (payment_status, new_payment_status), (status, new_status), note,
+            ))
+
+    if dry_run:
+        return transitions
+
+    status_updates = [
+        (t.order_id, t.payment_status[1]) for t in transitions
+        if t.payment_status[0] != t.payment_status[1] and t.note != "metadata order_id mismatch"
+    ]
+    if status_updates:
+        v = values(column("order_id", Integer), column("payment_status", String), name="v").data(
+            sorted(status_updates)
+        )
+        await db.execute(
+            update(Order)
+            .where(Order.id == v.c.order_id)
+            .values(payment_status=v.c.payment_status)
+            .execution_options(synchronize_session=False)
+        )
+    if paid_ids:
+        # status = 'pending' ещё раз в WHERE: заказ мог смениться между SELECT и UPDATE
+        paid = (
+            await db.execute(
+                update(Order)
+                .where(Order.id.in_(paid_ids), Order.status == "pending")
+                .values(status="paid")
+                .returning(Order.id)
+                .execution_options(synchronize_session=False)
+            )
+        ).scalars().all()
+        if paid:
+            await db.execute(delete(StockReservation).where(StockReservation.order_id.in_(paid)))
+    return transitions
+
+
+async def process_payment_events(
+    db: AsyncSession, *, client: Optional[YooKassaClient] = None, limit: int = PAYMENT_EVENTS_BATCH_SIZE
+) -> int:
+    """
+    Применить пачку необработанных уведомлений. Статус каждого платежа перечитывается
+    из API (тело вебхука не доверяем), запросы идут вне транзакции.
+    Платежи, которые не удалось перечитать, остаются в очереди до следующего прохода.
+    Возвращает число разобранных платежей.
+    """
+    payment_ids = (
+        await db.execute(
+            select(PaymentEvent.payment_id)
+            .where(PaymentEvent.processed_at.is_(None))
+            .order_by(PaymentEvent.received_at)
+            .limit(limit)
+        )
+    ).scalars().all()
+    await db.commit()
+    if not payment_ids:
+        return 0
+
+    found, missing = await fetch_payments(payment_ids, client=client)
+    await apply_payment_states(db, found.values())
+    done = set(found) | missing
+    if done:
+        await db.execute(
+            update(PaymentEvent)
+            .where(PaymentEvent.payment_id.in_(done), PaymentEvent.processed_at.is_(None))
+            .values(processed_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    return len(done)
+
+
+async def payment_events_loop(interval_seconds: float = PAYMENT_EVENTS_INTERVAL_SECONDS) -> None:
+    """
+    Фоновая задача (стартует в lifespan): разбирает очередь уведомлений YooKassa.
+    Просыпается по вебхуку этого воркера или раз в interval_seconds (события других воркеров).
+    """
+    while True:
+        try:
+            await asyncio.wait_for(_events_wakeup.wait(), timeout=interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+        _events_wakeup.clear()
+        # короткое окно, чтобы собрать всплеск уведомлений в одну пачку
+        await asyncio.sleep(0.2)
+        try:
+            while True:
+                async with async_session() as session:
+                    done = await process_payment_events(session)
+                if done < PAYMENT_EVENTS_BATCH_SIZE:
+                    break
+        except Exception as e:
+            app_logger.error(f"Payment events processing failed: {e}")
+
+
+# ---------- сверка платежей (если вебхук потерялся) ----------
+
+PAYMENT_RECONCILE_PAGE_SIZE = int(os.getenv("PAYMENT_RECONCILE_PAGE_SIZE", "200"))
+# заказы моложе этого не трогаем: вебхук, скорее всего, ещё в пути
+PAYMENT_RECONCILE_MIN_AGE = timedelta(minutes=int(os.getenv("PAYMENT_RECONCILE_MIN_AGE_MINUTES", "10")))
+# ключ pg advisory lock: сверка идёт в одном воркере
+PAYMENT_RECONCILE_LOCK_KEY = 72_034_001
+UNSETTLED_PAYMENT_STATUSES = ("pending", "waiting_for_capture")
+
+
+class ReconcileReport(NamedTuple):
+    dry_run: bool
+    scanned: int
+    fetched: int
+    missing: List[str]
+    failed: List[str]
+    changes: List[PaymentTransition]
+
+
+async def reconcile_payments(
+    db: AsyncSession,
+    *,
+    dry_run: bool = False,
+    page_size: int = PAYMENT_RECONCILE_PAGE_SIZE,
+    concurrency: int = PAYMENT_FETCH_CONCURRENCY,
+    min_age: timedelta = PAYMENT_RECONCILE_MIN_AGE,
+    client: Optional[YooKassaClient] = None,
+) -> ReconcileReport:
+    """
+    Пройти по неоплаченным заказам с payment_id (keyset по id, частичный индекс
+    ix_orders_pending_payment), перечитать их платежи параллельно (не больше concurrency)
+    и применить изменения пачкой на страницу. dry_run — только отчёт, без записи.
+    Запросы в YooKassa идут вне транзакции.
+    """
+    cutoff = datetime.utcnow() - min_age
+    scanned = fetched = 0
+    missing: List[str] = []
+    failed: List[str] = []
+    changes: List[PaymentTransition] = []
+    last_id = 0
+
+    while True:
+        page = (
+            await db.execute(
+                select(Order.id, Order.payment_id)
+                .where(
+                    Order.status == "pending",
+                    Order.payment_id.is_not(None),
+                    or_(Order.payment_status.is_(None), Order.payment_status.in_(UNSETTLED_PAYMENT_STATUSES)),
+                    Order.created_at < cutoff,
+                    Order.id > last_id,
+                )
+                .order_by(Order.id)
+                .limit(page_size)
+            )
+        ).all()
+        await db.commit()
+        if not page:
+            break
+        last_id = page[-1][0]
+        payment_ids = [pid for _, pid in page]
+        scanned += len(page)
+
+        found, gone = await fetch_payments(payment_ids, client=client, concurrency=concurrency)
+        fetched += len(found)
+        missing.extend(sorted(gone))
+        failed.extend(sorted(set(payment_ids) - set(found) - gone))
+
+        changes.extend(await apply_payment_states(db, found.values(), dry_run=dry_run))
+        if not dry_run:
+            await db.commit()
+        if len(page) < page_size:
+            break
+
+    report = ReconcileReport(dry_run, scanned, fetched, missing, failed, changes)
+    app_logger.info(
+        f"Payment reconcile{' (dry run)' if dry_run else ''}: scanned={scanned} fetched={fetched} "
+        f"changes={len(changes)} missing={len(missing)} failed={len(failed)}"
+    )
+    return report
+
+
+async def payment_reconcile_loop() -> None:
+    """
+    Фоновая задача (стартует в lifespan): раз в PAYMENT_RECONCILE_INTERVAL_MINUTES
+    сверяет зависшие заказы с YooKassa. Advisory lock — одна сверка на кластер.
+    """
+    interval = int(os.getenv("PAYMENT_RECONCILE_INTERVAL_MINUTES", "15")) * 60
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with async_session() as lock_session:
+                locked = await lock_session.scalar(
+                    select(func.pg_try_advisory_lock(PAYMENT_RECONCILE_LOCK_KEY))
+                )
+                if not locked:
+                    continue
+                try:
+                    async with async_session() as session:
+                        await reconcile_payments(session)
+                finally:
+                    await lock_session.scalar(select(func.pg_advisory_unlock(PAYMENT_RECONCILE_LOCK_KEY)))
+        except Exception as e:
+            app_logger.error(f"Payment reconcile failed: {e}")
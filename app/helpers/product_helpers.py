@@ -72,6 +72,7 @@ async def create_product(
     description: Optional[str],
     image_file: UploadFile,
     price: int,  # <-- новое поле
+    stock: Optional[int] = None,
 ) -> Product:
     if not requester.is_superuser:
         raise HTTPException(status_code=403, detail="Forbidden")
@@ -94,6 +95,7 @@ async def create_product(
         description=description,
         qr_id=qr.id,
         price=price,
+        stock=stock,
     )
     db.add(product)
     await db.flush()
@@ -105,7 +107,6 @@ async def create_product(
 
     product.img_url = f"{_s3_public_base()}/{object_key}"
     await db.commit()
-    await db.refresh(product)
     return product
 
 async def update_product_meta(
@@ -138,7 +139,6 @@ async def update_product_meta(
         product.price = price  # существующие заказы не трогаем
 
     await db.commit()
-    await db.refresh(product)
     return product
 
 async def replace_product_image(
@@ -164,7 +164,6 @@ async def replace_product_image(
 
     product.img_url = f"{_s3_public_base()}/{object_key}"
     await db.commit()
-    await db.refresh(product)
     return product
 
 async def delete_product(
@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Sequence, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, String, column, func, select, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_session
+from app.helpers.moderation import BadWordMatcher, normalize_bad_word
+from app.helpers.review_helpers import invalidate_review_feed
+from app.logging_config import app_logger
+from app.models.models import BadWord, ModerationScan, Review
+
+SCAN_MODES = ("flag", "unflag", "full")
+REMODERATION_CHUNK_SIZE = int(os.getenv("REMODERATION_CHUNK_SIZE", "1000"))
+# с какого объёма отзывов матчинг уходит в пул процессов (меньше — хватает потока)
+REMODERATION_POOL_MIN_ROWS = int(os.getenv("REMODERATION_POOL_MIN_ROWS", "50000"))
+REMODERATION_WORKERS = int(os.getenv("REMODERATION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# ключ pg advisory lock: прогоны идут в одном воркере и по очереди
+REMODERATION_LOCK_KEY = 72_036_001
+
+_scans_wakeup = asyncio.Event()
+
+# ---------- матчинг (в том числе в дочерних процессах) ----------
+
+_worker_matcher: Optional[BadWordMatcher] = None
+
+
+def _init_worker(words: List[str]) -> None:
+    global _worker_matcher
+    _worker_matcher = BadWordMatcher(words)
+
+
+def _match_rows(matcher: BadWordMatcher, rows: Sequence[Tuple[int, str]]) -> List[int]:
+    return [review_id for review_id, content in rows if matcher.matches(content)]
+
+
+def _match_rows_in_worker(rows: Sequence[Tuple[int, str]]) -> List[int]:
+    return _match_rows(_worker_matcher, rows)
+
+
+# ---------- очередь прогонов ----------
+
+async def enqueue_remoderation(db: AsyncSession, mode: str, words: Optional[List[str]] = None) -> ModerationScan:
+    """Поставить прогон в очередь (коммитит) и разбудить remoderation_loop."""
+    if mode not in SCAN_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported scan mode '{mode}'")
+    if mode == "flag":
+        words = sorted({normalize_bad_word(w) for w in words or [] if normalize_bad_word(w)})
+        if not words:
+            raise HTTPException(status_code=400, detail="Words are required for flag scan")
+    scan = ModerationScan(
+        mode=mode,
+        words=json.dumps(words, ensure_ascii=False) if mode == "flag" else None,
+        status="pending",
+        last_review_id=0,
+        scanned=0,
+        flagged=0,
+        unflagged=0,
+    )
+    db.add(scan)
+    await db.commit()
+    _scans_wakeup.set()
+    return scan
+
+
+async def resume_remoderation(db: AsyncSession, scan_id: int) -> ModerationScan:
+    """Вернуть упавший прогон в очередь; продолжится с last_review_id."""
+    scan = await db.get(ModerationScan, scan_id)
+    if not scan:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    if scan.status == "done":
+        raise HTTPException(status_code=409, detail="Scan is already finished")
+    scan.status = "pending"
+    scan.error = None
+    await db.commit()
+    _scans_wakeup.set()
+    return scan
+
+
+async def list_remoderation_scans(db: AsyncSession, limit: int = 20) -> Sequence[ModerationScan]:
+    return (
+        await db.execute(select(ModerationScan).order_by(ModerationScan.id.desc()).limit(limit))
+    ).scalars().all()
+
+
+# ---------- сам прогон ----------
+
+def _scan_filter(mode: str):
+    # отзывы, которые админ одобрил или отклонил вручную, не пересматриваются
+    manual = Review.moderation_override.is_(None)
+    # unflag смотрит только помеченные отзывы (частичный индекс по is_flagged)
+    return (Review.is_flagged, manual) if mode == "unflag" else (manual,)
+
+
+async def _set_flags(session: AsyncSession, rows: Sequence[Tuple[int, str]], is_flagged: bool) -> int:
+    """
+    Поставить/снять флаг по (id, content), прочитанным до матчинга. Пока пачка матчилась,
+    админ мог вынести решение, а автор — поправить текст: такие отзывы не трогаем
+    (override в WHERE и md5 текста против того, что видел матчер). Возвращает число изменённых.
+    """
+    v = values(column("id", Integer), column("content_md5", String), name="v").data(
+        [(review_id, hashlib.md5(content.encode("utf-8")).hexdigest()) for review_id, content in rows]
+    )
+    changed = await session.execute(
+        update(Review)
+        .where(
+            Review.id == v.c.id,
+            func.md5(Review.content) == v.c.content_md5,
+            Review.moderation_override.is_(None),
+            Review.is_flagged.is_(not is_flagged),
+        )
+        .values(is_flagged=is_flagged)
+        .returning(Review.id)
+        .execution_options(synchronize_session=False)
+    )
+    return len(changed.all())
+
+
+async def run_remoderation_scan(scan_id: int, chunk_size: int = REMODERATION_CHUNK_SIZE) -> None:
+    """
+    Пройти отзывы по id пачками (keyset, id > last_review_id), прогнать матчер
+    и записать изменения флагов двумя UPDATE на пачку. Прогресс коммитится вместе
+    с флагами. Большие таблицы матчатся в пуле процессов.
+    """
+    async with async_session() as session:
+        scan = await session.get(ModerationScan, scan_id)
+        if scan.mode == "flag":
+            words = json.loads(scan.words or "[]")
+        else:
+            words = (await session.execute(select(BadWord.word))).scalars().all()
+        scan.status = "running"
+        scan.started_at = scan.started_at or datetime.utcnow()
+        scan.total = await session.scalar(
+            select(func.count(Review.id)).where(*_scan_filter(scan.mode))
+        )
+        mode, last_id, total = scan.mode, scan.last_review_id, scan.total
+        await session.commit()
+
+    executor: Optional[ProcessPoolExecutor] = None
+    matcher = BadWordMatcher(words)
+    if total - scan.scanned >= REMODERATION_POOL_MIN_ROWS and REMODERATION_WORKERS > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=REMODERATION_WORKERS,
+            # spawn: форк процесса с запущенным event loop и пулом соединений небезопасен
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(list(matcher.words),),
+        )
+    loop = asyncio.get_running_loop()
+
+    async def _matched(rows: Sequence[Tuple[int, str]]) -> Set[int]:
+        if executor is None:
+            return set(await asyncio.to_thread(_match_rows, matcher, rows))
+        step = -(-len(rows) // REMODERATION_WORKERS)
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(executor, _match_rows_in_worker, rows[i:i + step])
+            for i in range(0, len(rows), step)
+        ))
+        return {review_id for part in parts for review_id in part}
+
+    try:
+        while True:
+            async with async_session() as session:
+                rows = (
+                    await session.execute(
+                        select(Review.id, Review.content, Review.is_flagged)
+                        .where(Review.id > last_id, *_scan_filter(mode))
+                        .order_by(Review.id)
+                        .limit(chunk_size)
+                    )
+                ).all()
+                if not rows:
+                    break
+
+                matched = await _matched([(r.id, r.content) for r in rows])
+                to_flag = [
+                    (r.id, r.content) for r in rows if r.id in matched and not r.is_flagged
+                ] if mode != "unflag" else []
+                to_unflag = [
+                    (r.id, r.content) for r in rows if r.is_flagged and r.id not in matched
+                ] if mode != "flag" else []
+                flagged = await _set_flags(session, to_flag, True) if to_flag else 0
+                unflagged = await _set_flags(session, to_unflag, False) if to_unflag else 0
+
+                last_id = rows[-1].id
+                await session.execute(
+                    update(ModerationScan)
+                    .where(ModerationScan.id == scan_id)
+                    .values(
+                        last_review_id=last_id,
+                        scanned=ModerationScan.scanned + len(rows),
+                        flagged=ModerationScan.flagged + flagged,
+                        unflagged=ModerationScan.unflagged + unflagged,
+                        updated_at=datetime.utcnow(),
+                    )
+                )
+                await session.commit()
+            if flagged or unflagged:
+                invalidate_review_feed()
+            if len(rows) < chunk_size:
+                break
+    except Exception as e:
+        async with async_session() as session:
+            await session.execute(
+                update(ModerationScan).where(ModerationScan.id == scan_id)
+                .values(status="failed", error=str(e)[:2000], updated_at=datetime.utcnow())
+            )
+            await session.commit()
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    async with async_session() as session:
+        await session.execute(
+            update(ModerationScan).where(ModerationScan.id == scan_id)
+            .values(status="done", finished_at=datetime.utcnow(), updated_at=datetime.utcnow())
+        )
+        await session.commit()
+
+
+async def run_pending_remoderation_scans() -> int:
+    """Выполнить очередь прогонов (pending и прерванные running) по порядку."""
+    done = 0
+    async with async_session() as lock_session:
+        locked = await lock_session.scalar(select(func.pg_try_advisory_lock(REMODERATION_LOCK_KEY)))
+        if not locked:
+            return 0
+        try:
+            while True:
+                async with async_session() as session:
+                    scan_id = await session.scalar(
+                        select(ModerationScan.id)
+                        .where(ModerationScan.status.in_(("pending", "running")))
+                        .order_by(ModerationScan.id)
+                        .limit(1)
+                    )
+                if scan_id is None:
+                    return done
+                await run_remoderation_scan(scan_id)
+                app_logger.info(f"Moderation scan {scan_id} finished")
+                done += 1
+        finally:
+            await lock_session.scalar(select(func.pg_advisory_unlock(REMODERATION_LOCK_KEY)))
+
+
+async def remoderation_loop(interval_seconds: int = 60) -> None:
+    """
+    Фоновая задача (стартует в lifespan): выполняет прогоны, поставленные эндпоинтами
+    модерации, и продолжает прерванные рестартом.
+    """
+    while True:
+        try:
+            await run_pending_remoderation_scans()
+        except Exception as e:
+            app_logger.error(f"Moderation scan failed: {e}")
+        try:
+            await asyncio.wait_for(_scans_wakeup.wait(), timeout=interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+        _scans_wakeup.clear()
@@ -1,11 +1,116 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import noload, selectinload
 from fastapi import HTTPException
 from app.models.models import Review, User
 from app.schemas.review_schemas import ReviewCreate, ReviewUpdate
 from app.helpers.moderation import check_bad_words
 
+# другие воркеры увидят изменения не позже чем через TTL (свой воркер — сразу, по инвалидации)
+REVIEWS_FEED_CACHE_TTL_SECONDS = float(os.getenv("REVIEWS_FEED_CACHE_TTL_SECONDS", "60"))
+REVIEWS_FEED_CACHE_MAX_PAGES = 256
+REVIEWS_FEED_MAX_LIMIT = 50
+
+# (before_id, limit) -> (момент загрузки, ответ); сводка по звёздам — отдельно
+_feed_pages: Dict[Tuple[Optional[int], int], Tuple[float, dict]] = {}
+_feed_summary: Optional[Tuple[float, dict]] = None
+# поколение кэша: ответ, начатый до инвалидации, в кэш уже не кладём
+_feed_generation = 0
+_feed_lock = asyncio.Lock()
+
+# для ReviewRead нужны только поля автора: его заказы, шаблоны, редактор и QR не грузим
+_AUTHOR_ONLY = selectinload(Review.user).options(
+    noload(User.orders), noload(User.reviews), noload(User.templates), noload(User.editor), noload(User.qr)
+)
+
+
+def invalidate_review_feed() -> None:
+    """Сбросить кэш публичной ленты (после записи, одобрения, перемодерации отзывов)."""
+    global _feed_summary, _feed_generation
+    _feed_generation += 1
+    _feed_pages.clear()
+    _feed_summary = None
+
+
+def _fresh(entry) -> bool:
+    return entry is not None and time.monotonic() - entry[0] <= REVIEWS_FEED_CACHE_TTL_SECONDS
+
+
+async def _load_rating_summary(db: AsyncSession) -> dict:
+    rows = (
+        await db.execute(
+            select(Review.stars, func.count(Review.id))
+            .where(~Review.is_flagged)
+            .group_by(Review.stars)
+        )
+    ).all()
+    histogram = {stars: 0 for stars in range(1, 6)}
+    for stars, count in rows:
+        histogram[stars] = count
+    total = sum(histogram.values())
+    average = round(sum(s * c for s, c in histogram.items()) / total, 2) if total else None
+    return {"count": total, "average": average, "histogram": histogram}
+
+
+async def _load_feed_page(db: AsyncSession, before_id: Optional[int], limit: int) -> dict:
+    # только нужные поля автора, без загрузки User и его selectin-связей
+    stmt = (
+        select(Review.id, Review.stars, Review.content, User.id.label("author_id"), User.username, User.img_url)
+        .join(User, User.id == Review.user_id)
+        .where(~Review.is_flagged)
+        .order_by(Review.id.desc())
+        .limit(limit + 1)
+    )
+    if before_id is not None:
+        stmt = stmt.where(Review.id < before_id)
+    rows = (await db.execute(stmt)).all()
+    page = rows[:limit]
+    return {
+        "items": [
+            {
+                "id": r.id,
+                "stars": r.stars,
+                "content": r.content,
+                "author": {"id": r.author_id, "username": r.username, "img_url": r.img_url},
+            }
+            for r in page
+        ],
+        "next_cursor": page[-1].id if len(rows) > limit else None,
+    }
+
+
+async def get_review_feed(db: AsyncSession, before_id: Optional[int] = None, limit: int = 20) -> dict:
+    """
+    Публичная лента одобренных отзывов: новые сверху, keyset по id (before_id),
+    плюс сводка по звёздам. Страницы и сводка отдаются из памяти процесса.
+    """
+    global _feed_summary
+    limit = max(1, min(limit, REVIEWS_FEED_MAX_LIMIT))
+    key = (before_id, limit)
+    page, summary = _feed_pages.get(key), _feed_summary
+    if not (_fresh(page) and _fresh(summary)):
+        # одна загрузка на промах, остальные запросы ждут её результат
+        async with _feed_lock:
+            page, summary = _feed_pages.get(key), _feed_summary
+            generation = _feed_generation
+            if not _fresh(summary):
+                summary = (time.monotonic(), await _load_rating_summary(db))
+            if not _fresh(page):
+                page = (time.monotonic(), await _load_feed_page(db, before_id, limit))
+            if generation == _feed_generation:
+                _feed_summary = summary
+                if len(_feed_pages) >= REVIEWS_FEED_CACHE_MAX_PAGES:
+                    _feed_pages.clear()
+                _feed_pages[key] = page
+    return {**page[1], "summary": summary[1]}
+
+
 async def create_review_helper(
     db: AsyncSession,
     review_in: ReviewCreate,
@@ -24,9 +129,12 @@ async def create_review_helper(
     is_flagged = await check_bad_words(db, review_in.content)
     
     review = Review(**review_in.dict(), user_id=user_id, is_flagged=is_flagged)
+    # автор уже в identity map (его загрузил current_user в этой же сессии) —
+    # привязываем без запроса, чтобы ReviewRead не требовал refresh после commit
+    review.user = await db.get(User, user_id)
     db.add(review)
     await db.commit()
-    await db.refresh(review)
+    invalidate_review_feed()
     return review
 
 async def get_review_helper(
@@ -37,7 +145,7 @@ async def get_review_helper(
     result = await db.execute(
         select(Review)
         .where(Review.id == review_id)
-        .options(selectinload(Review.user))
+        .options(_AUTHOR_ONLY)
     )
     review = result.scalar_one_or_none()
     if not review:
@@ -54,7 +162,8 @@ async def get_reviews_helper(
     result = await db.execute(
         select(Review)
         .where(Review.is_flagged == False)
-        .options(selectinload(Review.user))
+        .options(_AUTHOR_ONLY)
+        .order_by(Review.id.desc())
         .offset(skip)
         .limit(limit)
     )
@@ -68,13 +177,80 @@ async def get_all_reviews_admin_helper(
     """Получить список ВСЕХ отзывов (для админки)"""
     result = await db.execute(
         select(Review)
-        .options(selectinload(Review.user))
+        .options(_AUTHOR_ONLY)
         .offset(skip)
         .limit(limit)
     )
     return result.scalars().all()
 
 
+async def get_moderation_queue_helper(
+    db: AsyncSession,
+    after_id: Optional[int] = None,
+    limit: int = 50,
+) -> dict:
+    """
+    Очередь модерации: только помеченные отзывы, старые первыми, keyset по id (after_id).
+    Оба запроса идут по частичному индексу ix_reviews_flagged.
+    """
+    stmt = (
+        select(Review)
+        .where(Review.is_flagged)
+        .options(_AUTHOR_ONLY)
+        .order_by(Review.id)
+        .limit(limit + 1)
+    )
+    if after_id is not None:
+        stmt = stmt.where(Review.id > after_id)
+    reviews = (await db.execute(stmt)).scalars().all()
+    total = await db.scalar(select(func.count(Review.id)).where(Review.is_flagged))
+    page = reviews[:limit]
+    return {
+        "items": page,
+        "next_cursor": page[-1].id if len(reviews) > limit else None,
+        "total": total,
+    }
+
+
+async def bulk_moderate_reviews_helper(
+    db: AsyncSession,
+    action: str,
+    review_ids: List[int],
+) -> dict:
+    """
+    Массовая модерация одним запросом на действие:
+      approve — снять пометку с помеченных (публикация);
+      reject  — пометить (скрыть из ленты) опубликованные;
+      delete  — удалить, но только помеченные (как и в одиночном удалении админом).
+    Отзывы не в нужном состоянии пропускаются; возвращаются реально затронутые id.
+    """
+    ids = sorted(set(review_ids))
+    if action == "approve":
+        stmt = (
+            update(Review)
+            .where(Review.id.in_(ids), Review.is_flagged)
+            .values(is_flagged=False, moderation_override="approved")
+        )
+    elif action == "reject":
+        stmt = (
+            update(Review)
+            .where(Review.id.in_(ids), ~Review.is_flagged)
+            .values(is_flagged=True, moderation_override="rejected")
+        )
+    elif action == "delete":
+        stmt = delete(Review).where(Review.id.in_(ids), Review.is_flagged)
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported action '{action}'")
+
+    affected = (
+        await db.execute(stmt.returning(Review.id).execution_options(synchronize_session=False))
+    ).scalars().all()
+    await db.commit()
+    if affected:
+        invalidate_review_feed()
+    return {"action": action, "requested": len(ids), "affected": len(affected), "ids": sorted(affected)}
+
+
 async def update_review_helper(
     db: AsyncSession,
     review_id: int,
@@ -90,10 +266,11 @@ async def update_review_helper(
 
     # Re-check moderation status on update
     review.is_flagged = await check_bad_words(db, review.content)
+    # новый текст — прежнее решение админа к нему не относится
+    review.moderation_override = None
 
-    db.add(review)
     await db.commit()
-    await db.refresh(review)
+    invalidate_review_feed()
     return review
 
 
@@ -108,6 +285,7 @@ async def delete_review_helper(
 
     await db.delete(review)
     await db.commit()
+    invalidate_review_feed()
     return {"status": "success", "message": f"Review {review_id} deleted"}
 
 
@@ -119,6 +297,6 @@ async def get_my_review_helper(
     result = await db.execute(
         select(Review)
         .where(Review.user_id == user_id)
-        .options(selectinload(Review.user))
+        .options(_AUTHOR_ONLY)
     )
     return result.scalars().first()
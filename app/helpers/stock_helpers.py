@@ -0,0 +1,354 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, column, delete, func, insert, or_, select, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.database import async_session
+from app.logging_config import app_logger
+from app.models.models import Order, OrderItem, Product, StockReservation, User
+from app.helpers.analytics_helpers import apply_sales_delta, order_sales_snapshot
+
+STOCK_RESERVATION_TTL = timedelta(minutes=int(os.getenv("STOCK_RESERVATION_TTL_MINUTES", "30")))
+EXPIRY_BATCH_SIZE = 200
+
+# в этих статусах резерв превращается в продажу (остаток уже списан)
+STOCK_CONSUMED_STATUSES = {"paid", "processing", "shipped", "completed"}
+# в этих — резерв возвращается на склад
+STOCK_RELEASED_STATUSES = {"cancelled", "refunded"}
+
+
+def _quantities_values(quantities: Dict[int, int], name: str = "v"):
+    """(VALUES (product_id, qty), ...) для UPDATE ... FROM по нескольким товарам."""
+    return values(column("product_id", Integer), column("qty", Integer), name=name).data(
+        sorted(quantities.items())
+    )
+
+
+def _locked_in_id_order(product_ids: Iterable[int]):
+    """
+    Условие products.id IN (SELECT id FROM locked) для UPDATE ... FROM (VALUES), где
+    locked — WITH ... AS MATERIALIZED (SELECT ... ORDER BY id FOR UPDATE). Порядок
+    соединения в самом UPDATE Postgres не гарантирует, а без общего порядка блокировок
+    два заказа с несколькими товарами могут взаимно заблокироваться. Всё в одном запросе.
+    """
+    locked = (
+        select(Product.id)
+        .where(Product.id.in_(sorted(product_ids)))
+        .order_by(Product.id)
+        .with_for_update()
+        .cte("locked")
+        .prefix_with("MATERIALIZED")
+    )
+    return Product.id.in_(select(locked.c.id))
+
+
+async def reserve_stock(db: AsyncSession, quantities: Dict[int, int]) -> Dict[int, Optional[int]]:
+    """
+    Списать остаток под позиции заказа одним условным UPDATE (без чтения остатка):
+        одна позиция — UPDATE products SET stock = stock - :qty WHERE id = :id AND stock >= :qty
+        несколько    — UPDATE products SET stock = stock - v.qty FROM (VALUES ...) v WHERE ...
+                       (строки блокируются по порядку id, см. _locked_in_id_order)
+    Товары без учёта остатка (stock IS NULL) проходят условие и остаются NULL.
+
+    Возвращает {product_id: новый остаток или None}. Если хоть одного товара не хватило,
+    откатывает транзакцию сессии и отдаёт 409 со списком товаров.
+    Блокировки строк держатся до commit вызывающего — коммитить нужно сразу, до внешних вызовов.
+    """
+    if len(quantities) == 1:
+        ((pid, qty),) = quantities.items()
+        stmt = (
+            update(Product)
+            .where(Product.id == pid, or_(Product.stock.is_(None), Product.stock >= qty))
+            .values(stock=Product.stock - qty)
+        )
+    else:
+        v = _quantities_values(quantities)
+        stmt = (
+            update(Product)
+            .where(
+                Product.id == v.c.product_id,
+                _locked_in_id_order(quantities),
+                or_(Product.stock.is_(None), Product.stock >= v.c.qty),
+            )
+            .values(stock=Product.stock - v.c.qty)
+        )
+    stmt = stmt.returning(Product.id, Product.stock).execution_options(synchronize_session=False)
+    reserved = {pid: stock for pid, stock in (await db.execute(stmt)).all()}
+
+    if len(reserved) != len(quantities):
+        await db.rollback()
+        short = sorted(set(quantities) - set(reserved))
+        raise HTTPException(
+            status_code=409,
+            detail={"error": "out_of_stock", "msg": "Not enough stock", "product_ids": short},
+        )
+    return reserved
+
+
+async def _restock(db: AsyncSession, quantities: Dict[int, int]) -> None:
+    """Вернуть остаток одним UPDATE ... FROM (VALUES); товары без учёта не трогаем."""
+    if not quantities:
+        return
+    v = _quantities_values(quantities)
+    await db.execute(
+        update(Product)
+        .where(Product.id == v.c.product_id, _locked_in_id_order(quantities), Product.stock.is_not(None))
+        .values(stock=Product.stock + v.c.qty)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def reserve_order_stock(db: AsyncSession, order_id: int, quantities: Dict[int, int]) -> None:
+    """
+    Списать остаток и записать резерв заказа (до expires_at). Не коммитит.
+    Резерв пишется только по товарам, у которых ведётся остаток.
+    """
+    reserved = await reserve_stock(db, quantities)
+    tracked = [pid for pid, stock in reserved.items() if stock is not None]
+    if not tracked:
+        return
+    now = datetime.utcnow()
+    await db.execute(
+        insert(StockReservation),
+        [
+            {
+                "order_id": order_id,
+                "product_id": pid,
+                "quantity": quantities[pid],
+                "created_at": now,
+                "expires_at": now + STOCK_RESERVATION_TTL,
+            }
+            for pid in sorted(tracked)
+        ],
+    )
+
+
+async def release_order_stock(db: AsyncSession, order_ids: Iterable[int]) -> int:
+    """
+    Снять резервы заказов и вернуть остаток. DELETE ... RETURNING гарантирует,
+    что при гонке (истечение vs отмена) остаток вернётся ровно один раз. Не коммитит.
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return 0
+    rows = (
+        await db.execute(
+            delete(StockReservation)
+            .where(StockReservation.order_id.in_(order_ids))
+            .returning(StockReservation.product_id, StockReservation.quantity)
+        )
+    ).all()
+    back: Dict[int, int] = {}
+    for pid, qty in rows:
+        back[pid] = back.get(pid, 0) + qty
+    await _restock(db, back)
+    return len(rows)
+
+
+async def adjust_order_stock(db: AsyncSession, order_id: int, status: str, deltas: Dict[int, int]) -> None:
+    """
+    Админ поменял количества в заказе: deltas = {product_id: новое - старое}. Не коммитит.
+      pending            — остаток и резерв заказа меняются вместе;
+      оплачен/в работе   — остаток уже списан: рост списывает ещё, уменьшение возвращает;
+      отменён/возвращён  — остаток уже вернули, не трогаем.
+    Рост проверяется как при создании заказа: не хватило — откат и 409.
+    """
+    if status in STOCK_RELEASED_STATUSES:
+        return
+    more = {pid: d for pid, d in deltas.items() if pid is not None and d > 0}
+    less = {pid: -d for pid, d in deltas.items() if pid is not None and d < 0}
+    reserved = await reserve_stock(db, more) if more else {}
+
+    if status in STOCK_CONSUMED_STATUSES:
+        await _restock(db, less)
+        return
+
+    tracked = {pid: more[pid] for pid, stock in reserved.items() if stock is not None}
+    if tracked:
+        now = datetime.utcnow()
+        stmt = pg_insert(StockReservation).values([
+            {
+                "order_id": order_id,
+                "product_id": pid,
+                "quantity": qty,
+                "created_at": now,
+                "expires_at": now + STOCK_RESERVATION_TTL,
+            }
+            for pid, qty in sorted(tracked.items())
+        ])
+        # у позиции уже есть резерв — увеличиваем его, срок не продлеваем
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[StockReservation.order_id, StockReservation.product_id],
+            set_={"quantity": StockReservation.quantity + stmt.excluded.quantity},
+        ))
+    if less:
+        # как в release_order_stock: DELETE ... RETURNING, чтобы не вернуть остаток
+        # второй раз, если резерв в этот момент снимает истечение
+        rows = (
+            await db.execute(
+                delete(StockReservation)
+                .where(StockReservation.order_id == order_id, StockReservation.product_id.in_(less))
+                .returning(
+                    StockReservation.product_id,
+                    StockReservation.quantity,
+                    StockReservation.created_at,
+                    StockReservation.expires_at,
+                )
+            )
+        ).all()
+        back: Dict[int, int] = {}
+        keep = []
+        for pid, qty, created_at, expires_at in rows:
+            back[pid] = min(qty, less[pid])
+            if qty > less[pid]:
+                keep.append({
+                    "order_id": order_id,
+                    "product_id": pid,
+                    "quantity": qty - less[pid],
+                    "created_at": created_at,
+                    "expires_at": expires_at,
+                })
+        if keep:
+            await db.execute(insert(StockReservation), keep)
+        await _restock(db, back)
+
+
+async def consume_order_stock(db: AsyncSession, order_id: int) -> None:
+    """Заказ оплачен: резерв становится продажей, остаток не возвращается. Не коммитит."""
+    await db.execute(delete(StockReservation).where(StockReservation.order_id == order_id))
+
+
+def order_stock_quantities(order: Order) -> Dict[int, int]:
+    """{product_id: количество} по позициям заказа (позиции без товара пропускаются)."""
+    quantities: Dict[int, int] = {}
+    for item in order.items:
+        if item.product_id is not None:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+def _stock_state(status: str) -> str:
+    if status in STOCK_CONSUMED_STATUSES:
+        return "consumed"
+    if status in STOCK_RELEASED_STATUSES:
+        return "released"
+    return "reserved"
+
+
+async def apply_order_status_to_stock(db: AsyncSession, order: Order, old_status: str, new_status: str) -> None:
+    """
+    Согласовать остаток со сменой статуса заказа (order.items должны быть загружены). Не коммитит.
+      pending → оплачен/в работе     — резерв становится продажей;
+      pending → отменён/возвращён    — резерв возвращается на склад;
+      оплачен → отменён/возвращён    — резерва уже нет: возвращаем количества позиций;
+      отменён → pending              — остаток списывается заново вместе с резервом;
+      отменён → оплачен/в работе     — остаток списывается заново (не хватило — 409);
+      оплачен → pending              — 400: продажу нельзя превратить обратно в резерв.
+    """
+    old, new = _stock_state(old_status), _stock_state(new_status)
+    if old == new:
+        return
+    if old == "reserved":
+        if new == "consumed":
+            await consume_order_stock(db, order.id)
+        else:
+            await release_order_stock(db, [order.id])
+        return
+    if old == "consumed" and new == "reserved":
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot move order from '{old_status}' back to '{new_status}'",
+        )
+
+    quantities = order_stock_quantities(order)
+    if not quantities:
+        return
+    if old == "consumed":
+        await _restock(db, quantities)
+    elif new == "reserved":
+        await reserve_order_stock(db, order.id, quantities)
+    else:
+        await reserve_stock(db, quantities)
+
+
+async def expire_stock_reservations(batch_size: int = EXPIRY_BATCH_SIZE) -> int:
+    """
+    Отменить неоплаченные заказы с истёкшим резервом и вернуть остаток.
+    Заказы берутся FOR UPDATE SKIP LOCKED — несколько воркеров не мешают друг другу
+    и не ждут заказ, который прямо сейчас оплачивают.
+    """
+    total = 0
+    while True:
+        async with async_session() as session:
+            expired = select(StockReservation.order_id).where(
+                StockReservation.expires_at < datetime.utcnow()
+            )
+            orders = (
+                await session.execute(
+                    select(Order)
+                    .where(Order.id.in_(expired), Order.status == "pending")
+                    .order_by(Order.id)
+                    .limit(batch_size)
+                    .with_for_update(skip_locked=True, of=Order)
+                    .options(
+                        noload(Order.user),
+                        selectinload(Order.items).selectinload(OrderItem.product).noload(Product.qr),
+                    )
+                )
+            ).scalars().all()
+            await release_order_stock(session, [o.id for o in orders])
+            for order in orders:
+                before = order_sales_snapshot(order)
+                order.status = "cancelled"
+                await apply_sales_delta(session, before, order_sales_snapshot(order))
+            await session.commit()
+        total += len(orders)
+        if len(orders) < batch_size:
+            return total
+
+
+async def stock_reservation_expiry_loop(interval_seconds: int = 60) -> None:
+    """Фоновая задача (стартует в lifespan): раз в interval_seconds снимает истёкшие резервы."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            expired = await expire_stock_reservations()
+            if expired:
+                app_logger.info(f"Cancelled {expired} orders with expired stock reservations")
+        except Exception as e:
+            app_logger.error(f"Stock reservation expiry failed: {e}")
+
+
+async def adjust_product_stock(db: AsyncSession, requester: User, product_id: int, delta: int) -> Product:
+    """
+    Суперюзер: приход/списание остатка (delta) атомарно, без перезаписи чужих резервов.
+    Первое изменение включает учёт остатка у товара (NULL считается нулём).
+    """
+    if not requester.is_superuser:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    product = await db.get(Product, product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    new_stock = func.coalesce(Product.stock, 0) + delta
+    stock = await db.scalar(
+        update(Product)
+        .where(Product.id == product_id, new_stock >= 0)
+        .values(stock=new_stock)
+        .returning(Product.stock)
+        .execution_options(synchronize_session=False)
+    )
+    if stock is None:
+        raise HTTPException(status_code=409, detail="Stock cannot become negative")
+
+    set_committed_value(product, "stock", stock)
+    await db.commit()
+    return product
@@ -75,9 +75,7 @@ async def create_template_for_user(
         owner_user_id=user.id,
     )
     db.add(tpl)
-    await db.flush()
     await db.commit()
-    await db.refresh(tpl)
     return tpl
 
 async def update_template_meta(
@@ -107,7 +105,6 @@ async def update_template_meta(
         tpl.thumb_url = thumb_url
 
     await db.commit()
-    await db.refresh(tpl)
     return tpl
 
 async def replace_template_file(
@@ -144,7 +141,6 @@ async def replace_template_file(
         tpl.thumb_url = f"{_s3_public_base()}/{thumb_object}"
 
     await db.commit()
-    await db.refresh(tpl)
     return tpl
 
 async def delete_template(
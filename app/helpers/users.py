@@ -57,5 +57,4 @@ async def set_user_avatar(
 
     user.img_url = f"{_s3_public_base()}/{object_key}"
     await db.commit()
-    await db.refresh(user)
     return user
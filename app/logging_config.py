@@ -1,46 +1,224 @@
+import atexit
+import copy
+import gzip
 import logging
 import os
+import queue
+import shutil
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import orjson
+
+from app.request_context import request_id_var
 
 os.makedirs("logs", exist_ok=True)
 
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# text — прежние строки "время - логгер - уровень - сообщение";
+# json — одна JSON-запись на строку (request_id, поля запроса и т.д.)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# Ротация: сегменты по LOG_MAX_BYTES, бэкапы сжимаются gzip (~10x для логов),
+# поэтому при том же месте на диске история в разы длиннее
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "50"))
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1").lower() not in ("0", "false", "no")
+# "app.log.1@<inode>" в заголовке сжатого бэкапа
+GZIP_INODE_SEPARATOR = "@"
+# INFO пишет каждый SQL-запрос с параметрами; по умолчанию в db.log только
+# медленные запросы (app/slow_queries.py) и ошибки
+DB_LOG_LEVEL = os.getenv("DB_LOG_LEVEL", "WARNING").upper()
+
+# стандартные атрибуты LogRecord; всё остальное — поля, переданные через extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and value is not None:
+                payload[key] = value
+        return orjson.dumps(payload, default=str).decode()
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    Готовит запись в потоке, где пишется лог: подставляет аргументы, рендерит
+    traceback в exc_text и снимает request id (в потоке слушателя контекста уже нет).
+    В отличие от QueueHandler.prepare, traceback не склеивается с сообщением.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = request_id_var.get()
+        return record
+
+
+_traceback_formatter = logging.Formatter()
+
+
+if LOG_FORMAT == "json":
+    formatter = JsonFormatter()
+else:
+    formatter = logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+
+# Запись в файлы и консоль — в отдельном потоке QueueListener: на event loop
+# логгер только кладёт запись в очередь. Каждый файловый хандлер фильтрует
+# свои записи по имени логгера, поэтому очередь и поток общие.
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_sink_handlers = []
+
+
+class _Compressor:
+    """
+    Фоновый поток, сжимающий ротированные сегменты: сама ротация в потоке
+    QueueListener — только переименование, запись логов не ждёт gzip.
+    """
+
+    def __init__(self):
+        self._jobs: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="log-compressor", daemon=True)
+        self._thread.start()
+
+    def submit(self, source: str, dest: str) -> threading.Event:
+        done = threading.Event()
+        self._jobs.put((source, dest, done))
+        return done
+
+    def stop(self) -> None:
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while (job := self._jobs.get()) is not None:
+            source, dest, done = job
+            try:
+                st = os.stat(source)
+                # в FNAME заголовка gzip — имя и inode несжатого файла: по нему
+                # дочитывание хвоста (/logs/follow) узнаёт свой файл после сжатия
+                with open(source, "rb") as src, open(dest + ".tmp", "wb") as raw, gzip.GzipFile(
+                    filename=f"{os.path.basename(source)}{GZIP_INODE_SEPARATOR}{st.st_ino}",
+                    mode="wb", compresslevel=6, fileobj=raw,
+                ) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                # .gz появляется целиком, и только потом исчезает несжатый сегмент
+                # mtime сегмента = время последней записи в нём (на это опирается поиск)
+                os.utime(dest + ".tmp", ns=(st.st_atime_ns, st.st_mtime_ns))
+                os.replace(dest + ".tmp", dest)
+                os.remove(source)
+            except OSError as e:
+                print(f"log compression failed for {source}: {e}", file=sys.stderr)
+            finally:
+                done.set()
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler с бэкапами name.1.gz … name.N.gz. Свежий бэкап сначала
+    переименовывается в name.1 и сжимается в фоне; следующая ротация дожидается
+    окончания сжатия, чтобы сдвиг номеров не задел несжатый файл.
+    """
+
+    def __init__(self, filename: str, compressor: _Compressor, **kwargs):
+        super().__init__(filename, **kwargs)
+        self._compressor = compressor
+        self._pending: "threading.Event | None" = None
+        self._compress_leftovers()
+
+    def namer(self, name: str) -> str:
+        return name + ".gz"
+
+    def rotator(self, source: str, dest: str) -> None:
+        if not os.path.exists(source):
+            return
+        plain = dest[:-len(".gz")]
+        os.rename(source, plain)
+        self._pending = self._compressor.submit(plain, dest)
+
+    def doRollover(self) -> None:
+        if self._pending is not None:
+            self._pending.wait()
+        super().doRollover()
+
+    def _compress_leftovers(self) -> None:
+        # несжатые бэкапы прежнего формата или оставшиеся после падения процесса
+        for i in range(1, self.backupCount + 1):
+            plain = f"{self.baseFilename}.{i}"
+            if os.path.exists(plain) and not os.path.exists(plain + ".gz"):
+                self._pending = self._compressor.submit(plain, plain + ".gz")
+
+
+_compressor = _Compressor() if LOG_COMPRESS else None
+
+
+def _file_handler(filename: str, logger_name: str) -> logging.Handler:
+    if _compressor is not None:
+        handler = CompressingRotatingFileHandler(
+            f"logs/{filename}", _compressor, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+        )
+    else:
+        handler = RotatingFileHandler(f"logs/{filename}", maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    handler.setFormatter(formatter)
+    handler.addFilter(logging.Filter(logger_name))
+    _sink_handlers.append(handler)
+    return handler
+
+
+def _route_to_queue(logger: logging.Logger) -> None:
+    logger.addHandler(_ContextQueueHandler(_log_queue))
+    logger.propagate = False
+
 
 access_logger = logging.getLogger("uvicorn.access")
 access_logger.setLevel(logging.INFO)
-access_handler = RotatingFileHandler("logs/access.log", maxBytes=10*1024*1024, backupCount=5)
-access_handler.setFormatter(formatter)
-access_logger.addHandler(access_handler)
-access_logger.propagate = False
+access_handler = _file_handler("access.log", "uvicorn.access")
+_route_to_queue(access_logger)
 
 error_logger = logging.getLogger("uvicorn.error")
 error_logger.setLevel(logging.ERROR)
-error_handler = RotatingFileHandler("logs/error.log", maxBytes=10*1024*1024, backupCount=5)
-error_handler.setFormatter(formatter)
-error_logger.addHandler(error_handler)
-error_logger.propagate = False
+error_handler = _file_handler("error.log", "uvicorn.error")
+_route_to_queue(error_logger)
 
 db_logger = logging.getLogger("sqlalchemy.engine")
-db_logger.setLevel(logging.INFO)
-db_handler = RotatingFileHandler("logs/db.log", maxBytes=10*1024*1024, backupCount=5)
-db_handler.setFormatter(formatter)
-db_logger.addHandler(db_handler)
-db_logger.propagate = False
+db_logger.setLevel(DB_LOG_LEVEL)
+db_handler = _file_handler("db.log", "sqlalchemy.engine")
+_route_to_queue(db_logger)
 
 app_logger = logging.getLogger("app")
 app_logger.setLevel(logging.DEBUG)
 # Файловый хандлер
-app_handler = RotatingFileHandler("logs/app.log", maxBytes=10*1024*1024, backupCount=5)
-app_handler.setFormatter(formatter)
-app_logger.addHandler(app_handler)
+app_handler = _file_handler("app.log", "app")
 # Консольный хандлер (пойдёт в docker compose logs)
 console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setLevel(logging.DEBUG)
 console_handler.setFormatter(formatter)
-app_logger.addHandler(console_handler)
-app_logger.propagate = False
+console_handler.addFilter(logging.Filter("app"))
+_sink_handlers.append(console_handler)
+_route_to_queue(app_logger)
+
+log_listener = QueueListener(_log_queue, *_sink_handlers, respect_handler_level=True)
+log_listener.start()
+# при выходе дописываем то, что осталось в очереди, затем досжимаем сегменты
+# (atexit вызывает в обратном порядке)
+if _compressor is not None:
+    atexit.register(_compressor.stop)
+atexit.register(log_listener.stop)
 
-print("✅ Логирование настроено!")
\ No newline at end of file
+print("✅ Логирование настроено!")
@@ -0,0 +1,216 @@
+"""
+Локальный SMTP-стенд для тестов и прогонов очереди писем без настоящего почтового сервера.
+
+Понимает то, что шлёт SmtpMailer: EHLO/HELO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA,
+RSET, NOOP, QUIT. Письма складываются в память (FakeSMTPServer.messages),
+соединения и входы считаются (connections, logins) — по ним видно переиспользование.
+
+Запуск:
+  - в процессе:   async with FakeSMTPServer() as server: ... (server.port)
+  - отдельно:     python -m app.mail.fake_smtp --port 1025
+                  и SMTP_SERVER=localhost SMTP_PORT=1025
+
+Настройки через env (FakeSMTPServer.from_env):
+  FAKE_SMTP_LATENCY     — распределение задержки на DATA, мс (формат как у FAKE_YANDEX_LATENCY)
+  FAKE_SMTP_ERROR_RATE  — доля писем, отклонённых временной ошибкой 451 (0..1)
+  FAKE_SMTP_SEED        — seed генератора
+"""
+import argparse
+import asyncio
+import base64
+import os
+import random
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from app.delivery.fake_yandex import parse_latency
+
+
+class ReceivedMail(NamedTuple):
+    mail_from: str
+    rcpt_to: List[str]
+    message: EmailMessage
+
+
+def _address(arg: str) -> str:
+    # "FROM:<a@b> SIZE=123" -> "a@b"
+    value = arg.split(":", 1)[1].strip() if ":" in arg else arg
+    return value.split(" ", 1)[0].strip("<>")
+
+
+class FakeSMTPServer:
+    """SMTP-сервер в памяти с инъекцией задержек и временных отказов."""
+
+    def __init__(
+        self,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: Optional[str] = None,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+        refuse: Optional[Dict[str, int]] = None,
+        reject_login: bool = False,
+    ):
+        self.host = host
+        self.port = port
+        self.error_rate = error_rate
+        # адрес -> код ответа на RCPT (450 — greylisting, 550 — нет такого ящика)
+        self.refuse = refuse or {}
+        self.reject_login = reject_login
+        self._sample_latency = parse_latency(latency)
+        self._rnd = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+
+        self.messages: List[ReceivedMail] = []
+        self.connections = 0
+        self.logins = 0
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "FakeSMTPServer":
+        seed = os.getenv("FAKE_SMTP_SEED")
+        return cls(
+            latency=os.getenv("FAKE_SMTP_LATENCY"),
+            error_rate=float(os.getenv("FAKE_SMTP_ERROR_RATE", "0") or 0),
+            seed=int(seed) if seed else None,
+            **kwargs,
+        )
+
+    async def start(self) -> "FakeSMTPServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # как при рестарте настоящего сервера: открытые сессии тоже рвутся
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "FakeSMTPServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    # ---------- протокол ----------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._clients.add(writer)
+
+        async def reply(line: str) -> None:
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        async def read_line() -> Optional[str]:
+            raw = await reader.readline()
+            return raw.decode("utf-8", "replace").rstrip("\r\n") if raw else None
+
+        mail_from: Optional[str] = None
+        rcpt_to: List[str] = []
+        try:
+            await reply("220 fake-smtp ESMTP ready")
+            while True:
+                line = await read_line()
+                if line is None:
+                    return
+                verb, _, arg = line.partition(" ")
+                verb = verb.upper()
+
+                if verb == "EHLO":
+                    await reply("250-fake-smtp")
+                    await reply("250-AUTH PLAIN LOGIN")
+                    await reply("250-8BITMIME")
+                    await reply("250 SMTPUTF8")
+                elif verb == "HELO":
+                    await reply("250 fake-smtp")
+                elif verb == "AUTH":
+                    mech, _, initial = arg.partition(" ")
+                    if mech.upper() == "PLAIN":
+                        if not initial:
+                            await reply("334 ")
+                            initial = await read_line() or ""
+                        base64.b64decode(initial)
+                    elif mech.upper() == "LOGIN":
+                        await reply("334 " + base64.b64encode(b"Username:").decode())
+                        await read_line()
+                        await reply("334 " + base64.b64encode(b"Password:").decode())
+                        await read_line()
+                    else:
+                        await reply("504 Unrecognized authentication type")
+                        continue
+                    if self.reject_login:
+                        await reply("535 Authentication credentials invalid")
+                        continue
+                    self.logins += 1
+                    await reply("235 Authentication successful")
+                elif verb == "MAIL":
+                    mail_from, rcpt_to = _address(arg), []
+                    await reply("250 OK")
+                elif verb == "RCPT":
+                    address = _address(arg)
+                    code = self.refuse.get(address)
+                    if code:
+                        await reply(f"{code} Recipient refused")
+                        continue
+                    rcpt_to.append(address)
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    if mail_from is None or not rcpt_to:
+                        await reply("503 Bad sequence of commands")
+                        continue
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while True:
+                        raw = await reader.readline()
+                        if not raw or raw in (b".\r\n", b".\n"):
+                            break
+                        lines.append(raw[1:] if raw.startswith(b"..") else raw)
+
+                    delay = self._sample_latency(self._rnd)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    if self._rnd.random() < self.error_rate:
+                        await reply("451 Injected temporary failure")
+                    else:
+                        self.messages.append(ReceivedMail(
+                            mail_from, rcpt_to, BytesParser(policy=policy.default).parsebytes(b"".join(lines))
+                        ))
+                        await reply("250 OK: queued")
+                    mail_from, rcpt_to = None, []
+                elif verb == "RSET":
+                    mail_from, rcpt_to = None, []
+                    await reply("250 OK")
+                elif verb == "NOOP":
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    return
+                else:
+                    await reply("502 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+
+async def _serve(host: str, port: int) -> None:
+    server = await FakeSMTPServer.from_env(host=host, port=port).start()
+    print(f"Fake SMTP listening on {server.host}:{server.port}")
+    await server._server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный SMTP-стенд")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port))
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import time
+from email.message import EmailMessage
+from typing import Optional
+
+import aiosmtplib
+
+from app.logging_config import app_logger
+
+
+class MailError(Exception):
+    """
+    Ошибка отправки. permanent=True — повтор не поможет (адрес отклонён, 5xx).
+    config=True — виноваты настройки SMTP (не заданы, неверный логин), а не письмо;
+    connection=True — сервер недоступен (не подключиться, таймаут, обрыв после
+    переподключения). В обоих случаях попытка письму не засчитывается, отправку
+    очереди надо остановить.
+    """
+
+    def __init__(self, message: str, permanent: bool = False, config: bool = False, connection: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+        self.config = config
+        self.connection = connection
+
+
+class SmtpMailer:
+    """
+    Асинхронная отправка писем через одно авторизованное SMTP-соединение на процесс
+    (вместо SMTP_SSL + login на каждое письмо в потоке). Соединение открывается
+    при первой отправке, после простоя проверяется NOOP и переподключается при обрыве.
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        from_email: Optional[str] = None,
+        timeout: float = 30.0,
+        idle_check_seconds: float = 30.0,
+    ):
+        self.host = host or os.getenv("SMTP_SERVER")
+        self.port = int(port or os.getenv("SMTP_PORT", "465"))
+        self.username = username if username is not None else os.getenv("SMTP_USERNAME")
+        self.password = password if password is not None else os.getenv("SMTP_PASSWORD")
+        self.from_email = from_email or os.getenv("SMTP_FROM_EMAIL") or self.username
+        self.timeout = timeout
+        self.idle_check_seconds = idle_check_seconds
+
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._last_used = 0.0
+        # SMTP — строго последовательный протокол: одно письмо в соединении за раз
+        self._lock = asyncio.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host and self.from_email)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.host,
+            port=self.port,
+            # 465 — TLS сразу, иначе STARTTLS, если сервер его предлагает
+            use_tls=self.port == 465,
+            timeout=self.timeout,
+        )
+        await smtp.connect()
+        if self.username:
+            await smtp.login(self.username, self.password or "")
+        app_logger.info(f"SMTP connected to {self.host}:{self.port}")
+        return smtp
+
+    async def _connection(self) -> aiosmtplib.SMTP:
+        if self._smtp is not None and self._smtp.is_connected:
+            if time.monotonic() - self._last_used < self.idle_check_seconds:
+                return self._smtp
+            # сервер мог закрыть простаивающее соединение — проверяем дёшево
+            try:
+                await self._smtp.noop()
+                return self._smtp
+            except aiosmtplib.SMTPException:
+                pass
+        await self._drop()
+        self._smtp = await self._connect()
+        return self._smtp
+
+    async def _drop(self) -> None:
+        if self._smtp is not None:
+            try:
+                if self._smtp.is_connected:
+                    await self._smtp.quit()
+            except aiosmtplib.SMTPException:
+                self._smtp.close()
+            self._smtp = None
+
+    async def send(self, to_email: str, subject: str, body: str) -> None:
+        if not self.configured:
+            raise MailError("SMTP settings are not configured", config=True)
+
+        msg = EmailMessage()
+        msg["From"] = str(self.from_email)
+        msg["To"] = to_email
+        msg["Subject"] = subject
+        msg.set_content(body)
+
+        async with self._lock:
+            for attempt in (1, 2):
+                try:
+                    smtp = await self._connection()
+                    await smtp.send_message(msg)
+                    self._last_used = time.monotonic()
+                    return
+                except aiosmtplib.SMTPAuthenticationError as e:
+                    # проблема настроек, а не письма — письмо остаётся в очереди
+                    await self._drop()
+                    raise MailError(f"SMTP authentication failed: {e.code} {e.message}", config=True)
+                except aiosmtplib.SMTPRecipientsRefused as e:
+                    # 4xx (greylisting, ящик переполнен) — временный отказ, повторяем
+                    permanent = all(500 <= r.code < 600 for r in e.recipients)
+                    raise MailError(f"Recipient refused: {e}", permanent=permanent)
+                except aiosmtplib.SMTPResponseException as e:
+                    if e.code == 421 and attempt == 1:
+                        # 421 — сервер закрывает соединение: переподключаемся и повторяем
+                        await self._drop()
+                        continue
+                    raise MailError(f"SMTP {e.code}: {e.message}", permanent=500 <= e.code < 600)
+                except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPTimeoutError, ConnectionError) as e:
+                    await self._drop()
+                    if attempt == 2:
+                        raise MailError(f"SMTP connection lost: {e}", connection=True)
+                except aiosmtplib.SMTPException as e:
+                    await self._drop()
+                    raise MailError(f"SMTP error: {e}")
+
+    async def aclose(self) -> None:
+        async with self._lock:
+            await self._drop()
+
+
+_mailer: Optional[SmtpMailer] = None
+
+
+def get_mailer() -> SmtpMailer:
+    """Общий отправитель процесса (одно соединение); закрывается в lifespan."""
+    global _mailer
+    if _mailer is None:
+        _mailer = SmtpMailer()
+    return _mailer
+
+
+def use_mailer(mailer: Optional[SmtpMailer]) -> None:
+    """Подменить отправителя (например, на SmtpMailer(host=..., port=FakeSMTPServer.port) в тестах)."""
+    global _mailer
+    _mailer = mailer
+
+
+async def close_mailer() -> None:
+    global _mailer
+    if _mailer is not None:
+        await _mailer.aclose()
+        _mailer = None
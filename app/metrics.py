@@ -0,0 +1,172 @@
+"""
+Метрики в формате Prometheus (GET /metrics).
+
+Что собирается:
+  * запросы: число и гистограмма длительности по методу и шаблону роута
+    (снимает RequestLoggingMiddleware — время уже измерено для журнала);
+  * пул соединений SQLAlchemy: занято, сверх pool_size, ожидание соединения;
+  * исходящие вызовы (S3, Яндекс Доставка): гистограмма по сервису, операции и исходу;
+  * время рендера QR;
+  * задержка event loop.
+
+Несколько воркеров uvicorn: если задан PROMETHEUS_MULTIPROC_DIR, каждый процесс
+пишет значения в mmap-файлы этого каталога, а /metrics любого воркера
+складывает их вместе. Каталог должен быть пустым при старте сервиса
+(очищайте его в entrypoint перед запуском uvicorn).
+
+На горячем пути только observe/inc по заранее найденным дочерним метрикам:
+labels() (блокировка и поиск в словаре) вызывается один раз на сочетание меток.
+"""
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("METRICS_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_OUTBOUND_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+http_requests = Counter(
+    "http_requests", "HTTP requests", ["method", "route", "status"],
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request duration", ["method", "route"],
+    buckets=_LATENCY_BUCKETS,
+)
+db_pool_checked_out = Gauge(
+    "db_pool_checked_out", "Connections checked out of the pool", multiprocess_mode="livesum",
+)
+db_pool_overflow = Gauge(
+    "db_pool_overflow", "Connections open above pool_size", multiprocess_mode="livesum",
+)
+db_pool_wait = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection", buckets=_FAST_BUCKETS,
+)
+outbound_duration = Histogram(
+    "outbound_request_duration_seconds", "Outbound calls to external services",
+    ["service", "operation", "outcome"], buckets=_OUTBOUND_BUCKETS,
+)
+qr_render_duration = Histogram(
+    "qr_render_duration_seconds", "QR image render time", buckets=_FAST_BUCKETS,
+)
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a sleeping task", buckets=_FAST_BUCKETS,
+)
+event_loop_lag_last = Gauge(
+    "event_loop_lag_last_seconds", "Last event loop lag sample (max across workers)",
+    multiprocess_mode="livemax",
+)
+
+
+# дочерние метрики по меткам: labels() дорогой, а сочетаний немного
+_request_children: Dict[Tuple[str, str, int], Tuple[object, object]] = {}
+
+
+def observe_request(method: str, route: Optional[str], status: int, elapsed: float) -> None:
+    # путь без роута (404, статика) в метку не идёт — иначе взрыв кардинальности
+    key = (method, route or "<unmatched>", status)
+    children = _request_children.get(key)
+    if children is None:
+        children = _request_children[key] = (
+            http_requests.labels(method, key[1], str(status)),
+            http_request_duration.labels(method, key[1]),
+        )
+    children[0].inc()
+    children[1].observe(elapsed)
+
+
+class OutboundCall:
+    __slots__ = ("outcome",)
+
+    def __init__(self):
+        self.outcome = "ok"
+
+    def status(self, code: int) -> None:
+        self.outcome = f"{code // 100}xx"
+
+
+@contextmanager
+def track_outbound(service: str, operation: str) -> Iterator[OutboundCall]:
+    """
+    Время внешнего вызова. Исход — ok, класс HTTP-статуса (call.status(code))
+    или имя исключения.
+    """
+    started = time.perf_counter()
+    call = OutboundCall()
+    try:
+        yield call
+    except BaseException as e:
+        call.outcome = type(e).__name__
+        raise
+    finally:
+        outbound_duration.labels(service, operation, call.outcome).observe(time.perf_counter() - started)
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Пул движка, который меряет ожидание свободного соединения."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - started)
+
+
+def install_pool_metrics(engine) -> None:
+    """Гейджи занятых и сверхлимитных соединений обновляются на checkout/checkin."""
+    pool = getattr(engine, "sync_engine", engine).pool
+
+    def on_checkout(*_):
+        db_pool_checked_out.set(pool.checkedout())
+        db_pool_overflow.set(max(pool.overflow(), 0))
+
+    def on_checkin(*_):
+        # событие приходит до возврата соединения в очередь — оно ещё считается занятым
+        db_pool_checked_out.set(max(pool.checkedout() - 1, 0))
+        db_pool_overflow.set(max(pool.overflow(), 0))
+
+    event.listen(pool, "checkout", on_checkout)
+    event.listen(pool, "checkin", on_checkin)
+
+
+async def event_loop_lag_loop(interval: float = LOOP_LAG_INTERVAL_SECONDS) -> None:
+    """Спим interval и смотрим, насколько позже нас разбудили."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        event_loop_lag.observe(lag)
+        event_loop_lag_last.set(lag)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """При остановке воркера: live-гейджи этого процесса больше не учитываются."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -3,9 +3,11 @@ from fastapi_users_db_sqlalchemy import SQLAlchemyBaseUserTable, SQLAlchemyUserD
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from sqlalchemy import (
-    Column, Integer, String, ForeignKey, Text, DateTime, Boolean
+    Column, Integer, BigInteger, String, ForeignKey, Text, Date, DateTime, Boolean, Index, DDL, event,
+    CheckConstraint, Computed, text,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from app.database import get_db, Base
 
 class User(SQLAlchemyBaseUserTable[int], Base):
@@ -60,6 +62,19 @@ class User(SQLAlchemyBaseUserTable[int], Base):
         cascade="all, delete-orphan",
     )
 
+    __table_args__ = (
+        # поиск заказов по подстроке email (ilike '%...%') в админке
+        Index(
+            "ix_users_email_trgm",
+            "email",
+            postgresql_using="gin",
+            postgresql_ops={"email": "gin_trgm_ops"},
+        ),
+    )
+
+# gin_trgm_ops живёт в расширении pg_trgm — create_all (to_start) должен его включить
+event.listen(User.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
 
 async def get_user_db(session: AsyncSession = Depends(get_db)):
     yield SQLAlchemyUserDatabase(session, User)
@@ -74,12 +89,18 @@ class Product(Base):
     description = Column(Text)
     img_url = Column(String)
     price = Column(Integer)
+    # свободный остаток (без зарезервированного); NULL — остаток не ведётся
+    stock = Column(Integer, nullable=True)
 
     qr_id = Column(Integer, ForeignKey("qrcodes.id"), nullable=True)
     qr = relationship("QRCode", back_populates="products", lazy="selectin")
 
     order_items = relationship("OrderItem", back_populates="product")
 
+    __table_args__ = (
+        CheckConstraint("stock >= 0", name="ck_products_stock_non_negative"),
+    )
+
 
 class Order(Base):
     __tablename__ = "orders"
@@ -105,6 +126,10 @@ class Order(Base):
     yandex_error = Column(String, nullable=True)
     delivery_cost = Column(Integer, default=0)
 
+    # YooKassa: id последнего платежа и его статус (pending / waiting_for_capture / succeeded / canceled)
+    payment_id = Column(String, nullable=True, index=True)
+    payment_status = Column(String, nullable=True)
+
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
     user = relationship("User", back_populates="orders", lazy="selectin")
@@ -115,6 +140,19 @@ class Order(Base):
         lazy="selectin",
     )
 
+    __table_args__ = (
+        # keyset-пагинация админского списка: (ключ сортировки, id)
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_total_amount_id", "total_amount", "id"),
+        Index("ix_orders_status_created_at_id", "status", "created_at", "id"),
+        # сверка платежей: только неоплаченные заказы с платежом
+        Index(
+            "ix_orders_pending_payment",
+            "id",
+            postgresql_where=text("status = 'pending' AND payment_id IS NOT NULL"),
+        ),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
@@ -123,7 +161,7 @@ class OrderItem(Base):
     quantity = Column(Integer, default=1, nullable=False)
     amount = Column(Integer)
 
-    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
 
     order = relationship("Order", back_populates="items", lazy="selectin")
@@ -137,11 +175,19 @@ class Review(Base):
     stars = Column(Integer, nullable=False)
     content = Column(Text, nullable=False)
     is_flagged = Column(Boolean, default=False, nullable=False)
+    # решение админа (approved | rejected): повторная модерация его не пересматривает;
+    # сбрасывается, когда автор меняет текст
+    moderation_override = Column(String, nullable=True)
 
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
     user = relationship("User", back_populates="reviews", lazy="selectin")
 
+    __table_args__ = (
+        # очередь модерации: помеченных отзывов мало, индекс покрывает keyset по id и count
+        Index("ix_reviews_flagged", "id", postgresql_where=text("is_flagged")),
+    )
+
 class Template(Base):
     """
     Шаблон = ссылка на файл, который открывает редактор.
@@ -210,6 +256,22 @@ class FAQ(Base):
     question = Column(Text, nullable=False)
     answer = Column(Text)
 
+    # полнотекстовый поиск по вопросу и ответу; считает сам Postgres при записи,
+    # в выборки FAQ не попадает (deferred)
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(
+            "to_tsvector('russian', coalesce(question, '') || ' ' || coalesce(answer, ''))",
+            persisted=True,
+        ),
+    ))
+
+    __table_args__ = (
+        Index("ix_faqs_search_vector", "search_vector", postgresql_using="gin"),
+        # счётчик и вкладка «без ответа» — индекс только по неотвеченным
+        Index("ix_faqs_unanswered", "id", postgresql_where=text("answer IS NULL")),
+    )
+
 class BadWord(Base):
     """
     Слова, запрещённые к использованию в отзывах.
@@ -219,3 +281,148 @@ class BadWord(Base):
 
     id = Column(Integer, primary_key=True)
     word = Column(String, unique=True, nullable=False)
+
+
+class SalesDaily(Base):
+    """
+    Дневной роллап продаж по товару (без отменённых/возвращённых заказов).
+    Поддерживается инкрементально хелперами заказов, ночью чинится пересчётом.
+    size/color — снимок на момент заказа; FK на products нет, чтобы история
+    переживала удаление товара.
+    """
+    __tablename__ = "sales_daily"
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    size = Column(String, nullable=True)
+    color = Column(String, nullable=True)
+    revenue = Column(BigInteger, default=0, nullable=False)
+    quantity = Column(Integer, default=0, nullable=False)
+    orders_count = Column(Integer, default=0, nullable=False)
+
+
+class SalesDayTotal(Base):
+    """Итоги дня: число заказов не выводится суммой по товарам (заказ бывает многотоварным)."""
+    __tablename__ = "sales_day_totals"
+
+    day = Column(Date, primary_key=True)
+    revenue = Column(BigInteger, default=0, nullable=False)
+    delivery_revenue = Column(BigInteger, default=0, nullable=False)
+    orders_count = Column(Integer, default=0, nullable=False)
+
+
+class IdempotencyKey(Base):
+    """
+    Ответы дорогих POST-запросов по заголовку Idempotency-Key (заказы, генерация
+    пользователей, загрузка шаблонов). status: in_progress → done.
+    Записи живут до expires_at, потом удаляются пачками фоновой задачей.
+    """
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, primary_key=True)
+    scope = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+
+    request_hash = Column(String, nullable=False)
+    status = Column(String, default="in_progress", nullable=False)
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class StockReservation(Base):
+    """
+    Резерв остатка под неоплаченный заказ. Остаток списан с products.stock сразу;
+    при оплате резерв просто удаляется, при отмене или по expires_at — возвращается.
+    """
+    __tablename__ = "stock_reservations"
+
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class PaymentEvent(Base):
+    """
+    Входящие уведомления YooKassa. PK (payment_id, event) — повторная доставка
+    того же события отбрасывается на INSERT. processed_at IS NULL — ещё не применено.
+    """
+    __tablename__ = "payment_events"
+
+    payment_id = Column(String, primary_key=True)
+    event = Column(String, primary_key=True)
+    order_id = Column(Integer, nullable=True)
+
+    received_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_payment_events_unprocessed",
+            "received_at",
+            postgresql_where=processed_at.is_(None),
+        ),
+    )
+
+
+class ModerationScan(Base):
+    """
+    Фоновая перепроверка сохранённых отзывов по списку запрещённых слов.
+    mode: flag — пометить отзывы с новыми словами (words), unflag — снять пометку,
+    если слово удалили, full — пересчитать всё. Прогресс (last_review_id) пишется
+    в той же транзакции, что и флаги, поэтому прерванный прогон продолжается с места.
+    Отзывы с решением админа (Review.moderation_override) прогон не трогает.
+    """
+    __tablename__ = "moderation_scans"
+
+    id = Column(Integer, primary_key=True)
+    mode = Column(String, nullable=False)
+    words = Column(Text, nullable=True)  # JSON-список для mode=flag
+    status = Column(String, default="pending", nullable=False)  # pending/running/done/failed
+
+    last_review_id = Column(Integer, default=0, nullable=False)
+    total = Column(Integer, nullable=True)
+    scanned = Column(Integer, default=0, nullable=False)
+    flagged = Column(Integer, default=0, nullable=False)
+    unflagged = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class EmailOutbox(Base):
+    """
+    Исходящие письма. Строка пишется в той же транзакции, что и событие (например,
+    ответ на FAQ), и переживает рестарт; отправляет mail_outbox_loop с повторами.
+    """
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+
+    # pending -> sent | failed (исчерпаны попытки или адрес отклонён)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_email_outbox_due",
+            "next_attempt_at",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
@@ -0,0 +1,219 @@
+"""
+Локальный стенд YooKassa API v3 для тестов, сверки платежей и нагрузочных прогонов.
+
+Отвечает на то, что дергает YooKassaClient: POST /v3/payments (с Idempotence-Key)
+и GET /v3/payments/{id}. Платежи хранятся в памяти; их статус двигают
+settle() / settle_all() или auto_status.
+
+Два режима запуска:
+  - в процессе:   YooKassaClient(transport=FakeYooKassa().transport())
+                  или YOOKASSA_FAKE=1 (см. app.payments.yookassa.use_transport)
+  - отдельно:     uvicorn --factory app.payments.fake_yookassa:create_app --port 8082
+                  и YOOKASSA_BASE_URL=http://localhost:8082/v3
+
+Настройки через env (FakeYooKassa.from_env):
+  FAKE_YOOKASSA_LATENCY     — распределение задержки, мс (формат как у FAKE_YANDEX_LATENCY)
+  FAKE_YOOKASSA_ERROR_RATE  — доля ответов 500 (0..1)
+  FAKE_YOOKASSA_AUTO_STATUS — статус, в который платёж переходит при первом GET
+                              (например "succeeded"); по умолчанию остаётся pending
+  FAKE_YOOKASSA_SEED        — seed генератора
+"""
+import asyncio
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from app.delivery.fake_yandex import parse_latency
+
+API_PREFIX = "/v3"
+PAYMENT_STATUSES = ("pending", "waiting_for_capture", "succeeded", "canceled")
+STATUS_EVENTS = {
+    "waiting_for_capture": "payment.waiting_for_capture",
+    "succeeded": "payment.succeeded",
+    "canceled": "payment.canceled",
+}
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class FakeYooKassa:
+    """Фейк YooKassa: платежи в памяти, идемпотентное создание, инъекция задержек и ошибок."""
+
+    def __init__(
+        self,
+        *,
+        latency: Optional[str] = None,
+        error_rate: float = 0.0,
+        auto_status: Optional[str] = None,
+        seed: Optional[int] = None,
+    ):
+        if auto_status and auto_status not in PAYMENT_STATUSES:
+            raise ValueError(f"Unknown payment status '{auto_status}'")
+        self._sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.auto_status = auto_status
+        self._rnd = random.Random(seed)
+
+        self.payments: Dict[str, dict] = {}
+        self._by_idempotence_key: Dict[str, str] = {}
+        self.calls: Dict[str, int] = {"create": 0, "get": 0}
+
+    @classmethod
+    def from_env(cls) -> "FakeYooKassa":
+        seed = os.getenv("FAKE_YOOKASSA_SEED")
+        return cls(
+            latency=os.getenv("FAKE_YOOKASSA_LATENCY"),
+            error_rate=float(os.getenv("FAKE_YOOKASSA_ERROR_RATE", "0") or 0),
+            auto_status=os.getenv("FAKE_YOOKASSA_AUTO_STATUS") or None,
+            seed=int(seed) if seed else None,
+        )
+
+    # ---------- управление состоянием из тестов ----------
+
+    def settle(self, payment_id: str, status: str) -> dict:
+        """Перевести платёж в статус (как будто покупатель оплатил / банк отказал)."""
+        if status not in PAYMENT_STATUSES:
+            raise ValueError(f"Unknown payment status '{status}'")
+        payment = self.payments[payment_id]
+        payment["status"] = status
+        payment["paid"] = status in ("waiting_for_capture", "succeeded")
+        if status == "succeeded":
+            payment["captured_at"] = _now_iso()
+        return payment
+
+    def settle_all(self, status: str) -> int:
+        pending = [pid for pid, p in self.payments.items() if p["status"] == "pending"]
+        for pid in pending:
+            self.settle(pid, status)
+        return len(pending)
+
+    def notification(self, payment_id: str, event: Optional[str] = None) -> dict:
+        """Тело вебхука, которое YooKassa прислала бы для текущего статуса платежа."""
+        payment = self.payments[payment_id]
+        return {
+            "type": "notification",
+            "event": event or STATUS_EVENTS.get(payment["status"], "payment.waiting_for_capture"),
+            "object": dict(payment),
+        }
+
+    # ---------- эндпоинты ----------
+
+    def _create(self, payload: dict, idempotence_key: Optional[str]) -> Tuple[int, Any]:
+        if not idempotence_key:
+            return 400, {"type": "error", "code": "invalid_request", "description": "Idempotence-Key is required"}
+        existing = self._by_idempotence_key.get(idempotence_key)
+        if existing:
+            return 200, self.payments[existing]
+
+        payment_id = str(uuid.uuid4())
+        payment = {
+            "id": payment_id,
+            "status": "pending",
+            "paid": False,
+            "amount": payload.get("amount"),
+            "description": payload.get("description"),
+            "metadata": payload.get("metadata") or {},
+            "created_at": _now_iso(),
+            "confirmation": {
+                "type": "redirect",
+                "return_url": (payload.get("confirmation") or {}).get("return_url"),
+                "confirmation_url": f"https://yoomoney.fake/checkout/payments/v2/contract?orderId={payment_id}",
+            },
+            "test": True,
+        }
+        self.payments[payment_id] = payment
+        self._by_idempotence_key[idempotence_key] = payment_id
+        return 200, payment
+
+    def _get(self, payment_id: str) -> Tuple[int, Any]:
+        payment = self.payments.get(payment_id)
+        if not payment:
+            return 404, {"type": "error", "code": "not_found", "description": f"Payment {payment_id} not found"}
+        if self.auto_status and payment["status"] == "pending":
+            self.settle(payment_id, self.auto_status)
+        return 200, payment
+
+    # ---------- ядро ----------
+
+    async def respond(
+        self, method: str, path: str, payload: dict, idempotence_key: Optional[str] = None
+    ) -> Tuple[int, Any]:
+        """Общая точка для MockTransport и ASGI-приложения; возвращает (status, JSON body)."""
+        endpoint = path[len(API_PREFIX):] if path.startswith(API_PREFIX) else path
+        if method == "POST" and endpoint == "/payments":
+            kind = "create"
+        elif method == "GET" and endpoint.startswith("/payments/"):
+            kind = "get"
+        else:
+            return 404, {"type": "error", "code": "not_found", "description": f"Unknown endpoint {path}"}
+        self.calls[kind] += 1
+
+        delay = self._sample_latency(self._rnd)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._rnd.random() < self.error_rate:
+            return 500, {"type": "error", "code": "internal_server_error", "description": "Injected failure"}
+
+        if kind == "create":
+            return self._create(payload, idempotence_key)
+        return self._get(endpoint[len("/payments/"):])
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        payload: dict = {}
+        if request.content:
+            try:
+                payload = json.loads(request.content)
+            except ValueError:
+                return httpx.Response(400, json={"type": "error", "code": "invalid_request"})
+        status, body = await self.respond(
+            request.method, request.url.path, payload, request.headers.get("Idempotence-Key")
+        )
+        return httpx.Response(status, json=body)
+
+    def transport(self) -> httpx.MockTransport:
+        """Транспорт для YooKassaClient(transport=...) / use_transport()."""
+        return httpx.MockTransport(self._handle)
+
+    def asgi_app(self):
+        """ASGI-приложение с тем же поведением (для запуска через uvicorn)."""
+        from starlette.applications import Starlette
+        from starlette.requests import Request
+        from starlette.responses import JSONResponse
+        from starlette.routing import Route
+
+        async def endpoint(request: Request):
+            raw = await request.body()
+            try:
+                payload = json.loads(raw) if raw else {}
+            except ValueError:
+                return JSONResponse({"type": "error", "code": "invalid_request"}, status_code=400)
+            status, body = await self.respond(
+                request.method, request.url.path, payload, request.headers.get("Idempotence-Key")
+            )
+            return JSONResponse(body, status_code=status)
+
+        async def settle(request: Request):
+            # ручное управление стендом: POST /_settle/{id}/{status}
+            try:
+                payment = self.settle(request.path_params["payment_id"], request.path_params["status"])
+            except (KeyError, ValueError) as e:
+                return JSONResponse({"error": str(e)}, status_code=400)
+            return JSONResponse(payment)
+
+        return Starlette(routes=[
+            Route(f"{API_PREFIX}/payments", endpoint=endpoint, methods=["POST"]),
+            Route(f"{API_PREFIX}/payments/{{payment_id}}", endpoint=endpoint, methods=["GET"]),
+            Route("/_settle/{payment_id}/{status}", endpoint=settle, methods=["POST"]),
+        ])
+
+
+def create_app():
+    """Фабрика для uvicorn --factory: env читается при запуске сервера, а не при импорте."""
+    return FakeYooKassa.from_env().asgi_app()
@@ -0,0 +1,127 @@
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.logging_config import app_logger
+
+
+class YooKassaError(Exception):
+    def __init__(self, message: str, code: Optional[str] = None, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+        self.status_code = status_code
+
+
+_default_transport: Optional[httpx.AsyncBaseTransport] = None
+_client: Optional["YooKassaClient"] = None
+
+
+def use_transport(transport: Optional[httpx.AsyncBaseTransport]) -> None:
+    """
+    Подменить транспорт (например, на FakeYooKassa().transport() в тестах).
+    Общий клиент пересоздаётся при следующем get_yookassa_client(). None — вернуть сеть.
+    """
+    global _default_transport, _client
+    _default_transport = transport
+    _client = None
+
+
+def _env_transport() -> Optional[httpx.AsyncBaseTransport]:
+    """YOOKASSA_FAKE=1 — ходим во встроенный стенд вместо YooKassa."""
+    global _default_transport
+    if _default_transport is None and os.getenv("YOOKASSA_FAKE", "").lower() in ("1", "true", "yes"):
+        from app.payments.fake_yookassa import FakeYooKassa
+        _default_transport = FakeYooKassa.from_env().transport()
+    return _default_transport
+
+
+class YooKassaClient:
+    """
+    Асинхронный клиент YooKassa API v3 (вместо синхронного SDK, который блокировал цикл
+    на весь HTTPS-запрос). Один httpx.AsyncClient на процесс — соединения переиспользуются.
+    """
+
+    def __init__(
+        self,
+        shop_id: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        max_connections: Optional[int] = None,
+        timeout: float = 10.0,
+    ):
+        max_connections = max_connections or int(os.getenv("YOOKASSA_MAX_CONNECTIONS", "20"))
+        self._http = httpx.AsyncClient(
+            base_url=(base_url or os.getenv("YOOKASSA_BASE_URL", "https://api.yookassa.ru/v3")).rstrip("/"),
+            auth=(shop_id or os.getenv("YOO_SHOP_ID") or "", secret_key or os.getenv("YOO_SECRET_KEY") or ""),
+            transport=transport or _env_transport(),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    async def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        try:
+            response = await self._http.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            app_logger.error(f"YooKassa {method} {path} failed: {e!r}")
+            raise YooKassaError(f"YooKassa is unavailable: {e}", code="unavailable")
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+
+        if response.status_code >= 400:
+            code = data.get("code") or str(response.status_code)
+            message = data.get("description") or response.text[:500]
+            app_logger.error(f"YooKassa API Error {response.status_code} | code={code} | message={message}")
+            raise YooKassaError(message, code=code, status_code=response.status_code)
+        return data
+
+    async def create_payment(
+        self,
+        *,
+        amount_rub: int,
+        order_id: int,
+        user_id: int,
+        return_url: str,
+        idempotence_key: str,
+        description: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Создать платёж с редиректом на форму оплаты. Повтор с тем же idempotence_key
+        вернёт тот же платёж (на стороне YooKassa), а не спишет деньги второй раз.
+        """
+        payload = {
+            "amount": {"value": f"{amount_rub:.2f}", "currency": "RUB"},
+            "payment_method_data": {"type": "bank_card"},
+            "confirmation": {"type": "redirect", "return_url": return_url},
+            "capture": True,
+            "description": description or f"Оплата заказа #{order_id}",
+            "metadata": {"order_id": order_id, "user_id": user_id},
+        }
+        return await self._request(
+            "POST", "/payments", json=payload, headers={"Idempotence-Key": idempotence_key}
+        )
+
+    async def get_payment(self, payment_id: str) -> Dict[str, Any]:
+        return await self._request("GET", f"/payments/{payment_id}")
+
+
+def get_yookassa_client() -> YooKassaClient:
+    """Общий клиент процесса (пул соединений); закрывается в lifespan."""
+    global _client
+    if _client is None:
+        _client = YooKassaClient()
+    return _client
+
+
+async def close_yookassa_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,78 @@
+"""
+Контекст текущего HTTP-запроса: request id, ASGI scope и счётчики работы с БД.
+
+Значения живут в contextvars: их выставляет RequestLoggingMiddleware, а читают
+логгеры (request_id в каждой записи) и хуки движка SQLAlchemy (число запросов
+и время в БД). SQLAlchemy выполняет курсор в greenlet с контекстом вызывающей
+задачи, поэтому синхронные события видят переменные запроса.
+"""
+import os
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from sqlalchemy import event
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# сколько SQL-запросов роут может сделать за запрос, прежде чем в лог уйдёт предупреждение
+SQL_STATEMENT_BUDGET = int(os.getenv("SQL_STATEMENT_BUDGET", "25"))
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+class RequestStats:
+    __slots__ = ("db_statements", "db_time")
+
+    def __init__(self):
+        self.db_statements = 0
+        self.db_time = 0.0
+
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+request_stats_var: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+# scope запроса: роутер Starlette дописывает в него route, когда найдёт эндпоинт
+request_scope_var: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    """Id от прокси/клиента, если он вменяемый, иначе новый."""
+    if incoming and _VALID_REQUEST_ID.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+def sql_budget(max_statements: int) -> Callable:
+    """
+    Свой бюджет SQL-запросов для роута (вместо SQL_STATEMENT_BUDGET):
+        @router.get("/qr/")
+        @sql_budget(5)
+    """
+    def decorator(func: Callable) -> Callable:
+        func.__sql_budget__ = max_statements
+        return func
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and request_stats_var.get() is not None:
+        context._request_query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = request_stats_var.get()
+    started = getattr(context, "_request_query_started", None)
+    if stats is not None and started is not None:
+        stats.db_statements += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def install_db_stats(engine) -> None:
+    """Считать запросы к БД в RequestStats текущего запроса (вызывается для общего движка)."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,203 @@
+"""
+Журнал HTTP-запросов: одна строка на запрос (метод, путь, шаблон роута, статус,
+время, число запросов к БД и время в ней, при необходимости — начало тела).
+
+Каждому запросу назначается request id (из заголовка X-Request-ID или новый): он
+лежит в contextvar, попадает во все записи логов за время запроса и
+возвращается клиенту в X-Request-ID.
+
+Работа с БД до начала ответа уходит клиенту в Server-Timing
+(db;dur=<мс>;desc="<N> queries"). Если роут сделал больше SQL-запросов, чем его
+бюджет (@sql_budget(n) или SQL_STATEMENT_BUDGET), пишется предупреждение — так
+N+1 видно по логам, а не по нагрузке на базу.
+
+Чистый ASGI-middleware: тело запроса не буферизуется. Для текстовых типов
+(JSON, form-urlencoded, text/*) по мере чтения приложением копируется только
+первые LOG_BODY_MAX_BYTES байт; multipart, бинарные и потоковые загрузки идут
+мимо. Тело пишется в лог для доли запросов LOG_BODY_SAMPLE_RATE и всегда для
+ответов 4xx/5xx. Роут может отключить журнал или тело через @request_log(...).
+"""
+import os
+import random
+import re
+import time
+from typing import Callable, Optional, Tuple
+
+from app.logging_config import LOG_FORMAT, app_logger
+from app.metrics import observe_request
+from app.request_context import (
+    REQUEST_ID_HEADER,
+    SQL_STATEMENT_BUDGET,
+    RequestStats,
+    new_request_id,
+    request_id_var,
+    request_scope_var,
+    request_stats_var,
+)
+
+LOG_BODY_MAX_BYTES = int(os.getenv("LOG_BODY_MAX_BYTES", "2048"))
+LOG_BODY_SAMPLE_RATE = float(os.getenv("LOG_BODY_SAMPLE_RATE", "1.0"))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1").lower() not in ("0", "false", "no")
+
+_TEXT_CONTENT_TYPES = (b"application/json", b"application/x-www-form-urlencoded", b"text/")
+_SENSITIVE_FIELDS = "password|token|access_token|refresh_token|secret|api_key|private_key|hashed_password"
+_SENSITIVE_JSON = re.compile(rf'("(?:{_SENSITIVE_FIELDS})"\s*:\s*)"(?:[^"\\]|\\.)*"?', re.IGNORECASE)
+_SENSITIVE_FORM = re.compile(rf"\b({_SENSITIVE_FIELDS})=[^&\s]*", re.IGNORECASE)
+
+
+def filter_sensitive_data(data: str) -> str:
+    """Скрывает пароли и токены в JSON и form/query-строках (в том числе в обрезанных)."""
+    data = _SENSITIVE_JSON.sub(r'\1"***FILTERED***"', data)
+    return _SENSITIVE_FORM.sub(r"\1=***FILTERED***", data)
+
+
+def request_log(*, enabled: bool = True, body: bool = True) -> Callable:
+    """
+    Настройки журнала для роута (ставится под декоратором роутера):
+        @router.get("/logs")
+        @request_log(enabled=False)
+    """
+    def decorator(func: Callable) -> Callable:
+        func.__request_log__ = (enabled, body)
+        return func
+    return decorator
+
+
+_REQUEST_ID_HEADER = REQUEST_ID_HEADER.lower().encode()
+
+
+def _header(scope, name: bytes) -> bytes:
+    for key, value in scope.get("headers") or ():
+        if key == name:
+            return value
+    return b""
+
+
+def _server_timing(stats: RequestStats) -> bytes:
+    return f'db;dur={stats.db_time * 1000:.1f};desc="{stats.db_statements} queries"'.encode()
+
+
+class RequestLoggingMiddleware:
+    def __init__(
+        self,
+        app,
+        *,
+        max_body_bytes: Optional[int] = None,
+        sample_rate: Optional[float] = None,
+        logger=app_logger,
+    ):
+        self.app = app
+        self.max_body_bytes = LOG_BODY_MAX_BYTES if max_body_bytes is None else max_body_bytes
+        self.sample_rate = LOG_BODY_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.logger = logger
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        request_id = new_request_id(_header(scope, _REQUEST_ID_HEADER).decode("latin-1"))
+        stats = RequestStats()
+        id_token = request_id_var.set(request_id)
+        stats_token = request_stats_var.set(stats)
+        scope_token = request_scope_var.set(scope)
+        capture = (
+            self.max_body_bytes > 0
+            and _header(scope, b"content-type").lower().startswith(_TEXT_CONTENT_TYPES)
+        )
+        body = bytearray()
+        truncated = False
+        status = 500
+
+        async def receive_and_copy():
+            nonlocal truncated
+            message = await receive()
+            if message["type"] == "http.request" and not truncated:
+                chunk = message.get("body", b"")
+                room = self.max_body_bytes - len(body)
+                body.extend(chunk[:room])
+                truncated = len(chunk) > room
+            return message
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [*message.get("headers", ()), (_REQUEST_ID_HEADER, request_id.encode())]
+                if SERVER_TIMING:
+                    headers.append((b"server-timing", _server_timing(stats)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive_and_copy if capture else receive, send_with_status)
+        except Exception as e:
+            self.logger.exception(f"ERROR handling {scope['method']} {scope['path']}: {e}")
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            observe_request(scope["method"], getattr(scope.get("route"), "path", None), status, elapsed)
+            self._check_budget(scope, stats)
+            self._log(scope, status, elapsed, stats, body if capture else None, truncated)
+            request_scope_var.reset(scope_token)
+            request_stats_var.reset(stats_token)
+            request_id_var.reset(id_token)
+
+    def _log(
+        self,
+        scope,
+        status: int,
+        elapsed: float,
+        stats: RequestStats,
+        body: Optional[bytearray],
+        truncated: bool,
+    ) -> None:
+        enabled, log_body = self._route_options(scope)
+        if not enabled:
+            return
+        target = scope["path"]
+        if scope.get("query_string"):
+            target += "?" + filter_sensitive_data(scope["query_string"].decode("latin-1"))
+        fields = {
+            "method": scope["method"],
+            "path": scope["path"],
+            # шаблон роута (/orders/{order_id}) — по нему удобно группировать
+            "route": getattr(scope.get("route"), "path", None),
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 2),
+            "db_statements": stats.db_statements,
+            "db_time_ms": round(stats.db_time * 1000, 2),
+        }
+        line = f"REQUEST {scope['method']} {target}"
+        if LOG_FORMAT != "json":
+            # в JSON всё это и так лежит отдельными полями
+            line += (
+                f" | status={status} | {elapsed * 1000:.1f}ms"
+                f" | db={stats.db_statements}/{stats.db_time * 1000:.1f}ms"
+            )
+            if fields["route"]:
+                # шаблон роута — для группировки в отчёте о задержках (/logs/latency)
+                line += f" | route={fields['route']}"
+        if log_body and body and (status >= 400 or random.random() < self.sample_rate):
+            text = filter_sensitive_data(body.decode("utf-8", errors="replace"))
+            fields["body"] = text
+            fields["body_truncated"] = truncated
+            if LOG_FORMAT != "json":
+                line += f" | body={text}{'…(truncated)' if truncated else ''}"
+        self.logger.info(line, extra=fields)
+
+    def _check_budget(self, scope, stats: RequestStats) -> None:
+        budget = getattr(scope.get("endpoint"), "__sql_budget__", SQL_STATEMENT_BUDGET)
+        if stats.db_statements > budget:
+            route = getattr(scope.get("route"), "path", scope["path"])
+            self.logger.warning(
+                f"SQL budget exceeded: {scope['method']} {route} made {stats.db_statements} "
+                f"statements (budget {budget}, {stats.db_time * 1000:.1f}ms in DB)",
+                extra={"route": route, "db_statements": stats.db_statements, "sql_budget": budget},
+            )
+
+    @staticmethod
+    def _route_options(scope) -> Tuple[bool, bool]:
+        # endpoint кладёт в scope роутер Starlette — к концу запроса он уже известен
+        return getattr(scope.get("endpoint"), "__request_log__", (True, True))
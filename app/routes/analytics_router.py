@@ -0,0 +1,80 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db
+from app.models.models import User
+from app.routes.dependecies import current_superuser
+from app.schemas.analytics_schemas import DailySalesOut, ProductSalesOut
+from app.helpers.analytics_helpers import (
+    get_daily_sales,
+    get_product_sales,
+    rebuild_sales_rollups,
+    try_lock_sales_rollups,
+)
+
+from app.error.handler import handle_error
+from app.logging_config import app_logger
+
+analytics_router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+
+def _period(date_from: Optional[date], date_to: Optional[date]) -> tuple[date, date]:
+    """По умолчанию — последние 30 дней; период не длиннее двух лет."""
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or (date_to - timedelta(days=29))
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must be <= date_to")
+    if (date_to - date_from).days > 731:
+        raise HTTPException(status_code=400, detail="Period is too long")
+    return date_from, date_to
+
+
+@analytics_router.get("/sales/daily", response_model=List[DailySalesOut])
+async def sales_daily(
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Суперюзер: выручка и число заказов по дням (из роллапов)."""
+    try:
+        return await get_daily_sales(db, *_period(date_from, date_to))
+    except Exception as e:
+        raise handle_error(e, app_logger, "sales_daily")
+
+
+@analytics_router.get("/sales/products", response_model=List[ProductSalesOut])
+async def sales_by_product(
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Суперюзер: продажи по товару/размеру/цвету за период (из роллапов)."""
+    try:
+        return await get_product_sales(db, *_period(date_from, date_to), limit=limit)
+    except Exception as e:
+        raise handle_error(e, app_logger, "sales_by_product")
+
+
+@analytics_router.post("/sales/rebuild")
+async def sales_rebuild(
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Суперюзер: принудительно пересчитать роллапы за период из заказов."""
+    try:
+        period = _period(date_from, date_to)
+        if not await try_lock_sales_rollups(db):
+            raise HTTPException(status_code=409, detail="Sales rollup rebuild is already running")
+        await rebuild_sales_rollups(db, *period)
+        await db.commit()
+        return {"status": "success", "date_from": period[0], "date_to": period[1]}
+    except Exception as e:
+        raise handle_error(e, app_logger, "sales_rebuild")
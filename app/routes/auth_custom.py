@@ -2,7 +2,7 @@ import os
 import random
 import string
 import uuid
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, UploadFile
 from pydantic import EmailStr, BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -17,6 +17,7 @@ from app.helpers.users import set_user_avatar
 from app.helpers.codegen import ensure_user_editor_and_qr, _editor_url, set_editor_current_template
 from app.auth.manager import get_user_manager
 from fastapi_users import models as fu_models
+from app.helpers.idempotency_helpers import run_idempotent
 from app.error.handler import handle_error
 from app.logging_config import app_logger
 
@@ -75,6 +76,7 @@ class GeneratedUserCredentials(BaseModel):
 @auth_custom_router.post("/generate-random", response_model=GeneratedUserCredentials)
 async def generate_random_user(
     base_url: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     user_manager = Depends(get_user_manager),
     superuser: User = Depends(current_superuser),
     db: AsyncSession = Depends(get_db),
@@ -83,7 +85,21 @@ async def generate_random_user(
     Генерация рандомного пользователя (для раздачи на бумажках).
     Только для суперюзеров (админов).
     Возвращает логин, пароль и ссылку на QR.
+    С Idempotency-Key повтор не создаёт второго пользователя: пароль в БД не хранится,
+    поэтому повтор получает 409 с id уже созданного.
     """
+    return await run_idempotent(
+        idempotency_key,
+        scope="generate_random_user",
+        user_id=superuser.id,
+        payload={"base_url": base_url},
+        handler=lambda: _generate_random_user(base_url, user_manager, db),
+        response_model=GeneratedUserCredentials,
+        stored_fields=("id",),
+    )
+
+
+async def _generate_random_user(base_url: Optional[str], user_manager, db: AsyncSession) -> GeneratedUserCredentials:
     # 1. Generate random credentials
     # Password: 8 chars (letters + digits)
     alphabet = string.ascii_letters + string.digits
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
-from app.schemas.faq_schemas import FAQCreate, FAQRead, FAQAnswer
-from app.helpers.faq_helpers import create_faq_helper, get_all_faqs_helper, answer_faq_helper
+from app.schemas.faq_schemas import FAQCreate, FAQRead, FAQAnswer, FAQInboxOut
+from app.helpers.faq_helpers import create_faq_helper, get_all_faqs_helper, get_faq_inbox_helper, answer_faq_helper
 from app.models.models import User
 from .dependecies import current_superuser
 
@@ -39,11 +41,26 @@ async def get_all_faqs(
         raise handle_error(e, app_logger, "get_all_faqs")
 
 
+@faq_router.get("/inbox", response_model=FAQInboxOut)
+async def get_faq_inbox(
+    status: Literal["all", "answered", "unanswered"] = Query("all"),
+    q: Optional[str] = Query(None, max_length=200, description="Поиск по вопросу и ответу"),
+    before_id: Optional[int] = Query(None, description="next_cursor предыдущей страницы"),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(current_superuser),
+):
+    """Вопросы постранично с фильтром и поиском (только для суперюзера)."""
+    try:
+        return await get_faq_inbox_helper(db, status=status, q=q, before_id=before_id, limit=limit)
+    except Exception as e:
+        raise handle_error(e, app_logger, "get_faq_inbox")
+
+
 @faq_router.put("/{faq_id}/answer", response_model=FAQRead)
 async def answer_faq(
     faq_id: int,
     data: FAQAnswer,
-    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     user: User = Depends(current_superuser),
 ):
@@ -55,11 +72,6 @@ async def answer_faq(
                 status_code=404,
                 detail={"error": "not_found", "msg": "FAQ not found"}
             )
-            
-        from app.helpers.email_helpers import send_faq_answer_email
-        if faq.email and faq.answer:
-            background_tasks.add_task(send_faq_answer_email, faq.email, faq.question, faq.answer)
-            
         return faq
     except Exception as e:
         raise handle_error(e, app_logger, "answer_faq")
@@ -1,13 +1,27 @@
+import asyncio
 import os
-from typing import List
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
 from app.routes.dependecies import current_superuser
 from app.models.models import User
+from app.request_logging import request_log
+from app.helpers.latency_report_helpers import get_latency_report
+from app.slow_queries import reset_slow_queries, slow_query_detail, slow_query_report
+from app.helpers.logs_helpers import (
+    LogQuery,
+    follow_log_file,
+    open_log,
+    read_lines_after,
+    search_logs,
+    tail_with_offset,
+)
 
 logs_router = APIRouter(prefix="/logs", tags=["logs"])
 
@@ -17,7 +31,8 @@ PROJECT_ROOT = os.path.abspath(os.path.join(APP_DIR, "..")) # ...
 DEFAULT_LOGS_DIR = os.path.join(PROJECT_ROOT, "logs")
 
 LOGS_DIR = os.path.abspath(os.getenv("LOGS_DIR", DEFAULT_LOGS_DIR))
-ALLOWED_EXT = {".log", ".txt"}
+# app.log, app.log.3, app.log.3.gz — текущий файл и его бэкапы
+_LOG_FILE = re.compile(r"^(?P<base>[\w.-]+?(?P<ext>\.log|\.txt))(?:\.(?P<n>\d+))?(?P<gz>\.gz)?$", re.IGNORECASE)
 
 def _ensure_logs_dir_exists():
     if not os.path.isdir(LOGS_DIR):
@@ -26,8 +41,7 @@ def _ensure_logs_dir_exists():
 def _safe_join_logs(filename: str) -> str:
     if "/" in filename or "\\" in filename:
         raise HTTPException(status_code=400, detail="invalid filename")
-    base, ext = os.path.splitext(filename)
-    if ext.lower() not in ALLOWED_EXT:
+    if not _LOG_FILE.match(filename):
         raise HTTPException(status_code=400, detail="unsupported extension")
     full = os.path.abspath(os.path.join(LOGS_DIR, filename))
     root = os.path.abspath(LOGS_DIR)
@@ -37,23 +51,6 @@ def _safe_join_logs(filename: str) -> str:
         raise HTTPException(status_code=404, detail="file not found")
     return full
 
-def _tail_lines(path: str, limit: int) -> List[str]:
-    # эффективный tail последних N строк
-    try:
-        fsize = os.path.getsize(path)
-    except OSError:
-        return []
-    block = 8192
-    data = bytearray()
-    with open(path, "rb") as f:
-        pos = fsize
-        while pos > 0 and data.count(b"\n") <= limit:
-            read = block if pos - block > 0 else pos
-            pos -= read
-            f.seek(pos)
-            data[:0] = f.read(read)
-    return [l.decode(errors="replace") for l in data.splitlines()[-limit:]]
-
 @logs_router.get("/files", response_model=List[str])
 async def list_log_files(
     user: User = Depends(current_superuser),
@@ -63,13 +60,21 @@ async def list_log_files(
     files = []
     for name in os.listdir(LOGS_DIR):
         full = os.path.join(LOGS_DIR, name)
-        if os.path.isfile(full) and os.path.splitext(name)[1].lower() in ALLOWED_EXT:
-            files.append(name)
+        m = _LOG_FILE.match(name)
+        if os.path.isfile(full) and m:
+            files.append((m, name))
     weight = {"error": 0, "app": 1, "db": 2, "access": 3}
-    files.sort(key=lambda n: (weight.get(os.path.splitext(n)[0], 9), n.lower()))
-    return files
+    # сначала текущие файлы, бэкапы — после своего файла от новых к старым
+    files.sort(key=lambda f: (
+        weight.get(os.path.splitext(f[0]["base"])[0], 9),
+        f[0]["base"].lower(),
+        int(f[0]["n"] or 0),
+    ))
+    return [name for _, name in files]
 
 @logs_router.get("", response_model=dict)
+# страница логов опрашивает этот роут постоянно — не пишем его в тот же app.log
+@request_log(enabled=False)
 async def get_log_tail(
     file: str = Query(..., description="имя файла, напр. app.log"),
     limit: int = Query(1000, ge=1, le=5000),
@@ -78,28 +83,184 @@ async def get_log_tail(
 ):
     _ensure_logs_dir_exists()
     path = _safe_join_logs(file)
-    lines = _tail_lines(path, limit)
-    return {"file": file, "lines": lines, "dir": LOGS_DIR}
+    lines, offset, inode = await asyncio.to_thread(tail_with_offset, path, limit)
+    # offset/inode — курсор для /logs/tail и /logs/follow
+    return {"file": file, "lines": lines, "dir": LOGS_DIR, "offset": offset, "inode": inode}
+
+
+@logs_router.get("/tail", response_model=dict)
+@request_log(enabled=False)
+async def get_log_lines_after(
+    file: str = Query(...),
+    offset: int = Query(0, ge=0, description="курсор из предыдущего ответа"),
+    inode: Optional[int] = Query(None, description="inode из предыдущего ответа (для обнаружения ротации)"),
+    user: User = Depends(current_superuser),
+):
+    """Строки, дописанные после offset, и новый курсор (до 1 МБ за ответ, см. more)."""
+    _ensure_logs_dir_exists()
+    path = _safe_join_logs(file)
+    chunk = await asyncio.to_thread(read_lines_after, path, offset, inode)
+    return {"file": file, **chunk}
+
+
+@logs_router.get("/follow")
+@request_log(enabled=False)
+async def follow_log(
+    file: str = Query(...),
+    offset: int = Query(..., ge=0),
+    inode: Optional[int] = Query(None),
+    user: User = Depends(current_superuser),
+):
+    """SSE: новые строки файла по мере записи (event: lines, data — как у /logs/tail)."""
+    _ensure_logs_dir_exists()
+    path = _safe_join_logs(file)
+    return StreamingResponse(
+        follow_log_file(path, offset, inode),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@logs_router.get("/search")
+@request_log(body=False)
+async def search_log(
+    file: str = Query(..., description="базовое имя, напр. app.log; бэкапы .1–.N ищутся тоже"),
+    since: Optional[datetime] = Query(None, description="без зоны — локальное время сервера"),
+    until: Optional[datetime] = Query(None),
+    level: Optional[str] = Query(None, description="минимальный уровень: DEBUG/INFO/WARNING/ERROR/CRITICAL"),
+    logger: Optional[str] = Query(None, description="логгер и его потомки, напр. app или sqlalchemy.engine"),
+    q: Optional[str] = Query(None, max_length=200, description="подстрока (или regex при regex=true)"),
+    regex: bool = Query(False),
+    case: bool = Query(False, description="учитывать регистр"),
+    rotated: bool = Query(True, description="искать и в ротированных файлах"),
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = Query(None, description="inode:offset из cursor прошлого ответа — продолжить поиск"),
+    user: User = Depends(current_superuser),
+):
+    """
+    Поиск записей (с многострочными traceback) по времени, уровню, логгеру и тексту.
+    Ответ — NDJSON: строки {"type":"match",...} по мере нахождения и итоговая
+    {"type":"done",...}; при truncated=true в ней cursor для продолжения.
+    """
+    _ensure_logs_dir_exists()
+    path = _safe_join_logs(file)
+    try:
+        query = LogQuery(since, until, level, logger, q, regex=regex, ignore_case=not case)
+    except (re.error, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"invalid query: {e}")
+    resume = None
+    if cursor:
+        inode, _, offset = cursor.partition(":")
+        if not inode.isdigit() or not offset.isdigit():
+            raise HTTPException(status_code=400, detail="invalid cursor")
+        resume = (int(inode), int(offset))
+
+    # имя бэкапа (app.log.3.gz) — ищем только в нём
+    is_segment = _LOG_FILE.match(file)["base"] != file
+    results = search_logs(path, query, limit=limit, cursor=resume, include_rotated=rotated and not is_segment)
+    # ошибку курсора отдаём 400, а не обрывом уже начатого потока
+    try:
+        first = await results.__anext__()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream():
+        yield first
+        async for line in results:
+            yield line
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@logs_router.get("/latency", response_model=dict)
+async def latency_report(
+    file: str = Query("app.log", description="журнал со строками REQUEST (бэкапы учитываются)"),
+    since: Optional[datetime] = Query(None, description="по умолчанию — последние сутки"),
+    until: Optional[datetime] = Query(None),
+    route: Optional[str] = Query(None, description="подстрока в \"METHOD /шаблон\""),
+    limit: int = Query(200, ge=1, le=2000),
+    user: User = Depends(current_superuser),
+):
+    """
+    Задержки по роуту и статусу за период: число запросов, среднее, p50/p95/p99,
+    максимум. Строки отсортированы по суммарному времени.
+    """
+    _ensure_logs_dir_exists()
+    path = _safe_join_logs(file)
+    # без зоны — локальное время сервера, как в /logs/search
+    until = (until or datetime.now()).astimezone()
+    since = (since or until - timedelta(days=1)).astimezone()
+    if since > until:
+        raise HTTPException(status_code=400, detail="since must be <= until")
+    return await get_latency_report(path, since, until, route=route, limit=limit)
+
+@logs_router.get("/slow-queries", response_model=dict)
+async def slow_queries(
+    sort: str = Query("total_ms", pattern="^(total_ms|max_ms|mean_ms|count)$"),
+    limit: int = Query(50, ge=1, le=500),
+    user: User = Depends(current_superuser),
+):
+    """
+    Медленные SQL-запросы, сгруппированные по отпечатку (SQL без литералов):
+    число, время, роуты, форма параметров и сводка плана. workers — воркеры,
+    чья статистика вошла в отчёт (все — при SLOW_QUERY_DIR, иначе только pid).
+    """
+    return await slow_query_report(sort=sort, limit=limit)
+
+@logs_router.get("/slow-queries/{fingerprint}", response_model=dict)
+async def slow_query(
+    fingerprint: str,
+    user: User = Depends(current_superuser),
+):
+    """Отпечаток целиком: все роуты и последний снятый план (EXPLAIN FORMAT JSON)."""
+    detail = await slow_query_detail(fingerprint)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Fingerprint not found")
+    return detail
+
+@logs_router.delete("/slow-queries", response_model=dict)
+async def clear_slow_queries(user: User = Depends(current_superuser)):
+    """Сбросить накопленную статистику (например, после добавления индекса) во всех воркерах."""
+    await reset_slow_queries()
+    return {"status": "ok"}
 
 @logs_router.get("/download")
 async def download_log(
+    request: Request,
     file: str = Query(...),
+    compressed: bool = Query(False, description="для .gz — отдать файлом .gz как есть"),
     user: User = Depends(current_superuser),
     db: AsyncSession = Depends(get_db),
 ):
+    """
+    Скачать лог. Сжатый сегмент отдаётся без перепаковки: файлом .gz при
+    compressed=true или как text/plain с Content-Encoding: gzip, если клиент его
+    принимает (браузер распакует сам). Иначе распаковывается на сервере.
+    """
     _ensure_logs_dir_exists()
     path = _safe_join_logs(file)
+    name = os.path.basename(path)
+    is_gzip = name.endswith(".gz")
+    passthrough = is_gzip and (compressed or "gzip" in request.headers.get("accept-encoding", ""))
 
     def stream():
-        with open(path, "rb") as f:
+        with (open(path, "rb") if passthrough else open_log(path)) as f:
             while True:
                 chunk = f.read(64 * 1024)
                 if not chunk:
                     break
                 yield chunk
 
-    return StreamingResponse(
-        stream(),
-        media_type="text/plain",
-        headers={"Content-Disposition": f'attachment; filename="{os.path.basename(path)}"'},
-    )
+    if is_gzip and compressed:
+        return StreamingResponse(
+            stream(),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{name}"'},
+        )
+    headers = {"Content-Disposition": f'attachment; filename="{name[:-3] if is_gzip else name}"'}
+    if passthrough:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(stream(), media_type="text/plain", headers=headers)
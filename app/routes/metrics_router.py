@@ -0,0 +1,22 @@
+import secrets
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from app.metrics import METRICS_TOKEN, render_metrics
+from app.request_logging import request_log
+
+metrics_router = APIRouter(tags=["metrics"])
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+# Prometheus опрашивает каждые несколько секунд — в журнал запросов не пишем
+@request_log(enabled=False)
+async def metrics(request: Request):
+    """Метрики в текстовом формате Prometheus; при заданном METRICS_TOKEN — только с Bearer-токеном."""
+    if METRICS_TOKEN:
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ")
+        if not secrets.compare_digest(supplied, METRICS_TOKEN):
+            raise HTTPException(status_code=401, detail="invalid metrics token")
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
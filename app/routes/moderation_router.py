@@ -1,10 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
 
 from app.database import get_db
-from app.models.models import User, BadWord
+from app.models.models import User, BadWord, ModerationScan
 from app.routes.dependecies import current_superuser
+from app.helpers.moderation import find_bad_words, normalize_bad_word, rebuild_bad_word_matcher
+from app.helpers.bad_words_helpers import import_bad_words, iter_bad_words_export, read_bad_words_upload
+from app.helpers.remoderation_helpers import (
+    enqueue_remoderation,
+    list_remoderation_scans,
+    resume_remoderation,
+)
 from pydantic import BaseModel
 
 from app.error.handler import handle_error
@@ -22,6 +34,43 @@ class BadWordRead(BaseModel):
     class Config:
         orm_mode = True
 
+class BadWordImportOut(BaseModel):
+    received: int
+    unique: int
+    inserted: int
+    skipped: int
+    invalid: int
+    scan_id: Optional[int] = None
+
+class BadWordCheckIn(BaseModel):
+    text: str
+
+class BadWordCheckOut(BaseModel):
+    flagged: bool
+    matches: list[str]
+
+class ModerationScanCreate(BaseModel):
+    mode: Literal["flag", "unflag", "full"] = "full"
+    words: Optional[list[str]] = None
+
+class ModerationScanRead(BaseModel):
+    id: int
+    mode: str
+    status: str
+    last_review_id: int
+    total: Optional[int] = None
+    scanned: int
+    flagged: int
+    unflagged: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
 
 @moderation_router.get("/bad-words", response_model=list[BadWordRead])
 async def get_bad_words(
@@ -44,24 +93,59 @@ async def create_bad_word(
 ):
     """Добавить новое запрещённое слово (для админа)."""
     try:
-        # Проверим, нет ли уже такого слова
-        word_lower = data.word.strip().lower()
+        word_lower = normalize_bad_word(data.word)
         if not word_lower:
             raise HTTPException(status_code=400, detail="Word cannot be empty")
-            
-        existing = await db.execute(select(BadWord).where(BadWord.word == word_lower))
-        if existing.scalar_one_or_none():
+
+        # дубликат отсекает ON CONFLICT DO NOTHING, без предварительного SELECT
+        bad_word = await db.scalar(
+            insert(BadWord)
+            .values(word=word_lower)
+            .on_conflict_do_nothing(index_elements=[BadWord.word])
+            .returning(BadWord)
+        )
+        if bad_word is None:
             raise HTTPException(status_code=400, detail="Word already exists in bad words list")
-            
-        bad_word = BadWord(word=word_lower)
-        db.add(bad_word)
         await db.commit()
-        await db.refresh(bad_word)
+        await rebuild_bad_word_matcher(db)
+        # уже сохранённые отзывы с этим словом пометит фоновый прогон
+        await enqueue_remoderation(db, "flag", [word_lower])
         return bad_word
     except Exception as e:
         raise handle_error(e, app_logger, "create_bad_word")
 
 
+@moderation_router.post("/bad-words/bulk", response_model=BadWordImportOut)
+async def import_bad_words_bulk(
+    file: UploadFile = File(..., description="Слово на строку (.txt) или CSV, первая колонка"),
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Массово загрузить запрещённые слова; дубликаты пропускаются (для админа)."""
+    try:
+        is_csv = (file.filename or "").lower().endswith(".csv") or file.content_type == "text/csv"
+        return await import_bad_words(db, await read_bad_words_upload(file), is_csv=is_csv)
+    except Exception as e:
+        raise handle_error(e, app_logger, "import_bad_words_bulk")
+
+
+@moderation_router.get("/bad-words/export")
+async def export_bad_words(
+    format: Literal["txt", "csv"] = Query("txt"),
+    user: User = Depends(current_superuser),
+):
+    """Выгрузить список запрещённых слов потоком (для админа)."""
+    try:
+        media_type = "text/csv" if format == "csv" else "text/plain"
+        return StreamingResponse(
+            iter_bad_words_export(format),
+            media_type=f"{media_type}; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="bad_words.{format}"'},
+        )
+    except Exception as e:
+        raise handle_error(e, app_logger, "export_bad_words")
+
+
 @moderation_router.delete("/bad-words/{word_id}")
 async def delete_bad_word(
     word_id: int,
@@ -76,6 +160,77 @@ async def delete_bad_word(
             
         await db.delete(bad_word)
         await db.commit()
+        await rebuild_bad_word_matcher(db)
+        await enqueue_remoderation(db, "unflag")
         return {"status": "success", "message": "Bad word deleted"}
     except Exception as e:
         raise handle_error(e, app_logger, "delete_bad_word")
+
+
+@moderation_router.post("/check", response_model=BadWordCheckOut)
+async def check_text(
+    data: BadWordCheckIn,
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Проверить текст текущим списком слов: какие слова нашлись (для админа)."""
+    try:
+        matches = await find_bad_words(db, data.text)
+        return {"flagged": bool(matches), "matches": matches}
+    except Exception as e:
+        raise handle_error(e, app_logger, "check_text")
+
+
+@moderation_router.get("/scans", response_model=list[ModerationScanRead])
+async def get_moderation_scans(
+    limit: int = Query(20, ge=1, le=100),
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Последние прогоны перепроверки отзывов с прогрессом (для админа)."""
+    try:
+        return await list_remoderation_scans(db, limit=limit)
+    except Exception as e:
+        raise handle_error(e, app_logger, "get_moderation_scans")
+
+
+@moderation_router.get("/scans/{scan_id}", response_model=ModerationScanRead)
+async def get_moderation_scan(
+    scan_id: int,
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Прогресс одного прогона (для админа)."""
+    try:
+        scan = await db.get(ModerationScan, scan_id)
+        if not scan:
+            raise HTTPException(status_code=404, detail="Scan not found")
+        return scan
+    except Exception as e:
+        raise handle_error(e, app_logger, "get_moderation_scan")
+
+
+@moderation_router.post("/scans", response_model=ModerationScanRead, status_code=202)
+async def create_moderation_scan(
+    data: ModerationScanCreate,
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Запустить перепроверку сохранённых отзывов вручную (для админа)."""
+    try:
+        return await enqueue_remoderation(db, data.mode, data.words)
+    except Exception as e:
+        raise handle_error(e, app_logger, "create_moderation_scan")
+
+
+@moderation_router.post("/scans/{scan_id}/resume", response_model=ModerationScanRead, status_code=202)
+async def resume_moderation_scan(
+    scan_id: int,
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Продолжить упавший прогон с последнего обработанного отзыва (для админа)."""
+    try:
+        return await resume_remoderation(db, scan_id)
+    except Exception as e:
+        raise handle_error(e, app_logger, "resume_moderation_scan")
@@ -1,5 +1,6 @@
-from typing import List
-from fastapi import APIRouter, Depends, Query, status
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Header, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
@@ -19,6 +20,7 @@ from app.helpers.order_helpers import (
     get_order_secure,
     list_orders_for_user,
     list_all_orders,
+    encode_order_cursor,
     admin_add_item_to_order,
     admin_remove_item_from_order,
     admin_delete_order,
@@ -28,6 +30,9 @@ from app.helpers.order_helpers import (
     sync_order_delivery_status,
 )
 
+from app.helpers.order_export_helpers import iter_orders_export, gzip_stream
+from app.helpers.idempotency_helpers import run_idempotent
+
 from app.error.handler import handle_error
 from app.logging_config import app_logger
 
@@ -37,19 +42,32 @@ orders_router = APIRouter(prefix="/orders", tags=["orders"])
 @orders_router.post("", response_model=OrderOut, status_code=status.HTTP_201_CREATED)
 async def orders_create(
     payload: OrderCreateIn,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     user: User = Depends(current_user),
     db: AsyncSession = Depends(get_db),
 ):
+    """Создать заказ. С Idempotency-Key повтор вернёт уже созданный заказ, а не новый."""
     try:
         items = [(it.product_id, it.quantity) for it in payload.items]
-        order = await create_order(
-            db, user, items,
-            contact_info=payload.contact_info, country=payload.country,
-            city=payload.city, first_name=payload.first_name,
-            last_name=payload.last_name, delivery_address=payload.delivery_address,
-            zip_code=payload.zip_code, use_yandex_delivery=payload.use_yandex_delivery
+
+        async def _create():
+            return await create_order(
+                db, user, items,
+                contact_info=payload.contact_info, country=payload.country,
+                city=payload.city, first_name=payload.first_name,
+                last_name=payload.last_name, delivery_address=payload.delivery_address,
+                zip_code=payload.zip_code, use_yandex_delivery=payload.use_yandex_delivery
+            )
+
+        return await run_idempotent(
+            idempotency_key,
+            scope="orders_create",
+            user_id=user.id,
+            payload=payload,
+            handler=_create,
+            response_model=OrderOut,
+            status_code=status.HTTP_201_CREATED,
         )
-        return order
     except Exception as e:
         raise handle_error(e, app_logger, "orders_create")
 
@@ -68,6 +86,29 @@ async def orders_list_mine(
         raise handle_error(e, app_logger, "orders_list_mine")
 
 
+@orders_router.get("/export")
+async def orders_export(
+    request: Request,
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="ndjson|csv"),
+    email: str | None = Query(None, description="фильтр по email пользователя"),
+    statuses: str | None = Query(None, description="список статусов через запятую"),
+    sort: str | None = Query(None, description="total_asc|total_desc|created_asc|created_desc"),
+    user: User = Depends(current_superuser),
+):
+    """Суперюзер: потоковая выгрузка заказов с позициями (те же фильтры, что у списка)."""
+    try:
+        body = iter_orders_export(fmt=format, email=email, statuses=statuses, sort=sort)
+        media_type = "application/x-ndjson" if format == "ndjson" else "text/csv; charset=utf-8"
+        headers = {"Content-Disposition": f'attachment; filename="orders.{format}"'}
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            body = gzip_stream(body)
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+        return StreamingResponse(body, media_type=media_type, headers=headers)
+    except Exception as e:
+        raise handle_error(e, app_logger, "orders_export")
+
+
 @orders_router.get("/{order_id}", response_model=OrderOut)
 async def orders_get_one(
     order_id: int,
@@ -83,8 +124,10 @@ async def orders_get_one(
 
 @orders_router.get("/", response_model=List[OrderOut])
 async def orders_list_all(
+    response: Response,
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
+    cursor: str | None = Query(None, description="курсор следующей страницы (заголовок X-Next-Cursor)"),
     email: str | None = Query(None, description="фильтр по email пользователя"),
     statuses: str | None = Query(None, description="список статусов через запятую"),
     sort: str | None = Query(None, description="total_asc|total_desc|created_asc|created_desc"),
@@ -99,7 +142,10 @@ async def orders_list_all(
             email=email,
             statuses=statuses,
             sort=sort,
+            cursor=cursor,
         )
+        if len(rows) == limit:
+            response.headers["X-Next-Cursor"] = encode_order_cursor(rows[-1], sort)
         return rows
     except Exception as e:
         raise handle_error(e, app_logger, "orders_list_all")
@@ -1,115 +1,95 @@
-import os
-from fastapi import APIRouter, HTTPException, Request, Depends
-from pydantic import BaseModel
-from yookassa import Payment, Configuration
-from uuid import uuid4
-from dotenv import load_dotenv
-from app.routes.dependecies import current_user, current_superuser
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from app.database import get_db
-from app.models.models import Order, User
-
-load_dotenv()
-
-SHOP_ID = os.getenv("YOO_SHOP_ID")
-SECRET_KEY = os.getenv("YOO_SECRET_KEY")
-
-Configuration.account_id = SHOP_ID
-Configuration.secret_key = SECRET_KEY
+from app.models.models import User
+from app.routes.dependecies import current_user, current_superuser
+from app.schemas.payment_schemas import (
+    PaymentChangeOut,
+    PaymentCreateOut,
+    PaymentReconcileOut,
+    PaymentRequest,
+)
+from app.helpers.payment_helpers import (
+    create_payment_for_order,
+    reconcile_payments,
+    record_payment_event,
+    webhook_source_allowed,
+)
+
+from app.error.handler import handle_error
+from app.logging_config import app_logger
 
 payment_router = APIRouter(prefix="/payment", tags=["payment"])
 
 
-class PaymentRequest(BaseModel):
-    order_id: int
-    amount: float
-
-
-@payment_router.post("/create")
+@payment_router.post("/create", response_model=PaymentCreateOut)
 async def create_payment(
-        req: PaymentRequest,
-        user: User = Depends(current_user),   # ← ОБЯЗАТЕЛЬНО!
-        session: AsyncSession = Depends(get_db)
+    req: PaymentRequest,
+    user: User = Depends(current_user),
+    db: AsyncSession = Depends(get_db),
 ):
-    # ⚡ 1. Гарантированно ищем заказ ТОЛЬКО ПОЛЬЗОВАТЕЛЯ
-    query = (
-        select(Order)
-        .where(
-            Order.id == req.order_id,
-            Order.user_id == user.id   # ← ВАЖНО
-        )
-    )
-
-    result = await session.execute(query)
-    order = result.scalar_one_or_none()
-
-    # Если SQLAlchemy отдало кеш — пытаемся принудительно получить из БД
-    if not order:
-        await session.commit()     # сбрасываем транзакцию, открываем новую
-        await session.flush()
-        order = await session.get(Order, req.order_id)
-
-        # проверяем повторно
-        if not order or order.user_id != user.id:
-            raise HTTPException(404, "Order not found")
-
-    # 2. Создаём платёж
+    """Платёж YooKassa за свой заказ; повтор вернёт незавершённый платёж, а не создаст новый."""
     try:
-        payment = Payment.create({
-            "amount": {
-                "value": f"{req.amount:.2f}",
-                "currency": "RUB"
-            },
-            "payment_method_data": {
-                "type": "bank_card"
-            },
-            "confirmation": {
-                "type": "redirect",
-                "return_url": "http://localhost:5173/payment/success"
-            },
-            "capture": True,
-            "description": f"Оплата заказа #{req.order_id}",
-            "metadata": {
-                "order_id": req.order_id,
-                "user_id": user.id
-            }
-        }, uuid4())
-
-        # 3. Сохраняем payment_id
-        order.payment_id = payment.id
-        await session.commit()
-
-        return {
-            "payment_id": payment.id,
-            "redirect_url": payment.confirmation.confirmation_url,
-        }
-
+        return await create_payment_for_order(db, user, req.order_id)
     except Exception as e:
-        raise HTTPException(400, detail=str(e))
-
+        raise handle_error(e, app_logger, "create_payment")
 
 
 @payment_router.post("/webhook")
 async def yookassa_webhook(
-        request: Request,
-        session: AsyncSession = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db),
 ):
-    data = await request.json()
-
-    event = data.get("event")
-    obj = data.get("object")
-
-    if event == "payment.succeeded":
-        order_id = obj["metadata"]["order_id"]
-
-        query = select(Order).where(Order.id == order_id)
-        result = await session.execute(query)
-        order = result.scalar_one_or_none()
+    """
+    Уведомления YooKassa: проверяем отправителя, кладём событие в payment_events
+    (дубликаты отбрасываются) и сразу отвечаем 200. Статус заказа меняет
+    payment_events_loop пачкой, перечитав платёж из API.
+    """
+    try:
+        if not webhook_source_allowed(
+            request.client.host if request.client else None,
+            request.headers.get("X-Forwarded-For"),
+        ):
+            raise HTTPException(status_code=403, detail="Forbidden")
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Malformed notification")
+        await record_payment_event(db, body)
+        return {"status": "ok"}
+    except Exception as e:
+        raise handle_error(e, app_logger, "yookassa_webhook")
 
-        if order:
-            order.status = "paid"
-            await session.commit()
 
-    return {"status": "ok"}
+@payment_router.post("/reconcile", response_model=PaymentReconcileOut)
+async def payments_reconcile(
+    dry_run: bool = Query(True, description="Только отчёт, без изменения заказов"),
+    concurrency: int = Query(10, ge=1, le=50),
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Суперюзер: сверить зависшие неоплаченные заказы с YooKassa (вместо ручной проверки в кабинете)."""
+    try:
+        report = await reconcile_payments(db, dry_run=dry_run, concurrency=concurrency)
+        return PaymentReconcileOut(
+            dry_run=report.dry_run,
+            scanned=report.scanned,
+            fetched=report.fetched,
+            missing=report.missing,
+            failed=report.failed,
+            changes=[
+                PaymentChangeOut(
+                    order_id=c.order_id,
+                    payment_id=c.payment_id,
+                    payment_status_from=c.payment_status[0],
+                    payment_status_to=c.payment_status[1],
+                    status_from=c.status[0],
+                    status_to=c.status[1],
+                    note=c.note,
+                )
+                for c in report.changes
+            ],
+        )
+    except Exception as e:
+        raise handle_error(e, app_logger, "payments_reconcile")
@@ -7,7 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.models.models import User
 from app.routes.dependecies import current_user, current_superuser
-from app.schemas.product_schemas import ProductOut, ProductUpdateIn
+from app.schemas.product_schemas import ProductOut, ProductUpdateIn, StockAdjustIn
 from app.helpers.product_helpers import (
     list_products,
     get_product_by_id,
@@ -16,6 +16,7 @@ from app.helpers.product_helpers import (
     replace_product_image,
     delete_product,
 )
+from app.helpers.stock_helpers import adjust_product_stock
 from app.s3.s3 import S3Client
 
 from app.error.handler import handle_error
@@ -75,6 +76,7 @@ async def product_create(
     color: str = Form(..., description="Цвет, например 'Белый'"),
     description: Optional[str] = Form(default=None),
     price: int = Form(..., ge=0, description="Цена в минимальных денежных единицах"),  # <--- НОВОЕ
+    stock: Optional[int] = Form(default=None, ge=0, description="Остаток; пусто — не вести учёт"),
     image: UploadFile = File(...),
     user: User = Depends(current_superuser),
     db: AsyncSession = Depends(get_db),
@@ -90,6 +92,7 @@ async def product_create(
             description=description,
             image_file=image,
             price=price,  # <--- передаем цену в хелпер
+            stock=stock,
         )
         return product
     except Exception as e:
@@ -119,6 +122,20 @@ async def product_update_meta_route(
         raise handle_error(e, app_logger, "product_update_meta")
 
 
+@products_router.post("/{product_id}/stock", response_model=ProductOut)
+async def product_adjust_stock(
+    product_id: int,
+    payload: StockAdjustIn,
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    try:
+        product = await adjust_product_stock(db, user, product_id, payload.delta)
+        return product
+    except Exception as e:
+        raise handle_error(e, app_logger, "product_adjust_stock")
+
+
 @products_router.patch("/{product_id}/image", response_model=ProductOut)
 async def product_update_image(
     product_id: int,
@@ -2,9 +2,11 @@ import os
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import noload, selectinload
 
 from app.database import get_db
 from app.models.models import User, QRCode, Editor
+from app.request_context import sql_budget
 from app.routes.dependecies import current_user, current_superuser
 from app.schemas.qr_schemas import QRCodeOut, QRSetTemplateIn
 from app.helpers.codegen import (
@@ -56,15 +58,27 @@ async def get_qr_by_user(
 
 
 @qr_router.get("/", response_model=list[QRCodeOut], name="list-qr")
+# авторизация суперюзера + QR + редакторы + шаблоны, независимо от числа QR
+@sql_budget(15)
 async def list_all_qrs(
     user: User = Depends(current_superuser),
     db: AsyncSession = Depends(get_db),
 ):
     try:
-        qrs = (await db.execute(select(QRCode))).scalars().all()
+        # только редактор и его текущий шаблон — без каскада selectin через User
+        stmt = select(QRCode).options(
+            noload(QRCode.user),
+            noload(QRCode.products),
+            selectinload(QRCode.editor).options(
+                noload(Editor.user),
+                noload(Editor.qr),
+                selectinload(Editor.current_template).noload("*"),
+            ),
+        )
+        qrs = (await db.execute(stmt)).scalars().all()
         result: list[QRCodeOut] = []
         for qr in qrs:
-            editor = await db.get(Editor, qr.editor_id)
+            editor = qr.editor
             if not editor:
                 continue
             base = os.getenv("PUBLIC_FRONTEND_BASE_URL", "").rstrip("/")
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
@@ -11,8 +13,20 @@ from app.helpers.review_helpers import (
     update_review_helper,
     delete_review_helper,
     get_my_review_helper,
+    get_review_feed,
+    invalidate_review_feed,
+    get_moderation_queue_helper,
+    bulk_moderate_reviews_helper,
+)
+from app.schemas.review_schemas import (
+    ReviewCreate,
+    ReviewUpdate,
+    ReviewRead,
+    ReviewFeedOut,
+    ReviewQueueOut,
+    ReviewBulkAction,
+    ReviewBulkResult,
 )
-from app.schemas.review_schemas import ReviewCreate, ReviewUpdate, ReviewRead
 from .dependecies import current_user, current_superuser
 
 from app.error.handler import handle_error
@@ -34,6 +48,19 @@ async def get_reviews(
         raise handle_error(e, app_logger, "get_reviews")
 
 
+@review_router.get("/feed", response_model=ReviewFeedOut)
+async def get_reviews_feed(
+    before_id: Optional[int] = Query(None, description="next_cursor предыдущей страницы"),
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+):
+    """Публичная лента отзывов (новые сверху) со средней оценкой и распределением по звёздам."""
+    try:
+        return await get_review_feed(db=db, before_id=before_id, limit=limit)
+    except Exception as e:
+        raise handle_error(e, app_logger, "get_reviews_feed")
+
+
 @review_router.get("/admin/all", response_model=list[ReviewRead])
 async def get_all_reviews_admin(
     skip: int = 0,
@@ -48,6 +75,33 @@ async def get_all_reviews_admin(
         raise handle_error(e, app_logger, "get_all_reviews_admin")
 
 
+@review_router.get("/admin/queue", response_model=ReviewQueueOut)
+async def get_moderation_queue(
+    after_id: Optional[int] = Query(None, description="next_cursor предыдущей страницы"),
+    limit: int = Query(50, ge=1, le=200),
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Очередь модерации: только помеченные отзывы, с общим количеством (для админки)."""
+    try:
+        return await get_moderation_queue_helper(db=db, after_id=after_id, limit=limit)
+    except Exception as e:
+        raise handle_error(e, app_logger, "get_moderation_queue")
+
+
+@review_router.post("/admin/bulk", response_model=ReviewBulkResult)
+async def bulk_moderate_reviews(
+    data: ReviewBulkAction,
+    user: User = Depends(current_superuser),
+    db: AsyncSession = Depends(get_db),
+):
+    """Одобрить / отклонить / удалить несколько отзывов одним запросом (для админки)."""
+    try:
+        return await bulk_moderate_reviews_helper(db=db, action=data.action, review_ids=data.ids)
+    except Exception as e:
+        raise handle_error(e, app_logger, "bulk_moderate_reviews")
+
+
 @review_router.post("/{review_id}/approve", response_model=ReviewRead)
 async def approve_review(
     review_id: int,
@@ -59,9 +113,9 @@ async def approve_review(
         review = await get_review_helper(db=db, review_id=review_id)
         # Update manually
         review.is_flagged = False
-        db.add(review)
+        review.moderation_override = "approved"
         await db.commit()
-        await db.refresh(review)
+        invalidate_review_feed()
         return review
     except Exception as e:
         raise handle_error(e, app_logger, "approve_review")
@@ -1,7 +1,7 @@
 import os
 from typing import Optional, List
 
-from fastapi import APIRouter, Depends, File, Form, UploadFile, HTTPException
+from fastapi import APIRouter, Depends, File, Form, Header, UploadFile, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
@@ -15,6 +15,7 @@ from app.helpers.templates_helpers import (
     delete_template,
     count_templates_for_user, list_templates_for_user,
 )
+from app.helpers.idempotency_helpers import run_idempotent
 from app.s3.s3 import S3Client
 from app.error.handler import handle_error
 
@@ -36,20 +37,37 @@ async def create_template(
     description: Optional[str] = Form(default=None),
     file: UploadFile = File(...),
     thumb_file: Optional[UploadFile] = File(default=None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     user: User = Depends(current_user),
     db: AsyncSession = Depends(get_db),
 ):
     try:
-        tpl = await create_template_for_user(
-            db=db,
-            s3=s3_client,
-            user=user,
-            file=file,
-            name=name,
-            description=description,
-            thumb_file=thumb_file,
+        async def _create():
+            return await create_template_for_user(
+                db=db,
+                s3=s3_client,
+                user=user,
+                file=file,
+                name=name,
+                description=description,
+                thumb_file=thumb_file,
+            )
+
+        # содержимое файла не хешируем — хватает имени и размера
+        fingerprint = {
+            "name": name,
+            "description": description,
+            "file": [file.filename, file.size],
+            "thumb": [thumb_file.filename, thumb_file.size] if thumb_file else None,
+        }
+        return await run_idempotent(
+            idempotency_key,
+            scope="create_template",
+            user_id=user.id,
+            payload=fingerprint,
+            handler=_create,
+            response_model=TemplateOut,
         )
-        return tpl
     except Exception as e:
         raise handle_error(e, app_logger, "create_template")
 
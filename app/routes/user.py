@@ -1,5 +1,6 @@
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
@@ -7,20 +8,33 @@ from slowapi.errors import RateLimitExceeded
 from .auth_custom import profile_router, auth_custom_router
 from .faq_router import faq_router
 from .logs_router import logs_router
+from .metrics_router import metrics_router
 from .order_router import orders_router
 from .product_router import products_router
 from .qr_router import qr_router
 from .moderation_router import moderation_router
+from .analytics_router import analytics_router
 from .dependecies import fastapi_users
 from app.auth.auth import auth_backend
 from app.helpers.helpers import to_start, to_shutdown, create_admin, create_product, create_mock_reviews
+from app.helpers.analytics_helpers import sales_rollup_nightly_loop
+from app.helpers.idempotency_helpers import idempotency_cleanup_loop
+from app.helpers.stock_helpers import stock_reservation_expiry_loop
+from app.helpers.payment_helpers import payment_events_loop, payment_reconcile_loop
+from app.helpers.remoderation_helpers import remoderation_loop
+from app.helpers.email_helpers import mail_outbox_loop
+from app.mail.smtp import close_mailer
+from app.metrics import event_loop_lag_loop, mark_process_dead
+from app.payments.yookassa import close_yookassa_client
+from app.slow_queries import slow_query_explain_loop, slow_query_flush_loop
 from app.schemas.user_schemas import UserCreate, UserRead, UserOut, UserUpdate
 from .review_router import review_router
-# from .payment_router import payment_router
+from .payment_router import payment_router
 from .templates_router import templates_router
 from ..admin import admin_star
 from ..logging_config import app_logger
 from ..rate_limit import limiter
+from ..request_logging import RequestLoggingMiddleware
 
 
 @asynccontextmanager
@@ -30,7 +44,24 @@ async def lifespan_func(app: FastAPI):
     await create_product()
     # await create_mock_reviews()
     print("База готова")
+    background = [
+        asyncio.create_task(sales_rollup_nightly_loop()),
+        asyncio.create_task(idempotency_cleanup_loop()),
+        asyncio.create_task(stock_reservation_expiry_loop()),
+        asyncio.create_task(payment_events_loop()),
+        asyncio.create_task(payment_reconcile_loop()),
+        asyncio.create_task(remoderation_loop()),
+        asyncio.create_task(mail_outbox_loop()),
+        asyncio.create_task(event_loop_lag_loop()),
+        asyncio.create_task(slow_query_explain_loop()),
+        asyncio.create_task(slow_query_flush_loop()),
+    ]
     yield
+    for task in background:
+        task.cancel()
+    await close_yookassa_client()
+    await close_mailer()
+    mark_process_dead()
     # await to_shutdown()
     # print("База очищена")
 
@@ -39,69 +70,8 @@ app = FastAPI(lifespan=lifespan_func)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-def _filter_sensitive_data(data: str) -> str:
-    """Фильтрует чувствительные данные из логов (пароли, токены)."""
-    import re
-    import json
-    
-    try:
-        parsed = json.loads(data)
-        if isinstance(parsed, dict):
-            # Фильтруем sensitive поля
-            sensitive_fields = {"password", "token", "access_token", "refresh_token", 
-                              "secret", "api_key", "private_key", "hashed_password"}
-            for field in sensitive_fields:
-                if field in parsed:
-                    parsed[field] = "***FILTERED***"
-        data = json.dumps(parsed)
-    except (json.JSONDecodeError, TypeError):
-        # Если не JSON, используем regex
-        data = re.sub(r'("password"|"token"|"secret")["\s]*:["\s]*"[^"]*"', 
-                     r'\1: "***FILTERED***"', data, flags=re.IGNORECASE)
-        data = re.sub(r'password=[^&\s]+', 'password=***FILTERED***', data, flags=re.IGNORECASE)
-    
-    return data
-
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    try:
-        body = await request.body()
-        try:
-            body_text = body.decode("utf-8")
-            body_text = _filter_sensitive_data(body_text)  # ✅ Фильтрация
-        except Exception:
-            body_text = "<binary data>"
-    except Exception:
-        body_text = "<unreadable>"
-
-    app_logger.info(f"REQUEST {request.method} {request.url} | body={body_text}")
-
-    try:
-        response = await call_next(request)
-    except Exception as e:
-        app_logger.exception(f"ERROR handling {request.method} {request.url}: {e}")
-        raise
-
-    try:
-        if hasattr(response, "body") and response.body is not None:
-            try:
-                resp_text = response.body.decode("utf-8")
-                resp_text = _filter_sensitive_data(resp_text)  # ✅ Фильтрация
-            except Exception:
-                resp_text = "<binary data>"
-        else:
-            resp_text = "<streaming or empty>"
-
-        app_logger.info(
-            f"RESPONSE {request.method} {request.url} | "
-            f"status={response.status_code} | body={resp_text}"
-        )
-    except Exception:
-        app_logger.exception("error logging response")
-
-    return response
-
-
+# журнал запросов: без буферизации тел, запись в файлы — в потоке QueueListener
+app.add_middleware(RequestLoggingMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -133,7 +103,9 @@ app.include_router(templates_router)
 app.include_router(products_router)
 app.include_router(orders_router)
 app.include_router(logs_router)
-# app.include_router(payment_router)
+app.include_router(payment_router)
 app.include_router(moderation_router)
+app.include_router(analytics_router)
+app.include_router(metrics_router)
 
 app.mount("/admin", admin_star)
\ No newline at end of file
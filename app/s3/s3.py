@@ -4,6 +4,8 @@ from contextlib import asynccontextmanager
 from aiobotocore.session import get_session
 from botocore.config import Config
 
+from app.metrics import track_outbound
+
 load_dotenv()
 
 class S3Client:
@@ -49,7 +51,7 @@ class S3Client:
             asyncio.TimeoutError: Если операция превысила таймаут
         """
         async with self.get_client() as client:
-            with open(file_path, "rb") as file:
+            with open(file_path, "rb") as file, track_outbound("s3", "put_object"):
                 await client.put_object(
                     Bucket=self.bucket_name,
                     Key=object_name,
@@ -0,0 +1,23 @@
+from datetime import date
+from typing import Optional
+from pydantic import BaseModel
+
+
+class DailySalesOut(BaseModel):
+    day: date
+    revenue: int
+    delivery_revenue: int
+    orders_count: int
+
+    class Config:
+        from_attributes = True
+        orm_mode = True
+
+
+class ProductSalesOut(BaseModel):
+    product_id: int
+    size: Optional[str] = None
+    color: Optional[str] = None
+    revenue: int
+    quantity: int
+    orders_count: int
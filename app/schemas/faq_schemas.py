@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Optional
 
 
 class FAQBase(BaseModel):
@@ -23,3 +23,13 @@ class FAQRead(FAQBase):
 
     class Config:
         orm_mode = True
+
+
+class FAQInboxItem(FAQRead):
+    email: str
+
+
+class FAQInboxOut(BaseModel):
+    items: List[FAQInboxItem]
+    next_cursor: Optional[int] = Field(None, description="Передать как before_id для следующей страницы")
+    unanswered: int = Field(..., description="Всего вопросов без ответа")
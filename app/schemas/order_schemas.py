@@ -63,6 +63,9 @@ class OrderOut(BaseModel):
     yandex_offer_id: Optional[str] = None
     yandex_error: Optional[str] = None
     delivery_cost: conint(ge=0) = 0
+
+    # YooKassa
+    payment_status: Optional[str] = None
     
     items: List[OrderItemOut]
 
@@ -0,0 +1,32 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class PaymentRequest(BaseModel):
+    order_id: int
+    # устаревшее: сумма всегда берётся из заказа, поле игнорируется
+    amount: Optional[float] = None
+
+
+class PaymentCreateOut(BaseModel):
+    payment_id: str
+    redirect_url: Optional[str] = None
+
+
+class PaymentChangeOut(BaseModel):
+    order_id: int
+    payment_id: str
+    payment_status_from: Optional[str] = None
+    payment_status_to: str
+    status_from: str
+    status_to: str
+    note: Optional[str] = None
+
+
+class PaymentReconcileOut(BaseModel):
+    dry_run: bool
+    scanned: int
+    fetched: int
+    missing: List[str]
+    failed: List[str]
+    changes: List[PaymentChangeOut]
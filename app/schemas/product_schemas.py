@@ -18,6 +18,10 @@ class ProductUpdateIn(BaseModel):
     img_url: Optional[Union[HttpUrl, str]] = None
     price: Optional[conint(ge=0)] = Field(default=None, description="Цена товара в минимальных денежных единицах")
 
+class StockAdjustIn(BaseModel):
+    # приход (> 0) или списание (< 0); резервы заказов не затрагивает
+    delta: int
+
 class ProductMini(BaseModel):
     id: int
     type: str
@@ -39,6 +43,8 @@ class ProductOut(BaseModel):
     img_url: Optional[Union[HttpUrl, str]] = None
     qr_id: Optional[int] = None
     price: conint(ge=0)
+    # свободный остаток; None — остаток не ведётся
+    stock: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 from app.schemas.user_schemas import UserOut
 
@@ -20,3 +20,47 @@ class ReviewRead(ReviewBase):
 
     class Config:
         orm_mode = True
+
+
+class ReviewAuthor(BaseModel):
+    """Автор в публичной ленте: только то, что показывается на странице (без email)."""
+    id: int
+    username: str
+    img_url: Optional[str] = None
+
+
+class ReviewFeedItem(BaseModel):
+    id: int
+    stars: int
+    content: str
+    author: ReviewAuthor
+
+
+class ReviewRatingSummary(BaseModel):
+    count: int
+    average: Optional[float] = None
+    histogram: Dict[int, int] = Field(..., description="Число отзывов по звёздам 1..5")
+
+
+class ReviewFeedOut(BaseModel):
+    items: List[ReviewFeedItem]
+    next_cursor: Optional[int] = Field(None, description="Передать как before_id для следующей страницы")
+    summary: ReviewRatingSummary
+
+
+class ReviewQueueOut(BaseModel):
+    items: List[ReviewRead]
+    next_cursor: Optional[int] = Field(None, description="Передать как after_id для следующей страницы")
+    total: int = Field(..., description="Всего отзывов в очереди модерации")
+
+
+class ReviewBulkAction(BaseModel):
+    action: Literal["approve", "reject", "delete"]
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+
+class ReviewBulkResult(BaseModel):
+    action: str
+    requested: int
+    affected: int
+    ids: List[int] = Field(..., description="Отзывы, к которым действие применилось")
@@ -0,0 +1,449 @@
+"""
+Журнал медленных SQL-запросов.
+
+Запрос дольше SLOW_QUERY_MS пишется в logs/db.log (логгер
+sqlalchemy.engine.slow) с формой параметров — типы и длины, без значений — и
+шаблоном роута, из которого он пришёл. Одинаковые запросы с разными литералами
+сводятся к одному отпечатку (нормализованный SQL), по отпечаткам в памяти
+процесса копится статистика: число, суммарное и максимальное время, роуты.
+
+Несколько воркеров uvicorn: статистика у каждого своя. Если задан SLOW_QUERY_DIR
+(по умолчанию — PROMETHEUS_MULTIPROC_DIR), воркер раз в SLOW_QUERY_FLUSH_SECONDS
+пишет снимок в slow_queries_<pid>.json, а /logs/slow-queries любого воркера
+складывает снимки всех (снимки остановленных воркеров остаются до сброса).
+Без каталога отчёт — только по воркеру, ответившему на запрос (его pid есть в ответе).
+
+План снимается в фоне (slow_query_explain_loop) обычным EXPLAIN (FORMAT JSON) —
+без ANALYZE, запрос повторно не выполняется — на отдельном движке с одним
+соединением, чтобы не отнимать соединения у запросов. Не чаще раза в
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS на отпечаток и не больше
+SLOW_QUERY_EXPLAINS_PER_MINUTE планов в минуту на процесс.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.request_context import request_scope_var
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1").lower() not in ("0", "false", "no")
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS", "600"))
+SLOW_QUERY_EXPLAINS_PER_MINUTE = int(os.getenv("SLOW_QUERY_EXPLAINS_PER_MINUTE", "10"))
+SLOW_QUERY_MAX_FINGERPRINTS = 500
+SLOW_QUERY_DIR = os.getenv("SLOW_QUERY_DIR") or os.getenv("PROMETHEUS_MULTIPROC_DIR")
+SLOW_QUERY_FLUSH_SECONDS = float(os.getenv("SLOW_QUERY_FLUSH_SECONDS", "10"))
+_SNAPSHOT_PREFIX = "slow_queries_"
+_RESET_FILE = "slow_queries.reset"
+_EXPLAIN_QUEUE_SIZE = 100
+_EXPLAIN_TIMEOUT_MS = 5000
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+# пишется в db.log: файловый хандлер sqlalchemy.engine принимает и дочерние логгеры
+slow_logger = logging.getLogger("sqlalchemy.engine.slow")
+slow_logger.setLevel(logging.INFO)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES = re.compile(r"(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(statement: str) -> str:
+    """SQL без литералов и с одинаковыми плейсхолдерами: IN ($1, $2, $3) и IN (5, 7) — один отпечаток."""
+    sql = _STRING.sub("?", statement)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _IN_LIST.sub("(...)", sql)
+    sql = _VALUES.sub(r"\1", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+def fingerprint_id(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def _shape(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, (list, tuple, set)):
+        return f"list[{len(value)}]"
+    return type(value).__name__
+
+
+def param_shapes(parameters: Any, executemany: bool = False) -> Any:
+    """Типы и длины параметров вместо значений (в логах не должно быть данных пользователей)."""
+    if executemany and isinstance(parameters, (list, tuple)):
+        return {"executemany": len(parameters), "row": param_shapes(parameters[0]) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: _shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_shape(value) for value in parameters]
+    return _shape(parameters)
+
+
+class _Fingerprint:
+    __slots__ = (
+        "id", "sql", "count", "total_ms", "max_ms", "last_seen", "routes",
+        "params", "plan", "plan_at", "plan_error", "explain_requested_at",
+    )
+
+    def __init__(self, fid: str, sql: str):
+        self.id = fid
+        self.sql = sql
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_seen: Optional[datetime] = None
+        self.routes: Counter = Counter()
+        self.params: Any = None
+        self.plan: Any = None
+        self.plan_at: Optional[datetime] = None
+        self.plan_error: Optional[str] = None
+        self.explain_requested_at = 0.0
+
+    def snapshot(self) -> Dict:
+        """Всё накопленное, в JSON-совместимом виде (для снимка на диск и слияния)."""
+        return {
+            "fingerprint": self.id,
+            "sql": self.sql,
+            "count": self.count,
+            "total_ms": self.total_ms,
+            "max_ms": self.max_ms,
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
+            "routes": dict(self.routes),
+            "params": self.params,
+            "plan": self.plan,
+            "plan_at": self.plan_at.isoformat() if self.plan_at else None,
+            "plan_error": self.plan_error,
+        }
+
+
+# отпечатки в порядке последнего появления; старые вытесняются
+_fingerprints: "OrderedDict[str, _Fingerprint]" = OrderedDict()
+_explain_queue: Optional[asyncio.Queue] = None
+_explain_url = None
+_explain_times: List[float] = []
+# были ли изменения после последнего снимка; когда видели последний сброс
+_dirty = False
+_reset_seen = 0.0
+
+
+def _current_route() -> str:
+    scope = request_scope_var.get()
+    if scope is None:
+        return "<background>"
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._slow_query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_slow_query_started", None)
+    if started is None:
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms >= SLOW_QUERY_MS:
+        record_slow_query(statement, parameters, executemany, elapsed_ms)
+
+
+def record_slow_query(statement: str, parameters: Any, executemany: bool, elapsed_ms: float) -> _Fingerprint:
+    normalized = normalize_sql(statement)
+    fid = fingerprint_id(normalized)
+    route = _current_route()
+    shapes = param_shapes(parameters, executemany)
+
+    fp = _fingerprints.get(fid)
+    if fp is None:
+        fp = _fingerprints[fid] = _Fingerprint(fid, normalized)
+        if len(_fingerprints) > SLOW_QUERY_MAX_FINGERPRINTS:
+            _fingerprints.popitem(last=False)
+    else:
+        _fingerprints.move_to_end(fid)
+    fp.count += 1
+    fp.total_ms += elapsed_ms
+    fp.max_ms = max(fp.max_ms, elapsed_ms)
+    fp.last_seen = datetime.now(timezone.utc)
+    fp.routes[route] += 1
+    fp.params = shapes
+    _mark_dirty()
+
+    slow_logger.warning(
+        f"SLOW QUERY {elapsed_ms:.1f}ms [{fid}] {route} | {normalized[:500]} | params={shapes}",
+        extra={"fingerprint": fid, "route": route, "duration_ms": round(elapsed_ms, 1)},
+    )
+    if not executemany:
+        _request_explain(fp, statement, parameters)
+    return fp
+
+
+def _request_explain(fp: _Fingerprint, statement: str, parameters: Any) -> None:
+    if not SLOW_QUERY_EXPLAIN or _explain_queue is None:
+        return
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return
+    now = time.monotonic()
+    if now - fp.explain_requested_at < SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS:
+        return
+    # общий лимит: не больше N планов за последнюю минуту
+    _explain_times[:] = [t for t in _explain_times if now - t < 60]
+    if len(_explain_times) >= SLOW_QUERY_EXPLAINS_PER_MINUTE:
+        return
+    try:
+        # хук движка выполняется в потоке event loop (в greenlet SQLAlchemy)
+        _explain_queue.put_nowait((fp, statement, parameters))
+    except asyncio.QueueFull:
+        return
+    fp.explain_requested_at = now
+    _explain_times.append(now)
+
+
+def install_slow_query_log(engine) -> None:
+    """Следить за временем запросов движка; планы снимаются по тому же URL."""
+    global _explain_url
+    sync_engine = getattr(engine, "sync_engine", engine)
+    _explain_url = sync_engine.url
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+async def _explain(explain_engine, statement: str, parameters: Any) -> Any:
+    async with explain_engine.connect() as conn:
+        async with conn.begin():
+            await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {_EXPLAIN_TIMEOUT_MS}")
+            result = await conn.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}",
+                tuple(parameters) if isinstance(parameters, list) else parameters,
+            )
+            plan = result.scalar()
+            await conn.rollback()
+    return plan
+
+
+async def slow_query_explain_loop() -> None:
+    """Снимает планы медленных запросов из очереди на отдельном соединении."""
+    global _explain_queue
+    if not SLOW_QUERY_EXPLAIN or _explain_url is None:
+        return
+    _explain_queue = asyncio.Queue(maxsize=_EXPLAIN_QUEUE_SIZE)
+    # свой движок: хуки основного сюда не подключены, пул основного не занимаем
+    explain_engine = create_async_engine(_explain_url, pool_size=1, max_overflow=0, pool_pre_ping=True)
+    try:
+        while True:
+            fp, statement, parameters = await _explain_queue.get()
+            try:
+                fp.plan = await _explain(explain_engine, statement, parameters)
+                fp.plan_at = datetime.now(timezone.utc)
+                fp.plan_error = None
+            except Exception as e:
+                fp.plan_error = f"{type(e).__name__}: {e}"[:500]
+                slow_logger.info(f"EXPLAIN failed for [{fp.id}]: {fp.plan_error}")
+            _mark_dirty()
+    finally:
+        _explain_queue = None
+        await explain_engine.dispose()
+
+
+def _plan_summary(plan: Any) -> Optional[Dict]:
+    """Корневой узел плана: тип, оценка стоимости и строк, и были ли Seq Scan."""
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    if not plan:
+        return None
+    root = plan[0]["Plan"]
+    seq_scans = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            seq_scans.append(node.get("Relation Name"))
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    walk(root)
+    return {
+        "node": root.get("Node Type"),
+        "total_cost": root.get("Total Cost"),
+        "rows": root.get("Plan Rows"),
+        "seq_scans": seq_scans,
+    }
+
+
+def _mark_dirty() -> None:
+    global _dirty
+    _dirty = True
+
+
+# ---------- снимки воркеров и отчёт ----------
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(SLOW_QUERY_DIR, f"{_SNAPSHOT_PREFIX}{pid}.json")
+
+
+def _reset_requested() -> float:
+    try:
+        return os.stat(os.path.join(SLOW_QUERY_DIR, _RESET_FILE)).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def _write_snapshot(rows: List[Dict]) -> None:
+    path = _snapshot_path(os.getpid())
+    with open(path + ".tmp", "w") as f:
+        json.dump(rows, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def _read_snapshots() -> Dict[int, List[Dict]]:
+    """Снимки остальных воркеров (свой берётся из памяти — он свежее)."""
+    snapshots = {}
+    if not SLOW_QUERY_DIR or not os.path.isdir(SLOW_QUERY_DIR):
+        return snapshots
+    for name in os.listdir(SLOW_QUERY_DIR):
+        pid = name[len(_SNAPSHOT_PREFIX):-len(".json")]
+        if not (name.startswith(_SNAPSHOT_PREFIX) and name.endswith(".json") and pid.isdigit()):
+            continue
+        if int(pid) == os.getpid():
+            continue
+        try:
+            with open(os.path.join(SLOW_QUERY_DIR, name)) as f:
+                snapshots[int(pid)] = json.load(f)
+        except (OSError, ValueError):
+            continue  # воркер как раз пишет снимок или файл битый — пропускаем
+    return snapshots
+
+
+async def flush_slow_queries() -> None:
+    """Сбросить свой снимок в SLOW_QUERY_DIR; до этого применить общий сброс, если он был."""
+    global _dirty, _reset_seen
+    reset_at = await asyncio.to_thread(_reset_requested)
+    if reset_at > _reset_seen:
+        _reset_seen = reset_at
+        _fingerprints.clear()
+        _dirty = True
+    if not _dirty:
+        return
+    _dirty = False
+    rows = [fp.snapshot() for fp in list(_fingerprints.values())]
+    await asyncio.to_thread(_write_snapshot, rows)
+
+
+async def slow_query_flush_loop(interval: float = SLOW_QUERY_FLUSH_SECONDS) -> None:
+    """Фоновая задача (стартует в lifespan): снимок статистики воркера для общего отчёта."""
+    global _reset_seen
+    if not SLOW_QUERY_DIR:
+        return
+    os.makedirs(SLOW_QUERY_DIR, exist_ok=True)
+    # сброс, сделанный до старта воркера, к его статистике не относится
+    _reset_seen = await asyncio.to_thread(_reset_requested)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_slow_queries()
+        except OSError as e:
+            slow_logger.error(f"Slow query snapshot failed: {e}")
+
+
+def _merge(snapshots: Iterable[List[Dict]]) -> Dict[str, Dict]:
+    merged: Dict[str, Dict] = {}
+    for rows in snapshots:
+        for row in rows:
+            total = merged.get(row["fingerprint"])
+            if total is None:
+                merged[row["fingerprint"]] = {**row, "routes": Counter(row["routes"])}
+                continue
+            total["count"] += row["count"]
+            total["total_ms"] += row["total_ms"]
+            total["max_ms"] = max(total["max_ms"], row["max_ms"])
+            total["routes"].update(row["routes"])
+            # ISO-строки в UTC сравниваются как строки
+            if (row["last_seen"] or "") > (total["last_seen"] or ""):
+                total["last_seen"], total["params"] = row["last_seen"], row["params"]
+            if (row["plan_at"] or "") > (total["plan_at"] or ""):
+                total["plan"], total["plan_at"], total["plan_error"] = row["plan"], row["plan_at"], row["plan_error"]
+    return merged
+
+
+def _summary(row: Dict, routes: Optional[int] = 5) -> Dict:
+    return {
+        "fingerprint": row["fingerprint"],
+        "sql": row["sql"],
+        "count": row["count"],
+        "total_ms": round(row["total_ms"], 1),
+        "mean_ms": round(row["total_ms"] / row["count"], 1) if row["count"] else 0.0,
+        "max_ms": round(row["max_ms"], 1),
+        "last_seen": row["last_seen"],
+        "routes": dict(row["routes"].most_common(routes)),
+        "params": row["params"],
+        "plan_summary": _plan_summary(row["plan"]),
+        "plan_at": row["plan_at"],
+        "plan_error": row["plan_error"],
+    }
+
+
+async def _collect() -> Dict:
+    own = [fp.snapshot() for fp in list(_fingerprints.values())]
+    others = await asyncio.to_thread(_read_snapshots)
+    return {
+        "pid": os.getpid(),
+        # без SLOW_QUERY_DIR в отчёте только этот воркер
+        "workers": sorted([os.getpid(), *others]),
+        "fingerprints": _merge([own, *others.values()]),
+    }
+
+
+async def slow_query_report(sort: str = "total_ms", limit: int = 50) -> Dict:
+    collected = await _collect()
+    rows = [_summary(row) for row in collected["fingerprints"].values()]
+    rows.sort(key=lambda r: r[sort], reverse=True)
+    return {"pid": collected["pid"], "workers": collected["workers"], "fingerprints": rows[:limit]}
+
+
+async def slow_query_detail(fid: str) -> Optional[Dict]:
+    collected = await _collect()
+    row = collected["fingerprints"].get(fid)
+    if row is None:
+        return None
+    return {
+        **_summary(row, routes=None),
+        "plan": row["plan"],
+        "pid": collected["pid"],
+        "workers": collected["workers"],
+    }
+
+
+def _reset_files() -> None:
+    os.makedirs(SLOW_QUERY_DIR, exist_ok=True)
+    # остальные воркеры очистят память, увидев новый mtime, до следующего снимка
+    with open(os.path.join(SLOW_QUERY_DIR, _RESET_FILE), "w") as f:
+        f.write(datetime.now(timezone.utc).isoformat())
+    for name in os.listdir(SLOW_QUERY_DIR):
+        if name.startswith(_SNAPSHOT_PREFIX) and name.endswith(".json"):
+            try:
+                os.remove(os.path.join(SLOW_QUERY_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+async def reset_slow_queries() -> None:
+    global _reset_seen
+    _fingerprints.clear()
+    if SLOW_QUERY_DIR:
+        await asyncio.to_thread(_reset_files)
+        _reset_seen = await asyncio.to_thread(_reset_requested)
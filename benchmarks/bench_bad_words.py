@@ -0,0 +1,88 @@
+"""
+Бенчмарк авто-модерации: прежний цикл «regex на каждое слово + поиск подстроки»
+против скомпилированного BadWordMatcher. Без БД: список слов синтетический.
+
+Запуск:
+    python -m benchmarks.bench_bad_words --words 5000 --texts 200 --length 5000
+"""
+import argparse
+import random
+import re
+import statistics
+import time
+
+from app.helpers.moderation import BadWordMatcher
+
+ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+
+
+def _word(rnd: random.Random) -> str:
+    return "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(4, 10)))
+
+
+def _text(rnd: random.Random, length: int, words: list, hit_rate: float) -> str:
+    parts, size = [], 0
+    while size < length:
+        token = rnd.choice(words) if rnd.random() < hit_rate else _word(rnd)
+        parts.append(token)
+        size += len(token) + 1
+    return " ".join(parts)
+
+
+def legacy_check(bad_words: list, text: str) -> bool:
+    """Как было в check_bad_words (без похода в БД)."""
+    text_lower = text.lower()
+    for word in bad_words:
+        pattern = r"\b" + re.escape(word) + r"s?\b"
+        if re.search(pattern, text_lower) or word in text_lower:
+            return True
+    return False
+
+
+def _timed(fn, texts):
+    timings, results = [], []
+    for text in texts:
+        started = time.perf_counter()
+        results.append(fn(text))
+        timings.append(time.perf_counter() - started)
+    return timings, results
+
+
+def _report(name: str, timings: list):
+    timings = sorted(timings)
+    p = lambda q: timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+    print(f"{name:>10}: p50={p(0.5):.3f}ms p95={p(0.95):.3f}ms mean={statistics.mean(timings) * 1000:.3f}ms")
+
+
+def main(words: int, texts: int, length: int, hit_rate: float, seed: int):
+    rnd = random.Random(seed)
+    bad_words = sorted({_word(rnd) for _ in range(words)})
+    samples = [_text(rnd, length, bad_words, hit_rate) for _ in range(texts)]
+
+    started = time.perf_counter()
+    matcher = BadWordMatcher(bad_words)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"words={len(bad_words)} texts={texts} length={length} hit_rate={hit_rate}")
+    print(f"matcher build: {build_ms:.1f}ms")
+
+    legacy_t, legacy_r = _timed(lambda t: legacy_check(bad_words, t), samples)
+    matches_t, matches_r = _timed(matcher.matches, samples)
+    find_t, _ = _timed(matcher.find, samples)
+    assert legacy_r == matches_r, "matcher disagrees with the legacy check"
+
+    _report("legacy", legacy_t)
+    _report("matches", matches_t)
+    _report("find", find_t)
+    print(f"speedup (matches vs legacy): {statistics.mean(legacy_t) / statistics.mean(matches_t):.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=5000)
+    parser.add_argument("--texts", type=int, default=200)
+    parser.add_argument("--length", type=int, default=5000)
+    parser.add_argument("--hit-rate", type=float, default=0.0,
+                        help="доля токенов текста, взятых из списка (0 — худший случай для старого цикла)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    main(args.words, args.texts, args.length, args.hit_rate, args.seed)
@@ -0,0 +1,155 @@
+"""
+Бенчмарк журнала запросов: накладные расходы на запрос у прежнего
+@app.middleware("http") log_requests (await request.body() + синхронный
+RotatingFileHandler на event loop) и у RequestLoggingMiddleware через
+QueueHandler/QueueListener. Без сети и БД: запросы идут через httpx.ASGITransport,
+логи пишутся во временный каталог.
+
+Запуск:
+    python -m benchmarks.bench_request_logging --requests 2000 --upload-mb 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import queue
+import re
+import statistics
+import tempfile
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import httpx
+from fastapi import FastAPI, File, Request, UploadFile
+
+from app.request_logging import RequestLoggingMiddleware
+
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def _file_handler(path: str) -> logging.Handler:
+    handler = RotatingFileHandler(path, maxBytes=10 * 1024 * 1024, backupCount=5)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    return handler
+
+
+def _logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def _routes(app: FastAPI) -> FastAPI:
+    @app.post("/json")
+    async def echo(data: dict):
+        return {"ok": True, "keys": len(data)}
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        size = 0
+        while chunk := await file.read(1024 * 1024):
+            size += len(chunk)
+        return {"size": size}
+
+    return app
+
+
+def _legacy_filter(data: str) -> str:
+    """Как было в app/routes/user.py: json.loads + regex на каждое тело."""
+    try:
+        parsed = json.loads(data)
+        if isinstance(parsed, dict):
+            for field in ("password", "token", "access_token", "refresh_token",
+                          "secret", "api_key", "private_key", "hashed_password"):
+                if field in parsed:
+                    parsed[field] = "***FILTERED***"
+        data = json.dumps(parsed)
+    except (json.JSONDecodeError, TypeError):
+        data = re.sub(r'("password"|"token"|"secret")["\s]*:["\s]*"[^"]*"',
+                      r'\1: "***FILTERED***"', data, flags=re.IGNORECASE)
+        data = re.sub(r'password=[^&\s]+', 'password=***FILTERED***', data, flags=re.IGNORECASE)
+    return data
+
+
+def legacy_app(logger: logging.Logger) -> FastAPI:
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        body = await request.body()
+        try:
+            body_text = _legacy_filter(body.decode("utf-8"))
+        except Exception:
+            body_text = "<binary data>"
+        logger.info(f"REQUEST {request.method} {request.url} | body={body_text}")
+        response = await call_next(request)
+        logger.info(f"RESPONSE {request.method} {request.url} | status={response.status_code} | body=<streaming or empty>")
+        return response
+
+    return _routes(app)
+
+
+def queued_app(logger: logging.Logger) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RequestLoggingMiddleware, logger=logger)
+    return _routes(app)
+
+
+async def _measure(app: FastAPI, make_request, count: int) -> list:
+    timings = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await make_request(client)
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.text
+    return timings
+
+
+def _report(name: str, timings: list, baseline: list) -> None:
+    timings = sorted(timings)
+    p = lambda q: timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+    overhead = (statistics.mean(timings) - statistics.mean(baseline)) * 1e6
+    print(f"{name:>14}: p50={p(0.5):.3f}ms p95={p(0.95):.3f}ms overhead={overhead:+.0f}µs/request")
+
+
+async def main(requests: int, upload_mb: int, uploads: int):
+    tmp = tempfile.mkdtemp(prefix="bench-logs-")
+    legacy_logger = _logger("bench.legacy", _file_handler(f"{tmp}/legacy.log"))
+    log_queue = queue.SimpleQueue()
+    queued_logger = _logger("bench.queued", QueueHandler(log_queue))
+    listener = QueueListener(log_queue, _file_handler(f"{tmp}/queued.log"))
+    listener.start()
+
+    payload = {"username": "user", "password": "secret", "items": [{"id": i, "qty": 1} for i in range(20)]}
+    blob = b"\0" * (upload_mb * 1024 * 1024)
+    json_request = lambda c: c.post("/json", json=payload)
+    upload_request = lambda c: c.post("/upload", files={"file": ("t.bin", blob, "application/octet-stream")})
+
+    apps = {
+        "none": _routes(FastAPI()),
+        "legacy": legacy_app(legacy_logger),
+        "queue": queued_app(queued_logger),
+    }
+    print(f"logs: {tmp}")
+    for title, make_request, count in (
+        (f"JSON x{requests}", json_request, requests),
+        (f"multipart {upload_mb}MB x{uploads}", upload_request, uploads),
+    ):
+        print(title)
+        results = {name: await _measure(app, make_request, count) for name, app in apps.items()}
+        for name in ("legacy", "queue"):
+            _report(name, results[name], results["none"])
+    listener.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--upload-mb", type=int, default=20)
+    parser.add_argument("--uploads", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.upload_mb, args.uploads))
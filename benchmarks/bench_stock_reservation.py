@@ -0,0 +1,104 @@
+"""
+Флеш-распродажа: сотни одновременных create_order на один SKU с ограниченным остатком.
+Доставка идёт во встроенный стенд Яндекса (задержка настраивается), база — из DATABASE.
+
+Проверяет, что не продано больше остатка, и показывает, что блокировка строки товара
+не держится на время запроса в Яндекс (время оформления ~ задержка Яндекса, а не
+задержка × число покупателей).
+
+Запуск:
+    python -m benchmarks.bench_stock_reservation --checkouts 500 --stock 100 --latency uniform:40,120
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select
+
+from app.database import async_session, engine
+from app.delivery.fake_yandex import FakeYandexDelivery
+from app.delivery.yandex import use_transport
+from app.helpers.order_helpers import create_order
+from app.models.models import Order, Product, StockReservation, User
+
+
+async def _setup(stock: int):
+    async with async_session() as session:
+        tag = uuid.uuid4().hex[:8]
+        user = User(
+            email=f"bench_{tag}@example.com", username=f"bench_{tag}", hashed_password="-",
+            is_active=True, is_superuser=False, is_verified=True,
+        )
+        product = Product(type="Футболка", size="M", color="Белый", price=1000, stock=stock)
+        session.add_all([user, product])
+        await session.commit()
+        return user, product.id
+
+
+async def _cleanup(user_id: int, product_id: int):
+    async with async_session() as session:
+        await session.execute(delete(Order).where(Order.user_id == user_id))
+        await session.execute(delete(Product).where(Product.id == product_id))
+        await session.execute(delete(User).where(User.id == user_id))
+        await session.commit()
+
+
+async def _checkout(user: User, product_id: int, sem: asyncio.Semaphore, timings: list, outcomes: dict):
+    async with sem:
+        started = time.perf_counter()
+        async with async_session() as session:
+            try:
+                order = await create_order(session, user, [(product_id, 1)], city="Москва")
+                outcomes[order.status] = outcomes.get(order.status, 0) + 1
+            except HTTPException as e:
+                outcomes[e.status_code] = outcomes.get(e.status_code, 0) + 1
+        timings.append(time.perf_counter() - started)
+
+
+async def main(checkouts: int, stock: int, concurrency: int, latency: str, error_rate: float, keep: bool):
+    use_transport(FakeYandexDelivery(latency=latency, error_rate=error_rate, seed=42).transport())
+    user, product_id = await _setup(stock)
+    sem = asyncio.Semaphore(concurrency)
+    timings: list = []
+    outcomes: dict = {}
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(_checkout(user, product_id, sem, timings, outcomes) for _ in range(checkouts)))
+        elapsed = time.perf_counter() - started
+
+        async with async_session() as session:
+            left = await session.scalar(select(Product.stock).where(Product.id == product_id))
+            held = await session.scalar(
+                select(func.coalesce(func.sum(StockReservation.quantity), 0))
+                .where(StockReservation.product_id == product_id)
+            )
+    finally:
+        if not keep:
+            await _cleanup(user.id, product_id)
+        await engine.dispose()
+
+    timings.sort()
+    p = lambda q: timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+    print(f"checkouts={checkouts} stock={stock} concurrency={concurrency} latency={latency}")
+    print(f"throughput: {checkouts / elapsed:.1f} checkouts/s ({elapsed:.2f}s total)")
+    print(f"latency ms: p50={p(0.5):.1f} p95={p(0.95):.1f} p99={p(0.99):.1f} mean={statistics.mean(timings) * 1000:.1f}")
+    print(f"outcomes: {outcomes}")
+    print(f"stock left={left} reserved={held} (pending orders hold their units)")
+    sold = outcomes.get("pending", 0)
+    assert left >= 0 and sold + left == stock, "oversold or lost stock"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkouts", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", default="uniform:40,120")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--keep", action="store_true", help="не удалять заказы и товар после прогона")
+    args = parser.parse_args()
+    asyncio.run(main(args.checkouts, args.stock, args.concurrency, args.latency, args.error_rate, args.keep))
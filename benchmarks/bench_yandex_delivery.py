@@ -0,0 +1,76 @@
+"""
+Бенчмарк «доставочной» части create_order без сети: create_offer + confirm_offer
+против встроенного стенда Яндекса (app.delivery.fake_yandex).
+
+Запуск:
+    python -m benchmarks.bench_yandex_delivery --orders 500 --concurrency 50 --latency uniform:40,120
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.delivery.fake_yandex import FakeYandexDelivery
+from app.delivery.yandex import YandexDeliveryClient, YandexDeliveryError
+
+ITEMS = [{
+    "count": 1,
+    "name": "Футболка Белый M",
+    "article": "sku-1",
+    "physical_dims": {"dx": 30, "dy": 20, "dz": 2, "weight_gross": 500},
+    "billing_details": {"unit_price": 100000, "assessed_unit_price": 100000, "nds": 0},
+}]
+DESTINATION = {
+    "address": "ул. Льва Толстого, 16",
+    "city": "Москва",
+    "contact": {"first_name": "Bench", "last_name": "", "phone": "+79991234567"},
+}
+
+
+async def _one(client: YandexDeliveryClient, sem: asyncio.Semaphore, timings: list, errors: list):
+    async with sem:
+        started = time.perf_counter()
+        try:
+            resp = await client.create_offer(
+                source_station_id="bench-station",
+                destination=DESTINATION,
+                items=ITEMS,
+                places=[{"physical_dims": {"dx": 30, "dy": 20, "dz": 2, "weight_gross": 500}}],
+            )
+            offers = resp.get("offers", [])
+            if offers:
+                await client.confirm_offer(offers[0]["offer_id"])
+        except YandexDeliveryError as e:
+            errors.append(e.code)
+        timings.append(time.perf_counter() - started)
+
+
+async def main(orders: int, concurrency: int, latency: str, error_rate: float, captcha_rate: float):
+    fake = FakeYandexDelivery(latency=latency, error_rate=error_rate, captcha_rate=captcha_rate, seed=42)
+    client = YandexDeliveryClient(token="bench", base_url="http://fake-yandex", transport=fake.transport())
+    sem = asyncio.Semaphore(concurrency)
+    timings: list = []
+    errors: list = []
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(client, sem, timings, errors) for _ in range(orders)))
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    p = lambda q: timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+    print(f"orders={orders} concurrency={concurrency} latency={latency}")
+    print(f"throughput: {orders / elapsed:.1f} orders/s ({elapsed:.2f}s total)")
+    print(f"latency ms: p50={p(0.5):.1f} p95={p(0.95):.1f} p99={p(0.99):.1f} mean={statistics.mean(timings) * 1000:.1f}")
+    print(f"errors: {len(errors)} {sorted(set(errors))}")
+    print(f"fake calls: {fake.calls}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", default="uniform:40,120")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--captcha-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.orders, args.concurrency, args.latency, args.error_rate, args.captcha_rate))
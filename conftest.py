@@ -6,10 +6,14 @@ Pytest Configuration & Fixtures
 import asyncio
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from app.database import Base
+from app.delivery.fake_yandex import FakeYandexDelivery
+from app.delivery.yandex import use_transport
+from app.request_context import install_db_stats
 from app.routes.user import app
 
 # Test database URL (используйте отдельную БД для тестов!)
@@ -28,6 +32,8 @@ def event_loop():
 async def test_engine():
     """Создаём тестовый engine для БД."""
     engine = create_async_engine(TEST_DATABASE_URL, echo=False)
+    # как у движка приложения: число запросов попадает в Server-Timing
+    install_db_stats(engine)
     
     # Создаём все таблицы
     async with engine.begin() as conn:
@@ -54,6 +60,19 @@ async def db_session(test_engine):
         await session.rollback()
 
 
+@pytest.fixture
+def sql_statements(test_engine):
+    """Собирает SQL, выполненный через тестовый engine (для проверки бюджета запросов)."""
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    yield statements
+    event.remove(test_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+
+
 @pytest.fixture
 async def client(db_session):
     """Создаём HTTP клиент для тестирования API."""
@@ -112,3 +131,38 @@ async def auth_headers(client, test_user):
     token = response.json()["access_token"]
     
     return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+async def admin_headers(client, db_session):
+    """JWT суперюзера (админские эндпоинты)."""
+    from app.models.models import User
+    from passlib.context import CryptContext
+
+    admin = User(
+        email="admin@example.com",
+        username="admin",
+        hashed_password=CryptContext(schemes=["bcrypt"], deprecated="auto").hash("adminpass123"),
+        role_id=1,
+        is_active=True,
+        is_superuser=True,
+        is_verified=True,
+    )
+    db_session.add(admin)
+    await db_session.commit()
+
+    response = await client.post(
+        "/auth/jwt/login",
+        data={"username": "admin@example.com", "password": "adminpass123"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def fake_yandex():
+    """Яндекс Доставка — фейк в памяти вместо сети (детерминированный seed)."""
+    use_transport(FakeYandexDelivery(seed=1).transport())
+    yield
+    use_transport(None)
@@ -0,0 +1,45 @@
+"""Add order payment fields and payment events
+
+Revision ID: 3b9f1e6a2c48
+Revises: e81a4c2f5d07
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9f1e6a2c48'
+down_revision: Union[str, Sequence[str], None] = 'e81a4c2f5d07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('orders', sa.Column('payment_id', sa.String(), nullable=True))
+    op.add_column('orders', sa.Column('payment_status', sa.String(), nullable=True))
+    op.create_index(op.f('ix_orders_payment_id'), 'orders', ['payment_id'], unique=False)
+
+    op.create_table('payment_events',
+    sa.Column('payment_id', sa.String(), nullable=False),
+    sa.Column('event', sa.String(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=True),
+    sa.Column('received_at', sa.DateTime(), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('payment_id', 'event')
+    )
+    op.create_index('ix_payment_events_unprocessed', 'payment_events', ['received_at'], unique=False,
+                    postgresql_where=sa.text('processed_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_payment_events_unprocessed', table_name='payment_events')
+    op.drop_table('payment_events')
+    op.drop_index(op.f('ix_orders_payment_id'), table_name='orders')
+    op.drop_column('orders', 'payment_status')
+    op.drop_column('orders', 'payment_id')
@@ -0,0 +1,29 @@
+"""Add partial index for payment reconciliation
+
+Revision ID: 5d2c7a90e1f3
+Revises: 3b9f1e6a2c48
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2c7a90e1f3'
+down_revision: Union[str, Sequence[str], None] = '3b9f1e6a2c48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_orders_pending_payment', 'orders', ['id'], unique=False,
+                    postgresql_where=sa.text("status = 'pending' AND payment_id IS NOT NULL"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_pending_payment', table_name='orders')
@@ -0,0 +1,28 @@
+"""Add review moderation override
+
+Revision ID: 9c1d5e2b7a30
+Revises: f2a8c61d9b47
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1d5e2b7a30'
+down_revision: Union[str, Sequence[str], None] = 'f2a8c61d9b47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('reviews', sa.Column('moderation_override', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('reviews', 'moderation_override')
@@ -0,0 +1,68 @@
+"""Add sales rollups
+
+Revision ID: c4d0860bc2ba
+Revises: 7f583e42ac9b
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d0860bc2ba'
+down_revision: Union[str, Sequence[str], None] = '7f583e42ac9b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('sales_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('size', sa.String(), nullable=True),
+    sa.Column('color', sa.String(), nullable=True),
+    sa.Column('revenue', sa.BigInteger(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('orders_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'product_id')
+    )
+    op.create_table('sales_day_totals',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('revenue', sa.BigInteger(), nullable=False),
+    sa.Column('delivery_revenue', sa.BigInteger(), nullable=False),
+    sa.Column('orders_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+
+    # первичное заполнение из существующих заказов
+    op.execute("""
+        INSERT INTO sales_daily (day, product_id, size, color, revenue, quantity, orders_count)
+        SELECT CAST(o.created_at AS DATE), oi.product_id, max(p.size), max(p.color),
+               coalesce(sum(oi.amount), 0), sum(oi.quantity), count(DISTINCT o.id)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        JOIN products p ON p.id = oi.product_id
+        WHERE o.status NOT IN ('cancelled', 'refunded')
+        GROUP BY 1, 2
+    """)
+    op.execute("""
+        INSERT INTO sales_day_totals (day, revenue, delivery_revenue, orders_count)
+        SELECT CAST(o.created_at AS DATE), coalesce(sum(i.revenue), 0),
+               coalesce(sum(o.delivery_cost), 0), count(o.id)
+        FROM orders o
+        LEFT JOIN (
+            SELECT order_id, sum(amount) AS revenue FROM order_items GROUP BY order_id
+        ) i ON i.order_id = o.id
+        WHERE o.status NOT IN ('cancelled', 'refunded')
+        GROUP BY 1
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sales_day_totals')
+    op.drop_table('sales_daily')
@@ -0,0 +1,29 @@
+"""Add partial index for review moderation queue
+
+Revision ID: c7f2a9d4e815
+Revises: a6e3f0b7c912
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7f2a9d4e815'
+down_revision: Union[str, Sequence[str], None] = 'a6e3f0b7c912'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_reviews_flagged', 'reviews', ['id'], unique=False,
+                    postgresql_where=sa.text('is_flagged'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_reviews_flagged', table_name='reviews')
@@ -0,0 +1,39 @@
+"""Add FAQ full-text search column and unanswered index
+
+Revision ID: f2a8c61d9b47
+Revises: d41b8e7a0c36
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a8c61d9b47'
+down_revision: Union[str, Sequence[str], None] = 'd41b8e7a0c36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('faqs', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('russian', coalesce(question, '') || ' ' || coalesce(answer, ''))", persisted=True),
+        nullable=True,
+    ))
+    op.create_index('ix_faqs_search_vector', 'faqs', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_faqs_unanswered', 'faqs', ['id'], unique=False,
+                    postgresql_where=sa.text('answer IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_faqs_unanswered', table_name='faqs')
+    op.drop_index('ix_faqs_search_vector', table_name='faqs')
+    op.drop_column('faqs', 'search_vector')
@@ -0,0 +1,88 @@
+"""
+Tests for sales rollups
+
+Роллапы продаж ведутся инкрементально при изменении заказов, пересчёт
+восстанавливает их из заказов, а второй пересчёт одновременно не запускается.
+"""
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import delete, func, select, update
+
+
+@pytest.fixture
+async def product(db_session):
+    from app.models.models import Product
+
+    product = Product(type="Футболка", size="L", color="Синий", price=1000)
+    db_session.add(product)
+    await db_session.commit()
+    return product
+
+
+async def _product_row(client: AsyncClient, admin_headers, product_id: int):
+    response = await client.get("/analytics/sales/products", params={"limit": 500}, headers=admin_headers)
+    assert response.status_code == 200
+    return next((r for r in response.json() if r["product_id"] == product_id), None)
+
+
+async def _order(client: AsyncClient, auth_headers, product_id: int, quantity: int):
+    response = await client.post(
+        "/orders",
+        json={"items": [{"product_id": product_id, "quantity": quantity}], "city": "Москва"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 201
+    return response.json()
+
+
+@pytest.mark.asyncio
+async def test_order_changes_update_rollups(client: AsyncClient, auth_headers, admin_headers, product, fake_yandex):
+    """Новый заказ добавляет продажи, отмена — вычитает"""
+    await _order(client, auth_headers, product.id, 2)
+    cancelled = await _order(client, auth_headers, product.id, 1)
+
+    row = await _product_row(client, admin_headers, product.id)
+    assert (row["quantity"], row["revenue"], row["orders_count"]) == (3, 3000, 2)
+
+    response = await client.patch(f"/orders/{cancelled['id']}/meta", json={"status": "cancelled"}, headers=admin_headers)
+    assert response.status_code == 200
+    row = await _product_row(client, admin_headers, product.id)
+    assert (row["quantity"], row["revenue"], row["orders_count"]) == (2, 2000, 1)
+
+
+@pytest.mark.asyncio
+async def test_rebuild_restores_rollups(
+    client: AsyncClient, auth_headers, admin_headers, product, db_session, fake_yandex
+):
+    """Пересчёт восстанавливает испорченные роллапы из заказов"""
+    from app.models.models import SalesDaily, SalesDayTotal
+
+    await _order(client, auth_headers, product.id, 2)
+    expected_row = await _product_row(client, admin_headers, product.id)
+    expected_days = (await client.get("/analytics/sales/daily", headers=admin_headers)).json()
+
+    await db_session.execute(delete(SalesDaily).where(SalesDaily.product_id == product.id))
+    await db_session.execute(update(SalesDayTotal).values(revenue=0, orders_count=0))
+    await db_session.commit()
+
+    response = await client.post("/analytics/sales/rebuild", headers=admin_headers)
+    assert response.status_code == 200
+    assert await _product_row(client, admin_headers, product.id) == expected_row
+    assert (await client.get("/analytics/sales/daily", headers=admin_headers)).json() == expected_days
+
+
+@pytest.mark.asyncio
+async def test_rebuild_conflicts_with_running_rebuild(client: AsyncClient, admin_headers, test_engine):
+    """Пока другой пересчёт держит advisory lock, ручной пересчёт отвечает 409"""
+    from app.helpers.analytics_helpers import ROLLUP_REPAIR_LOCK_KEY
+
+    async with test_engine.connect() as conn:
+        await conn.begin()
+        assert await conn.scalar(select(func.pg_try_advisory_xact_lock(ROLLUP_REPAIR_LOCK_KEY)))
+
+        response = await client.post("/analytics/sales/rebuild", headers=admin_headers)
+        assert response.status_code == 409
+        await conn.rollback()
+
+    response = await client.post("/analytics/sales/rebuild", headers=admin_headers)
+    assert response.status_code == 200
@@ -0,0 +1,78 @@
+"""
+Tests for Yandex Delivery stand-in
+
+Тесты для локального стенда Яндекс Доставки (без сети и БД).
+"""
+import json
+
+import pytest
+
+from app.delivery.fake_yandex import FakeYandexDelivery, parse_latency
+from app.delivery.yandex import YandexDeliveryClient, YandexDeliveryError
+
+
+def _client(fake: FakeYandexDelivery) -> YandexDeliveryClient:
+    return YandexDeliveryClient(token="test", base_url="http://fake", transport=fake.transport())
+
+
+@pytest.mark.asyncio
+async def test_offer_confirm_info_roundtrip():
+    """offers/create → offers/confirm → request/info/history консистентны."""
+    fake = FakeYandexDelivery(seed=1)
+    client = _client(fake)
+
+    offers = (await client.create_offer("station", {"city": "Москва"}, items=[]))["offers"]
+    assert offers and int(offers[0]["price"]["total"]) > 0
+
+    confirm = await client.confirm_offer(offers[0]["offer_id"])
+    info = await client.get_request_info(confirm["request_id"])
+    history = await client.get_request_history(confirm["request_id"])
+
+    assert info["status"] == "CREATED"
+    assert history["state_history"][0]["status"] == "CREATED"
+    assert fake.calls["/offers/create"] == 1
+
+
+@pytest.mark.asyncio
+async def test_captcha_injection():
+    """Инжектированная капча превращается в smartcaptcha_block на клиенте."""
+    client = _client(FakeYandexDelivery(captcha_rate=1.0))
+
+    with pytest.raises(YandexDeliveryError) as exc:
+        await client.confirm_offer("any")
+    assert exc.value.code == "smartcaptcha_block"
+
+
+@pytest.mark.asyncio
+async def test_replay(tmp_path):
+    """Записанные ответы отдаются вместо синтетических."""
+    path = tmp_path / "yandex.jsonl"
+    path.write_text(json.dumps({
+        "endpoint": "/api/b2b/platform/request/info",
+        "status": 200,
+        "body": {"request_id": "r-1", "status": "DELIVERY_DELIVERED"},
+    }) + "\n")
+    client = _client(FakeYandexDelivery(replay_path=str(path)))
+
+    info = await client.get_request_info("r-1")
+    assert info["status"] == "DELIVERY_DELIVERED"
+
+
+def test_parse_latency():
+    """Разбор описаний распределений задержки."""
+    import random
+
+    assert parse_latency("fixed:50")(random.Random()) == 0.05
+    assert 0.02 <= parse_latency("uniform:20,80")(random.Random()) <= 0.08
+    with pytest.raises(ValueError):
+        parse_latency("poisson:3")
+
+
+def test_app_is_built_by_factory(tmp_path, monkeypatch):
+    """Модуль не читает env при импорте: файл реплея подхватывает create_app()."""
+    from app.delivery import fake_yandex
+
+    monkeypatch.setenv("FAKE_YANDEX_REPLAY", str(tmp_path / "missing.jsonl"))
+    assert not hasattr(fake_yandex, "app")
+    with pytest.raises(FileNotFoundError):
+        fake_yandex.create_app()
@@ -0,0 +1,110 @@
+"""
+Tests for Idempotency-Key
+
+Повтор с тем же ключом получает сохранённый ответ, тот же ключ с другим телом —
+422, параллельный дубликат ждёт оригинал, а ответы с секретами в БД не пишутся.
+"""
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.helpers import idempotency_helpers
+from app.helpers.idempotency_helpers import run_idempotent
+
+
+class _Out(BaseModel):
+    id: int
+    password: str = ""
+
+
+@pytest.fixture
+def idempotency_session(test_engine, monkeypatch):
+    """Ключи пишутся своими короткими сессиями — направляем их в тестовую БД."""
+    session_factory = sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(idempotency_helpers, "async_session", session_factory)
+    return session_factory
+
+
+def _handler(calls: list, gate: asyncio.Event = None):
+    async def handler():
+        calls.append(1)
+        if gate is not None:
+            await gate.wait()
+        return _Out(id=len(calls), password="secret")
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_retry_replays_stored_response(idempotency_session):
+    """Повтор не выполняет работу второй раз и отдаёт тот же ответ"""
+    calls = []
+    kwargs = dict(scope="test_replay", user_id=1, payload={"a": 1}, response_model=_Out)
+
+    first = await run_idempotent("key-replay", handler=_handler(calls), **kwargs)
+    second = await run_idempotent("key-replay", handler=_handler(calls), **kwargs)
+
+    assert calls == [1]
+    assert json.loads(second.body) == json.loads(first.body) == {"id": 1, "password": "secret"}
+    assert second.headers["Idempotent-Replayed"] == "true"
+
+
+@pytest.mark.asyncio
+async def test_same_key_with_different_body_is_rejected(idempotency_session):
+    """Тот же ключ с другим телом — 422, работа не выполняется"""
+    calls = []
+    kwargs = dict(scope="test_mismatch", user_id=1, response_model=_Out)
+    await run_idempotent("key-mismatch", payload={"a": 1}, handler=_handler(calls), **kwargs)
+
+    with pytest.raises(HTTPException) as exc:
+        await run_idempotent("key-mismatch", payload={"a": 2}, handler=_handler(calls), **kwargs)
+    assert exc.value.status_code == 422
+    assert calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_waits_for_original(idempotency_session):
+    """Дубликат, пришедший во время работы оригинала, ждёт его и получает тот же ответ"""
+    calls = []
+    gate = asyncio.Event()
+    kwargs = dict(scope="test_inflight", user_id=1, payload={"a": 1}, response_model=_Out)
+
+    original = asyncio.create_task(run_idempotent("key-inflight", handler=_handler(calls, gate), **kwargs))
+    while not calls:
+        await asyncio.sleep(0.01)
+    duplicate = asyncio.create_task(run_idempotent("key-inflight", handler=_handler(calls), **kwargs))
+    await asyncio.sleep(0.1)
+    assert not duplicate.done()
+
+    gate.set()
+    first, second = await asyncio.gather(original, duplicate)
+    assert calls == [1]
+    assert json.loads(second.body) == json.loads(first.body)
+    assert second.headers["Idempotent-Replayed"] == "true"
+
+
+@pytest.mark.asyncio
+async def test_secret_response_is_not_stored(idempotency_session):
+    """stored_fields: в БД только id, повтор получает 409 с ним"""
+    from app.models.models import IdempotencyKey
+
+    calls = []
+    kwargs = dict(
+        scope="test_secret", user_id=1, payload={}, response_model=_Out, stored_fields=("id",),
+    )
+    first = await run_idempotent("key-secret", handler=_handler(calls), **kwargs)
+    assert json.loads(first.body)["password"] == "secret"
+
+    async with idempotency_session() as session:
+        row = await session.get(IdempotencyKey, (1, "test_secret", "key-secret"))
+    assert json.loads(row.response_body) == {"id": 1}
+
+    with pytest.raises(HTTPException) as exc:
+        await run_idempotent("key-secret", handler=_handler(calls), **kwargs)
+    assert exc.value.status_code == 409
+    assert exc.value.detail["id"] == 1
+    assert calls == [1]
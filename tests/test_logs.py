@@ -0,0 +1,227 @@
+"""
+Tests for log search and reports
+
+Поиск идёт по текущему файлу и ротированным бэкапам от старых к новым,
+многострочные записи не рвутся, а cursor продолжает поиск с места остановки.
+Бэкапы сжимаются gzip и читаются так же, как несжатые, в том числе при
+дочитывании хвоста после ротации. Отчёт о задержках
+строится по строкам REQUEST и дочитывает файл инкрементально.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.helpers import latency_report_helpers
+from app.helpers.latency_report_helpers import build_latency_report
+from app.helpers.logs_helpers import (
+    LogQuery,
+    log_segments,
+    log_size,
+    read_lines_after,
+    search_logs,
+    tail_with_offset,
+)
+from app.logging_config import CompressingRotatingFileHandler, _Compressor
+from app.routes import logs_router as logs_module
+from app.routes.dependecies import current_superuser
+
+BASE = datetime(2026, 10, 19, 10, 0, 0)
+
+
+def _write_segments(tmp_path, per_segment=3000):
+    n = 0
+    for name in ("app.log.2", "app.log.1", "app.log"):
+        with open(tmp_path / name, "w") as f:
+            for _ in range(per_segment):
+                level = "ERROR" if n % 500 == 0 else "INFO"
+                f.write(f"{BASE + timedelta(seconds=n):%Y-%m-%d %H:%M:%S},000 - app - {level} - order {n}\n")
+                if level == "ERROR":
+                    f.write("Traceback (most recent call last):\n  ValueError: boom\n")
+                n += 1
+        mtime = (BASE + timedelta(seconds=n)).timestamp()
+        os.utime(tmp_path / name, (mtime, mtime))
+    return str(tmp_path / "app.log")
+
+
+async def _collect(path, query, **kwargs):
+    return [json.loads(line) async for line in search_logs(path, query, **kwargs)]
+
+
+@pytest.mark.asyncio
+async def test_search_spans_rotated_segments_by_time_and_level(tmp_path):
+    """Диапазон времени через два сегмента, только ERROR, traceback внутри записи"""
+    path = _write_segments(tmp_path)
+    query = LogQuery(since=BASE + timedelta(seconds=2000), until=BASE + timedelta(seconds=7000), level="ERROR")
+    *matches, done = await _collect(path, query)
+
+    assert [m["text"].split(" - ")[-1].split("\n")[0] for m in matches] == [
+        f"order {n}" for n in range(2000, 7001, 500)
+    ]
+    assert {m["segment"] for m in matches} == {"app.log.2", "app.log.1", "app.log"}
+    assert matches[0]["text"].endswith("ValueError: boom")
+    assert done["matches"] == len(matches) and not done["truncated"]
+
+
+@pytest.mark.asyncio
+async def test_search_cursor_resumes_after_limit(tmp_path):
+    """limit обрывает поиск с курсором, продолжение отдаёт следующие записи"""
+    path = _write_segments(tmp_path)
+    query = LogQuery(text="valueerror")
+    *first, done = await _collect(path, query, limit=5)
+    assert done["truncated"]
+
+    cursor = (done["cursor"]["inode"], done["cursor"]["offset"])
+    *rest, done = await _collect(path, query, cursor=cursor)
+    assert len(first) + len(rest) == 18
+    assert rest[0]["offset"] > first[-1]["offset"] or rest[0]["segment"] != first[-1]["segment"]
+    assert not done["truncated"]
+
+
+@pytest.mark.asyncio
+async def test_search_cursor_survives_rotation(tmp_path):
+    """Курсор указывает на inode: после сдвига номеров бэкапов поиск продолжается там же"""
+    path = _write_segments(tmp_path)
+    query = LogQuery(text="valueerror")
+    *first, done = await _collect(path, query, limit=5)
+    assert first[-1]["segment"] == "app.log.2"
+
+    for old, new in (("app.log.2", "app.log.3"), ("app.log.1", "app.log.2"), ("app.log", "app.log.1")):
+        os.rename(tmp_path / old, tmp_path / new)
+    (tmp_path / "app.log").write_text("")
+
+    *rest, done = await _collect(path, query, cursor=(done["cursor"]["inode"], done["cursor"]["offset"]))
+    assert rest[0]["segment"] == "app.log.3" and rest[0]["offset"] > first[-1]["offset"]
+    assert len(first) + len(rest) == 18 and not done["truncated"]
+
+
+@pytest.mark.asyncio
+async def test_stalled_search_stream_does_not_hold_slot(tmp_path, monkeypatch):
+    """Клиент, не читающий поток, не занимает слот поиска между записями"""
+    import asyncio
+
+    from app.helpers import logs_helpers
+
+    monkeypatch.setattr(logs_helpers, "_search_slots", asyncio.Semaphore(1))
+    path = _write_segments(tmp_path)
+    stalled = search_logs(path, LogQuery(text="valueerror"))
+    assert json.loads(await stalled.__anext__())["type"] == "match"
+
+    *matches, _ = await asyncio.wait_for(_collect(path, LogQuery(level="ERROR")), timeout=5)
+    assert len(matches) == 18
+    await stalled.aclose()
+
+
+@pytest.mark.asyncio
+async def test_rotated_segments_are_gzipped_and_still_searchable(tmp_path):
+    """Бэкапы сжимаются в фоне, поиск и хвост читают .gz прозрачно"""
+    compressor = _Compressor()
+    handler = CompressingRotatingFileHandler(str(tmp_path / "app.log"), compressor, maxBytes=20_000, backupCount=3)
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    for i in range(3000):
+        handler.emit(logging.makeLogRecord({"name": "app", "levelname": "INFO", "levelno": logging.INFO,
+                                            "msg": "order %d", "args": (i,)}))
+    handler.close()
+    compressor.stop()
+
+    assert sorted(os.listdir(tmp_path)) == ["app.log", "app.log.1.gz", "app.log.2.gz", "app.log.3.gz"]
+    segments = log_segments(str(tmp_path / "app.log"))
+    assert [os.path.basename(s) for s in segments] == ["app.log.3.gz", "app.log.2.gz", "app.log.1.gz", "app.log"]
+
+    lines, offset, _ = tail_with_offset(segments[-2], 1)
+    assert offset == log_size(segments[-2])
+    *matches, _ = await _collect(str(tmp_path / "app.log"), LogQuery(text=lines[0].split(" - ")[-1] + "$", regex=True))
+    assert [m["segment"] for m in matches] == ["app.log.1.gz"]
+
+
+def test_follow_drains_rotated_file_after_compression(tmp_path):
+    """Хвост ротированного файла отдаётся, даже если path.1 уже сжат в path.1.gz"""
+    compressor = _Compressor()
+    handler = CompressingRotatingFileHandler(str(tmp_path / "app.log"), compressor, maxBytes=1_000_000, backupCount=3)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def emit(msg):
+        handler.emit(logging.makeLogRecord({"name": "app", "levelno": logging.INFO, "msg": msg}))
+
+    emit("a")
+    emit("b")
+    _, offset, inode = tail_with_offset(str(tmp_path / "app.log"), 10)
+    emit("c")
+    emit("d")
+    handler.doRollover()
+    emit("e")
+    handler.close()
+    compressor.stop()
+
+    assert not os.path.exists(tmp_path / "app.log.1")
+    result = read_lines_after(str(tmp_path / "app.log"), offset, inode)
+    assert result["rotated"]
+    assert result["lines"] == ["c", "d", "e"]
+
+
+def test_latency_report_percentiles_and_incremental_parse(tmp_path):
+    """p50/p95 по роуту и статусу; повторный отчёт дочитывает только новые строки"""
+    path = tmp_path / "app.log"
+    now = datetime.now().replace(microsecond=0)
+
+    def write(durations, status=200):
+        with open(path, "a") as f:
+            for i, ms in enumerate(durations):
+                f.write(f"{now:%Y-%m-%d %H:%M:%S},{i % 1000:03d} - app - INFO - "
+                        f"REQUEST GET /orders/{i}?page=1 | status={status} | {ms:.1f}ms | db=2/0.5ms\n")
+
+    write(range(1, 101))
+    write([5.0] * 10, status=404)
+    window = (now - timedelta(hours=1), now + timedelta(hours=1))
+    report = build_latency_report(str(path), *window)
+    rows = {(r["route"], r["status"]): r for r in report["rows"]}
+    ok = rows[("GET /orders/{id}", 200)]
+    assert (ok["count"], ok["p50_ms"], ok["p95_ms"], ok["max_ms"]) == (100, 50.5, 95.05, 100.0)
+    assert rows[("GET /orders/{id}", 404)]["count"] == 10
+
+    key = (os.stat(path).st_dev, os.stat(path).st_ino)
+    parsed_until = latency_report_helpers._segments[str(path)][key].offset
+    write([1000.0])
+    # отчёт по другому журналу не сбрасывает кэш app.log
+    (tmp_path / "error.log").write_text("")
+    build_latency_report(str(tmp_path / "error.log"), *window)
+    report = build_latency_report(str(path), *window)
+    assert report["requests"] == 111
+    assert latency_report_helpers._segments[str(path)][key].offset > parsed_until
+
+
+def test_latency_report_groups_by_logged_route_template(tmp_path):
+    """route= из строки журнала: слаги (/qr/abc, /qr/def-gh) — одна строка отчёта"""
+    path = tmp_path / "app.log"
+    now = datetime.now().replace(microsecond=0)
+    with open(path, "w") as f:
+        for code in ("abc", "def-gh", "x1y2"):
+            f.write(f"{now:%Y-%m-%d %H:%M:%S},000 - app - INFO - REQUEST GET /qr/{code}"
+                    f" | status=200 | 3.0ms | db=1/0.1ms | route=/qr/{{code}} | body={{}}\n")
+
+    report = build_latency_report(str(path), now - timedelta(hours=1), now + timedelta(hours=1))
+    assert [(r["route"], r["count"]) for r in report["rows"]] == [("GET /qr/{code}", 3)]
+
+
+@pytest.mark.asyncio
+async def test_latency_endpoint_accepts_local_since(tmp_path, monkeypatch):
+    """since без зоны (локальное время, как в /logs/search) — не 500, а отчёт"""
+    now = datetime.now().replace(microsecond=0)
+    (tmp_path / "app.log").write_text(
+        f"{now:%Y-%m-%d %H:%M:%S},000 - app - INFO - REQUEST GET /orders/1 | status=200 | 12.0ms | db=1/0.5ms\n"
+    )
+    monkeypatch.setattr(logs_module, "LOGS_DIR", str(tmp_path))
+    app = FastAPI()
+    app.include_router(logs_module.logs_router)
+    app.dependency_overrides[current_superuser] = lambda: None
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/logs/latency", params={"since": f"{now - timedelta(hours=1):%Y-%m-%dT%H:%M:%S}"})
+
+    assert response.status_code == 200
+    assert response.json()["requests"] == 1
@@ -0,0 +1,101 @@
+"""
+Tests for SMTP mailer
+
+Письма уходят через одно авторизованное соединение, обрыв соединения
+переживается переподключением, временные отказы (в том числе 4xx на RCPT)
+не считаются окончательными, а ошибка входа и недоступный сервер — проблема
+настроек или сети, не письма.
+"""
+import pytest
+
+from app.mail.fake_smtp import FakeSMTPServer
+from app.mail.smtp import MailError, SmtpMailer
+
+
+@pytest.mark.asyncio
+async def test_mailer_reuses_one_authenticated_connection():
+    """Несколько писем — одно подключение и один вход"""
+    async with FakeSMTPServer() as server:
+        mailer = SmtpMailer(host=server.host, port=server.port, username="bot", password="secret",
+                            from_email="noreply@example.com")
+        for i in range(5):
+            await mailer.send(f"user{i}@example.com", "Ответ на ваш вопрос (FAQ)", f"Ответ №{i}")
+        await mailer.aclose()
+
+    assert server.connections == 1
+    assert server.logins == 1
+    assert [m.rcpt_to for m in server.messages] == [[f"user{i}@example.com"] for i in range(5)]
+    assert server.messages[0].message["Subject"] == "Ответ на ваш вопрос (FAQ)"
+    assert "Ответ №0" in server.messages[0].message.get_content()
+
+
+@pytest.mark.asyncio
+async def test_mailer_reconnects_after_server_drop():
+    """Разорванное сервером соединение открывается заново"""
+    server = await FakeSMTPServer().start()
+    mailer = SmtpMailer(host=server.host, port=server.port, username="", from_email="noreply@example.com")
+    await mailer.send("a@example.com", "s", "first")
+    await server.stop()
+
+    server = await FakeSMTPServer(port=server.port).start()
+    await mailer.send("b@example.com", "s", "second")
+    await mailer.aclose()
+    await server.stop()
+
+    assert [m.rcpt_to for m in server.messages] == [["b@example.com"]]
+
+
+@pytest.mark.asyncio
+async def test_temporary_rejection_is_retryable():
+    async with FakeSMTPServer(error_rate=1.0) as server:
+        mailer = SmtpMailer(host=server.host, port=server.port, username="", from_email="noreply@example.com")
+        with pytest.raises(MailError) as exc:
+            await mailer.send("a@example.com", "s", "body")
+        await mailer.aclose()
+
+    assert not exc.value.permanent
+
+
+@pytest.mark.asyncio
+async def test_recipient_refusal_is_permanent_only_for_5xx():
+    """450 на RCPT (greylisting) — повторяем позже, 550 — окончательный отказ"""
+    refuse = {"grey@example.com": 450, "nobody@example.com": 550}
+    async with FakeSMTPServer(refuse=refuse) as server:
+        mailer = SmtpMailer(host=server.host, port=server.port, username="", from_email="noreply@example.com")
+        errors = {}
+        for address in refuse:
+            with pytest.raises(MailError) as exc:
+                await mailer.send(address, "s", "body")
+            errors[address] = exc.value
+        await mailer.aclose()
+
+    assert not errors["grey@example.com"].permanent
+    assert errors["nobody@example.com"].permanent
+    assert not any(e.config for e in errors.values())
+
+
+@pytest.mark.asyncio
+async def test_authentication_failure_is_config_error():
+    """Неверный логин — проблема настроек: не окончательный отказ письму"""
+    async with FakeSMTPServer(reject_login=True) as server:
+        mailer = SmtpMailer(host=server.host, port=server.port, username="bot", password="wrong",
+                            from_email="noreply@example.com")
+        with pytest.raises(MailError) as exc:
+            await mailer.send("a@example.com", "s", "body")
+        await mailer.aclose()
+
+    assert exc.value.config and not exc.value.permanent
+
+
+@pytest.mark.asyncio
+async def test_unreachable_server_is_connection_error():
+    """Сервер не отвечает — ошибка соединения: попытка письму не засчитывается"""
+    server = await FakeSMTPServer().start()
+    await server.stop()
+    mailer = SmtpMailer(host=server.host, port=server.port, username="", from_email="noreply@example.com",
+                        timeout=2)
+    with pytest.raises(MailError) as exc:
+        await mailer.send("a@example.com", "s", "body")
+    await mailer.aclose()
+
+    assert exc.value.connection and not exc.value.permanent and not exc.value.config
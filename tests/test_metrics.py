@@ -0,0 +1,57 @@
+"""
+Tests for Prometheus metrics
+
+Запросы считаются по шаблону роута (не по сырому пути), исходящие вызовы —
+по сервису, операции и исходу.
+"""
+import httpx
+import pytest
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+
+from app.delivery.fake_yandex import FakeYandexDelivery
+from app.delivery.yandex import YandexDeliveryClient
+from app.request_logging import RequestLoggingMiddleware
+from app.routes.metrics_router import metrics_router
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RequestLoggingMiddleware)
+    app.include_router(metrics_router)
+
+    @app.get("/orders/{order_id}")
+    async def get_order(order_id: int):
+        return {"id": order_id}
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_requests_are_labelled_by_route_template():
+    """Разные id — одна серия /orders/{order_id}; несуществующие пути — <unmatched>"""
+    labels = {"method": "GET", "route": "/orders/{order_id}", "status": "200"}
+    before = REGISTRY.get_sample_value("http_requests_total", labels) or 0
+
+    transport = httpx.ASGITransport(app=_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for order_id in range(3):
+            assert (await client.get(f"/orders/{order_id}")).status_code == 200
+        await client.get("/nope/123")
+        body = (await client.get("/metrics")).text
+
+    assert REGISTRY.get_sample_value("http_requests_total", labels) == before + 3
+    assert 'route="<unmatched>",status="404"' in body
+    assert 'route="/orders/1"' not in body
+
+
+@pytest.mark.asyncio
+async def test_outbound_yandex_calls_are_timed():
+    """Вызовы клиента Яндекс Доставки попадают в гистограмму с классом статуса"""
+    labels = {"service": "yandex_delivery", "operation": "/api/b2b/platform/offers/create", "outcome": "2xx"}
+    before = REGISTRY.get_sample_value("outbound_request_duration_seconds_count", labels) or 0
+
+    client = YandexDeliveryClient(token="test", base_url="http://fake", transport=FakeYandexDelivery(seed=1).transport())
+    await client.create_offer("station", {"city": "Москва"}, items=[])
+
+    assert REGISTRY.get_sample_value("outbound_request_duration_seconds_count", labels) == before + 1
@@ -0,0 +1,84 @@
+"""
+Tests for bad-word matcher
+
+Скомпилированный матчер совпадает с прежней проверкой (вхождение подстроки
+без учёта регистра) и возвращает все найденные слова. Импорт списка не читает
+файл сверх лимита. Повторная модерация не перетирает изменения, сделанные,
+пока пачка матчилась.
+"""
+import pytest
+from sqlalchemy import select
+
+from app.helpers.bad_words_helpers import parse_bad_words
+from app.helpers.moderation import BadWordMatcher
+
+
+def test_matcher_finds_overlapping_and_prefix_words():
+    """Слова-префиксы и перекрывающиеся слова находятся вместе с длинными"""
+    matcher = BadWordMatcher(["хер", "херня", "ерн", "Дурак", "  "])
+
+    assert matcher.find("Какая ХЕРНЯ, дураки!") == ["дурак", "ерн", "хер", "херня"]
+    assert matcher.matches("недураковатый")
+    assert not matcher.matches("всё хорошо")
+
+
+def test_matcher_escapes_regex_characters():
+    """Спецсимволы в словах не ломают выражение"""
+    matcher = BadWordMatcher(["a.b", "x]y", "(c)"])
+
+    assert matcher.find("a.b and (c)") == ["(c)", "a.b"]
+    assert not matcher.matches("axb")
+
+
+def test_empty_matcher_matches_nothing():
+    assert BadWordMatcher([]).find("что угодно") == []
+    assert not BadWordMatcher([]).matches("что угодно")
+
+
+def test_parse_bad_words_dedupes_and_skips_csv_header():
+    """Импорт: заголовок CSV пропускается, слова нормализуются и дедуплицируются"""
+    raw = "word\nХер,1\n\"a,b\",2\n хер \n\n".encode()
+
+    assert parse_bad_words(raw, is_csv=True) == (["хер", "a,b"], 4, 1)
+    assert parse_bad_words("\ufeffХер\nбля\nхер\n".encode(), is_csv=False) == (["хер", "бля"], 3, 0)
+
+
+
+@pytest.mark.asyncio
+async def test_oversized_bad_words_upload_is_rejected_without_full_read(monkeypatch):
+    """Больше лимита — 413: по file.size до чтения или по лимиту + 1 прочитанному байту"""
+    import io
+
+    from fastapi import HTTPException, UploadFile
+
+    from app.helpers import bad_words_helpers
+
+    monkeypatch.setattr(bad_words_helpers, "BAD_WORDS_IMPORT_MAX_BYTES", 10)
+    assert await bad_words_helpers.read_bad_words_upload(UploadFile(io.BytesIO(b"a\nb\n"))) == b"a\nb\n"
+
+    for upload in (UploadFile(io.BytesIO(b"x" * 100)), UploadFile(io.BytesIO(b""), size=100)):
+        with pytest.raises(HTTPException) as exc:
+            await bad_words_helpers.read_bad_words_upload(upload)
+        assert exc.value.status_code == 413
+
+@pytest.mark.asyncio
+async def test_scan_does_not_overwrite_changes_made_during_matching(db_session, test_user):
+    """Флаг не ставится, если за время матчинга автор поправил текст или админ вынес решение"""
+    from app.helpers.remoderation_helpers import _set_flags
+    from app.models.models import Review
+
+    edited = Review(stars=1, content="исправленный текст", user_id=test_user.id)
+    approved = Review(stars=1, content="хер", user_id=test_user.id, moderation_override="approved")
+    untouched = Review(stars=1, content="хер", user_id=test_user.id)
+    db_session.add_all([edited, approved, untouched])
+    await db_session.commit()
+
+    # матчер видел старый текст отзыва edited
+    seen = [(edited.id, "хер"), (approved.id, "хер"), (untouched.id, "хер")]
+    assert await _set_flags(db_session, seen, True) == 1
+    await db_session.commit()
+
+    flagged = (await db_session.execute(
+        select(Review.id).where(Review.id.in_([r for r, _ in seen]), Review.is_flagged)
+    )).scalars().all()
+    assert flagged == [untouched.id]
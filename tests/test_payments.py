@@ -0,0 +1,104 @@
+"""
+Tests for YooKassa payments
+
+Платёж создаётся через асинхронный клиент, вебхуки дедуплицируются,
+статус заказа меняется только после сверки с API.
+"""
+import pytest
+from httpx import AsyncClient
+
+from app.delivery.fake_yandex import FakeYandexDelivery
+from app.delivery import yandex
+from app.payments import yookassa
+from app.payments.fake_yookassa import FakeYooKassa
+
+
+@pytest.fixture
+def fake_gateways():
+    gateway = FakeYooKassa(seed=1)
+    yandex.use_transport(FakeYandexDelivery(seed=1).transport())
+    yookassa.use_transport(gateway.transport())
+    yield gateway
+    yandex.use_transport(None)
+    yookassa.use_transport(None)
+
+
+@pytest.fixture
+async def pending_order(client: AsyncClient, auth_headers, db_session, fake_gateways):
+    from app.models.models import Product
+
+    product = Product(type="Футболка", size="M", color="Белый", price=1000)
+    db_session.add(product)
+    await db_session.commit()
+
+    response = await client.post(
+        "/orders",
+        json={"items": [{"product_id": product.id, "quantity": 1}], "city": "Москва"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 201
+    return response.json()
+
+
+@pytest.mark.asyncio
+async def test_webhook_is_deduped_and_applied_after_verification(
+    client: AsyncClient, auth_headers, db_session, pending_order, fake_gateways, monkeypatch
+):
+    """Дубликат вебхука не создаёт второе событие, заказ становится paid после сверки"""
+    from sqlalchemy import func, select
+    from app.helpers.payment_helpers import process_payment_events
+    from app.models.models import Order, PaymentEvent
+
+    monkeypatch.setenv("YOOKASSA_WEBHOOK_CHECK_IP", "0")
+
+    created = await client.post("/payment/create", json={"order_id": pending_order["id"]}, headers=auth_headers)
+    assert created.status_code == 200
+    payment_id = created.json()["payment_id"]
+
+    # повтор create пока платёж не оплачен — тот же платёж
+    again = await client.post("/payment/create", json={"order_id": pending_order["id"]}, headers=auth_headers)
+    assert again.json()["payment_id"] == payment_id
+
+    fake_gateways.settle(payment_id, "succeeded")
+    for _ in range(2):
+        response = await client.post("/payment/webhook", json=fake_gateways.notification(payment_id))
+        assert response.status_code == 200
+
+    events = await db_session.scalar(select(func.count()).select_from(PaymentEvent))
+    assert events == 1
+
+    assert await process_payment_events(db_session) == 1
+    status = await db_session.scalar(select(Order.status).where(Order.id == pending_order["id"]))
+    assert status == "paid"
+
+
+@pytest.mark.asyncio
+async def test_webhook_from_unknown_address_is_rejected(client: AsyncClient):
+    """Уведомления не с адресов YooKassa отбрасываются"""
+    response = await client.post(
+        "/payment/webhook",
+        json={"type": "notification", "event": "payment.succeeded", "object": {"id": "x"}},
+    )
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_reconcile_applies_lost_webhook(client: AsyncClient, auth_headers, db_session, pending_order, fake_gateways):
+    """Вебхук потерялся: dry-run только показывает переход, обычный прогон его применяет"""
+    from datetime import timedelta
+    from sqlalchemy import select
+    from app.helpers.payment_helpers import reconcile_payments
+    from app.models.models import Order
+
+    created = await client.post("/payment/create", json={"order_id": pending_order["id"]}, headers=auth_headers)
+    fake_gateways.settle(created.json()["payment_id"], "succeeded")
+
+    report = await reconcile_payments(db_session, dry_run=True, min_age=timedelta(0))
+    assert [(c.order_id, c.status) for c in report.changes] == [(pending_order["id"], ("pending", "paid"))]
+    status = await db_session.scalar(select(Order.status).where(Order.id == pending_order["id"]))
+    assert status == "pending"
+
+    report = await reconcile_payments(db_session, min_age=timedelta(0))
+    assert report.scanned == 1 and not report.failed
+    status = await db_session.scalar(select(Order.status).where(Order.id == pending_order["id"]))
+    assert status == "paid"
@@ -0,0 +1,82 @@
+"""
+Tests for slow-query log
+
+Запросы с разными литералами и длиной IN-списка сводятся к одному отпечатку,
+в журнал попадает форма параметров (без значений) и шаблон роута, а план
+запрашивается не чаще раза на отпечаток. Снимки воркеров складываются в общий отчёт.
+"""
+import asyncio
+import json
+import os
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app import slow_queries
+from app.request_logging import RequestLoggingMiddleware
+from app.slow_queries import fingerprint_id, normalize_sql, param_shapes, record_slow_query
+
+
+def test_literals_and_in_lists_share_fingerprint():
+    """IN ($1, $2) и IN (5, 7, 9), строки и числа — один нормализованный SQL"""
+    a = normalize_sql("SELECT * FROM qr_codes WHERE id IN ($1, $2) AND code = 'abc'")
+    b = normalize_sql("SELECT *  FROM qr_codes\n WHERE id IN (5, 7, 9) AND code = 'it''s'")
+    assert a == b == "SELECT * FROM qr_codes WHERE id IN (...) AND code = ?"
+    assert fingerprint_id(a) == fingerprint_id(b)
+    assert normalize_sql("INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4)") == "INSERT INTO t (a, b) VALUES (...)"
+    assert param_shapes(("secret@example.com", 5, None, [1, 2])) == ["str[18]", "int", "null", "list[2]"]
+
+
+@pytest.mark.asyncio
+async def test_slow_query_records_route_and_requests_plan_once(monkeypatch):
+    """Роут берётся из scope запроса; второй такой же запрос план не запрашивает"""
+    queue = asyncio.Queue()
+    monkeypatch.setattr(slow_queries, "_explain_queue", queue)
+    monkeypatch.setattr(slow_queries, "_explain_times", [])
+    monkeypatch.setattr(slow_queries, "SLOW_QUERY_DIR", None)
+    await slow_queries.reset_slow_queries()
+
+    app = FastAPI()
+    app.add_middleware(RequestLoggingMiddleware)
+
+    @app.get("/orders/{order_id}")
+    async def get_order(order_id: int):
+        sql = f"SELECT * FROM orders WHERE id = $1 AND note = '{order_id}'"
+        record_slow_query(sql, (order_id,), False, 250.0)
+        return {"id": order_id}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.get("/orders/1")
+        await client.get("/orders/2")
+
+    report = await slow_queries.slow_query_report()
+    assert report["workers"] == [os.getpid()]
+    [row] = report["fingerprints"]
+    assert row["count"] == 2
+    assert row["routes"] == {"GET /orders/{order_id}": 2}
+    assert row["params"] == ["int"]
+    assert queue.qsize() == 1
+
+
+@pytest.mark.asyncio
+async def test_report_merges_worker_snapshots(tmp_path, monkeypatch):
+    """Отчёт любого воркера складывает снимки остальных; сброс очищает всех"""
+    monkeypatch.setattr(slow_queries, "SLOW_QUERY_DIR", str(tmp_path))
+    monkeypatch.setattr(slow_queries, "_explain_queue", None)
+    await slow_queries.reset_slow_queries()
+
+    fp = record_slow_query("SELECT * FROM products WHERE id = $1", (1,), False, 300.0)
+    other = {**fp.snapshot(), "count": 4, "total_ms": 1000.0, "max_ms": 900.0, "routes": {"GET /products/": 4}}
+    (tmp_path / "slow_queries_999999.json").write_text(json.dumps([other]))
+
+    report = await slow_queries.slow_query_report()
+    assert report["workers"] == sorted([os.getpid(), 999999])
+    [row] = report["fingerprints"]
+    assert (row["count"], row["total_ms"], row["max_ms"]) == (5, 1300.0, 900.0)
+    assert row["routes"] == {"GET /products/": 4, "<background>": 1}
+
+    await slow_queries.reset_slow_queries()
+    assert (await slow_queries.slow_query_report())["fingerprints"] == []
+    assert not (tmp_path / "slow_queries_999999.json").exists()
@@ -0,0 +1,127 @@
+"""
+Tests for per-request SQL statement budgets
+
+Число SQL-запросов эндпоинта берётся из Server-Timing (его ставит журнал
+запросов) и не должно расти вместе с числом строк в ответе.
+"""
+import logging
+import re
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from app.request_context import request_stats_var, sql_budget as route_sql_budget
+from app.request_logging import RequestLoggingMiddleware
+
+_SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+def _statements(response) -> int:
+    match = _SERVER_TIMING_DB.search(response.headers.get("server-timing", ""))
+    assert match, "response has no Server-Timing db entry"
+    return int(match.group(2))
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def sql_budget():
+    """
+    Проверка бюджета SQL-запросов эндпоинта:
+        count = sql_budget(response, 5)
+    """
+    def check(response, max_statements: int) -> int:
+        count = _statements(response)
+        assert count <= max_statements, (
+            f"{response.request.method} {response.request.url.path}: "
+            f"{count} SQL statements, budget {max_statements}"
+        )
+        return count
+    return check
+
+
+async def _add_qr_owners(db_session, start: int, count: int) -> None:
+    from app.models.models import Editor, QRCode, User
+
+    for i in range(start, start + count):
+        owner = User(email=f"qr{i}@example.com", username=f"qr{i}", hashed_password="x", role_id=1)
+        db_session.add(owner)
+        await db_session.flush()
+        editor = Editor(public_id=f"ed-budget-{i}", user_id=owner.id)
+        db_session.add(editor)
+        await db_session.flush()
+        db_session.add(QRCode(code=f"qr-budget-{i}", user_id=owner.id, editor_id=editor.id))
+    await db_session.commit()
+
+
+@pytest.mark.asyncio
+async def test_list_all_qrs_statements_do_not_grow_with_rows(client: AsyncClient, admin_headers, db_session, sql_budget):
+    """GET /qr/: без N+1 по редакторам и без каскада selectin через User"""
+    await _add_qr_owners(db_session, 0, 2)
+    response = await client.get("/qr/", headers=admin_headers)
+    assert response.status_code == 200
+    few = sql_budget(response, 15)
+    assert few > 0, "statements are not counted (install_db_stats missing on the engine?)"
+
+    await _add_qr_owners(db_session, 2, 8)
+    response = await client.get("/qr/", headers=admin_headers)
+    assert response.status_code == 200
+    assert len(response.json()) >= 10
+    assert sql_budget(response, 15) == few
+
+
+@pytest.mark.asyncio
+async def test_products_list_statements_do_not_grow_with_rows(client: AsyncClient, auth_headers, db_session, sql_budget):
+    """GET /products/: число запросов не зависит от числа товаров"""
+    from app.models.models import Product
+
+    db_session.add_all([Product(type="Футболка", size="M", color="Белый", price=1000) for _ in range(2)])
+    await db_session.commit()
+    few = _statements(await client.get("/products/", headers=auth_headers))
+    assert few > 0, "statements are not counted (install_db_stats missing on the engine?)"
+
+    db_session.add_all([Product(type="Худи", size="L", color="Чёрный", price=3000) for _ in range(10)])
+    await db_session.commit()
+    response = await client.get("/products/", headers=auth_headers)
+    assert response.status_code == 200
+    assert sql_budget(response, few) == few
+
+
+@pytest.mark.asyncio
+async def test_over_budget_route_logs_warning():
+    """Server-Timing отражает счётчики запроса, превышение бюджета — предупреждение в лог"""
+    collect = _Collect()
+    logger = logging.getLogger("test.sql_budget")
+    logger.handlers[:] = [collect]
+    logger.propagate = False
+
+    app = FastAPI()
+    app.add_middleware(RequestLoggingMiddleware, logger=logger)
+
+    @app.get("/items/{item_id}")
+    @route_sql_budget(2)
+    async def item(item_id: int):
+        # как будто эндпоинт сделал 3 запроса к БД
+        stats = request_stats_var.get()
+        stats.db_statements += 3
+        stats.db_time += 0.004
+        return {"id": item_id}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/items/1")
+
+    assert _statements(response) == 3
+    assert 'db;dur=4.0;desc="3 queries"' == response.headers["server-timing"]
+    warnings = [r for r in collect.records if r.levelno == logging.WARNING]
+    assert len(warnings) == 1
+    assert "/items/{item_id} made 3 statements (budget 2" in warnings[0].getMessage()
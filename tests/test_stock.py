@@ -0,0 +1,130 @@
+"""
+Tests for stock reservation
+
+Остаток списывается при создании заказа, не уходит в минус
+и возвращается при отмене заказа; админские правки позиций двигают его так же.
+"""
+import pytest
+from httpx import AsyncClient
+
+from app.delivery.fake_yandex import FakeYandexDelivery
+from app.delivery.yandex import use_transport
+
+
+@pytest.fixture
+async def limited_product(db_session):
+    from app.models.models import Product
+
+    product = Product(type="Футболка", size="M", color="Белый", price=1000, stock=3)
+    db_session.add(product)
+    await db_session.commit()
+    return product
+
+
+async def _stock(db_session, product_id: int):
+    from sqlalchemy import select
+    from app.models.models import Product
+
+    return await db_session.scalar(select(Product.stock).where(Product.id == product_id))
+
+
+@pytest.mark.asyncio
+async def test_order_reserves_stock_and_rejects_oversell(client: AsyncClient, auth_headers, limited_product, db_session, fake_yandex):
+    """Второй заказ сверх остатка получает 409, остаток не уходит в минус"""
+    first = await client.post(
+        "/orders",
+        json={"items": [{"product_id": limited_product.id, "quantity": 2}], "city": "Москва"},
+        headers=auth_headers,
+    )
+    assert first.status_code == 201
+    assert await _stock(db_session, limited_product.id) == 1
+
+    second = await client.post(
+        "/orders",
+        json={"items": [{"product_id": limited_product.id, "quantity": 2}], "city": "Москва"},
+        headers=auth_headers,
+    )
+    assert second.status_code == 409
+    assert second.json()["detail"]["product_ids"] == [limited_product.id]
+    assert await _stock(db_session, limited_product.id) == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_order_returns_stock(client: AsyncClient, auth_headers, limited_product, db_session):
+    """Если Яндекс не дал офферов, заказ отменяется и резерв возвращается"""
+    use_transport(FakeYandexDelivery(seed=1, no_offers_rate=1.0).transport())
+    try:
+        response = await client.post(
+            "/orders",
+            json={"items": [{"product_id": limited_product.id, "quantity": 3}], "city": "Москва"},
+            headers=auth_headers,
+        )
+    finally:
+        use_transport(None)
+
+    assert response.status_code == 201
+    assert response.json()["status"] == "cancelled"
+    assert await _stock(db_session, limited_product.id) == 3
+
+
+@pytest.mark.asyncio
+async def test_admin_item_edits_move_stock(
+    client: AsyncClient, auth_headers, admin_headers, limited_product, db_session, fake_yandex
+):
+    """Админ меняет количество в заказе: рост сверх остатка — 409, уменьшение и удаление возвращают остаток"""
+    order = (await client.post(
+        "/orders",
+        json={"items": [{"product_id": limited_product.id, "quantity": 2}], "city": "Москва"},
+        headers=auth_headers,
+    )).json()
+    item_path = f"/orders/{order['id']}/items/{order['items'][0]['id']}"
+    assert await _stock(db_session, limited_product.id) == 1
+
+    too_many = await client.patch(item_path, json={"quantity": 4}, headers=admin_headers)
+    assert too_many.status_code == 409
+    assert await _stock(db_session, limited_product.id) == 1
+
+    assert (await client.patch(item_path, json={"quantity": 3}, headers=admin_headers)).status_code == 200
+    assert await _stock(db_session, limited_product.id) == 0
+
+    assert (await client.patch(item_path, json={"quantity": 1}, headers=admin_headers)).status_code == 200
+    assert await _stock(db_session, limited_product.id) == 2
+
+    assert (await client.delete(item_path, headers=admin_headers)).status_code == 200
+    assert await _stock(db_session, limited_product.id) == 3
+
+
+@pytest.mark.asyncio
+async def test_status_changes_move_stock(
+    client: AsyncClient, auth_headers, admin_headers, limited_product, db_session, fake_yandex
+):
+    """Отменённый заказ снова оплачен — остаток списывается заново; оплаченный отменён — возвращается"""
+    order = (await client.post(
+        "/orders",
+        json={"items": [{"product_id": limited_product.id, "quantity": 2}], "city": "Москва"},
+        headers=auth_headers,
+    )).json()
+    meta_path = f"/orders/{order['id']}/meta"
+
+    async def set_status(status):
+        return await client.patch(meta_path, json={"status": status}, headers=admin_headers)
+
+    assert (await set_status("cancelled")).status_code == 200
+    assert await _stock(db_session, limited_product.id) == 3
+
+    assert (await set_status("paid")).status_code == 200
+    assert await _stock(db_session, limited_product.id) == 1
+    assert (await set_status("pending")).status_code == 400
+
+    assert (await set_status("cancelled")).status_code == 200
+    assert await _stock(db_session, limited_product.id) == 3
+
+    # остаток за это время раскупили — вернуть заказ в работу нельзя
+    other = await client.post(
+        "/orders",
+        json={"items": [{"product_id": limited_product.id, "quantity": 2}], "city": "Москва"},
+        headers=auth_headers,
+    )
+    assert other.status_code == 201
+    assert (await set_status("paid")).status_code == 409
+    assert await _stock(db_session, limited_product.id) == 1
@@ -0,0 +1,105 @@
+"""
+Tests for write-path statement counts
+
+Мутации не должны перечитывать объекты после записи: ответ собирается
+из identity map, commit — последний поход в БД.
+"""
+import pytest
+from httpx import AsyncClient
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+
+
+def _reads_after_first_write(statements):
+    """SELECT'ы, выполненные после первой записи в рамках запроса (advisory lock роллапов — не чтение)."""
+    normalized = [s.lstrip().upper() for s in statements]
+    first_write = next((i for i, s in enumerate(normalized) if s.startswith(WRITE_PREFIXES)), None)
+    assert first_write is not None, "request did not write anything"
+    return [s for s in normalized[first_write:] if s.startswith("SELECT") and "PG_ADVISORY_XACT_LOCK" not in s]
+
+
+@pytest.fixture
+async def products(db_session):
+    from app.models.models import Product
+
+    rows = [
+        Product(type="Футболка", size="M", color="Белый", price=1000),
+        Product(type="Худи", size="L", color="Чёрный", price=3000),
+    ]
+    db_session.add_all(rows)
+    await db_session.commit()
+    return rows
+
+
+@pytest.fixture
+async def order(client: AsyncClient, auth_headers, products, fake_yandex):
+    response = await client.post(
+        "/orders",
+        json={"items": [{"product_id": products[0].id, "quantity": 2}], "city": "Москва"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 201
+    return response.json()
+
+
+@pytest.mark.asyncio
+async def test_orders_create_no_refetch(client: AsyncClient, auth_headers, products, fake_yandex, sql_statements):
+    """POST /orders: после INSERT заказа никаких SELECT."""
+    sql_statements.clear()
+    response = await client.post(
+        "/orders",
+        json={"items": [{"product_id": p.id, "quantity": 1} for p in products]},
+        headers=auth_headers,
+    )
+    assert response.status_code == 201
+    assert len(response.json()["items"]) == 2
+    assert _reads_after_first_write(sql_statements) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method,path,payload", [
+    ("PATCH", "/orders/{order_id}/meta", {"status": "paid"}),
+    ("PATCH", "/orders/{order_id}/delivery", {"city": "Казань"}),
+    ("POST", "/orders/{order_id}/items", {"product_id": "{product_id}", "quantity": 1}),
+    ("PATCH", "/orders/{order_id}/items/{item_id}", {"quantity": 5}),
+    ("DELETE", "/orders/{order_id}/items/{item_id}", None),
+])
+async def test_order_admin_mutations_no_refetch(
+    client: AsyncClient, admin_headers, order, products, sql_statements, method, path, payload
+):
+    """Админские мутации заказа: ответ из identity map, без перечитывания."""
+    ids = {"order_id": order["id"], "item_id": order["items"][0]["id"], "product_id": products[1].id}
+    if payload and payload.get("product_id") == "{product_id}":
+        payload = {**payload, "product_id": ids["product_id"]}
+
+    sql_statements.clear()
+    response = await client.request(method, path.format(**ids), json=payload, headers=admin_headers)
+    assert response.status_code == 200
+    assert _reads_after_first_write(sql_statements) == []
+
+
+@pytest.mark.asyncio
+async def test_review_create_and_approve_no_refresh(client: AsyncClient, auth_headers, admin_headers, sql_statements):
+    """Отзывы: создание и одобрение без refresh после commit."""
+    sql_statements.clear()
+    response = await client.post(
+        "/reviews/", json={"stars": 5, "content": "Отличная футболка"}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["user"]["email"] == "test@example.com"
+    assert _reads_after_first_write(sql_statements) == []
+
+    sql_statements.clear()
+    response = await client.post(f"/reviews/{response.json()['id']}/approve", headers=admin_headers)
+    assert response.status_code == 200
+    assert _reads_after_first_write(sql_statements) == []
+
+
+@pytest.mark.asyncio
+async def test_product_update_no_refresh(client: AsyncClient, admin_headers, products, sql_statements):
+    """PATCH /products/{id}: без refresh после commit."""
+    sql_statements.clear()
+    response = await client.patch(f"/products/{products[0].id}", json={"price": 1200}, headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["price"] == 1200
+    assert _reads_after_first_write(sql_statements) == []